@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BibTeX数据库解析
+顺序扫描.bib文件的字节内容，为每个条目记录类型、键和字节范围，字段只在需要时才解析，
+几千条的数据库也可以很快建立 键 -> 条目 的索引。解析结果按文件mtime缓存在进程内
+（只保留最近使用的几个文件），清理时按字节范围一次性重写整个文件
+"""
+
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 条目开头，如 @article{key, 或 @book(key,
+_ENTRY_START_RE = re.compile(rb'@[ \t]*([A-Za-z]+)[ \t\r\n]*([{(])')
+_BRACE_RE = re.compile(rb'[{}]')
+_PAREN_RE = re.compile(rb'[{})]')
+_CROSSREF_RE = re.compile(rb'\bcrossref\s*=\s*[{"]\s*([^}"\s]+)\s*[}"]', re.IGNORECASE)
+_FIELD_RE = re.compile(rb'([A-Za-z][\w\-]*)\s*=\s*')
+
+# 不是文献条目的特殊块
+_SPECIAL_TYPES = {b"comment", b"preamble", b"string"}
+
+
+@dataclass
+class BibEntry:
+    """一个BibTeX条目，start/end为在文件中的字节范围（含结尾的换行）"""
+    entry_type: str
+    key: str
+    start: int
+    end: int
+
+
+class BibDatabase:
+    """一个.bib文件的条目索引"""
+
+    def __init__(self, path: str, data: bytes, entries: List[BibEntry]):
+        self.path = path
+        self.data = data
+        self.entries = entries
+        self.by_key: Dict[str, BibEntry] = {}
+        for entry in entries:
+            self.by_key.setdefault(entry.key, entry)
+
+    def keys(self) -> List[str]:
+        return list(self.by_key)
+
+    def raw(self, key: str) -> bytes:
+        entry = self.by_key[key]
+        return self.data[entry.start:entry.end]
+
+    def crossref(self, key: str) -> Optional[str]:
+        """条目的crossref目标（被引用条目依赖的父条目不能删除）"""
+        match = _CROSSREF_RE.search(self.raw(key))
+        return match.group(1).decode("utf-8", "replace") if match else None
+
+    def fields(self, key: str) -> Dict[str, str]:
+        """解析单个条目的字段"""
+        raw = self.raw(key)
+        body_start = raw.index(b",") + 1 if b"," in raw else len(raw)
+        fields = {}
+        pos = body_start
+        while True:
+            match = _FIELD_RE.search(raw, pos)
+            if match is None:
+                break
+            name = match.group(1).decode("ascii").lower()
+            value, pos = _read_value(raw, match.end())
+            fields[name] = value.decode("utf-8", "replace").strip()
+        return fields
+
+    def without(self, keys: Iterable[str]) -> Tuple[bytes, List[str]]:
+        """按字节范围去掉指定条目，返回(新内容, 实际删除的键)"""
+        keys = set(keys)
+        parts = []
+        removed = []
+        last = 0
+        for entry in self.entries:
+            if entry.key not in keys:
+                continue
+            parts.append(self.data[last:entry.start])
+            last = entry.end
+            removed.append(entry.key)
+        parts.append(self.data[last:])
+        return b"".join(parts), removed
+
+
+def _matching_close(data: bytes, pos: int, closer: bytes) -> int:
+    """从pos（开括号之后）开始找到对应的闭括号位置，找不到时返回文件末尾"""
+    depth = 0
+    pattern = _BRACE_RE if closer == b"}" else _PAREN_RE
+    for match in pattern.finditer(data, pos):
+        ch = match.group()
+        if ch == b"{":
+            depth += 1
+        elif ch == b"}":
+            if depth == 0:
+                if closer == b"}":
+                    return match.start()
+                continue
+            depth -= 1
+        elif ch == b")" and depth == 0:
+            return match.start()
+    return len(data)
+
+
+def _read_value(raw: bytes, pos: int) -> Tuple[bytes, int]:
+    """读取一个字段值（{...}、"..."或裸值），返回(值, 之后的位置)"""
+    n = len(raw)
+    if pos >= n:
+        return b"", n
+    if raw[pos:pos + 1] == b"{":
+        end = _matching_close(raw, pos + 1, b"}")
+        return raw[pos + 1:end], end + 1
+    if raw[pos:pos + 1] == b'"':
+        depth = 0
+        i = pos + 1
+        while i < n:
+            ch = raw[i:i + 1]
+            if ch == b"{":
+                depth += 1
+            elif ch == b"}":
+                depth -= 1
+            elif ch == b'"' and depth == 0:
+                return raw[pos + 1:i], i + 1
+            i += 1
+        return raw[pos + 1:], n
+    end = pos
+    while end < n and raw[end:end + 1] not in (b",", b"}", b")"):
+        end += 1
+    return raw[pos:end], end
+
+
+def parse_bibtex(data: bytes, path: str = "") -> BibDatabase:
+    """顺序扫描BibTeX内容，建立条目索引（不解析字段）"""
+    entries = []
+    pos = 0
+    n = len(data)
+    while True:
+        match = _ENTRY_START_RE.search(data, pos)
+        if match is None:
+            break
+        entry_type = match.group(1).lower()
+        closer = b"}" if match.group(2) == b"{" else b")"
+        close = _matching_close(data, match.end(), closer)
+        end = min(close + 1, n)
+        pos = end
+        if entry_type in _SPECIAL_TYPES:
+            continue
+
+        comma = data.find(b",", match.end(), close)
+        key_end = comma if comma != -1 else close
+        key = data[match.end():key_end].strip().decode("utf-8", "replace")
+        if not key:
+            continue
+
+        # 把条目后面紧跟的换行一起算进范围，删除后不留空行
+        while end < n and data[end:end + 1] in (b" ", b"\t"):
+            end += 1
+        if data[end:end + 2] == b"\r\n":
+            end += 2
+        elif data[end:end + 1] == b"\n":
+            end += 1
+        entries.append(BibEntry(entry_type.decode("ascii"), key, match.start(), end))
+    return BibDatabase(path, data, entries)
+
+
+# 进程内缓存：路径 -> (mtime, 大小, 数据库)；缓存的数据库带有整个文件的内容，只保留最近使用的几个
+MAX_CACHED_DATABASES = 8
+_database_cache: "OrderedDict[str, Tuple[float, int, BibDatabase]]" = OrderedDict()
+
+
+def load_bib_database(path: str) -> BibDatabase:
+    """读取并解析.bib文件，文件未修改时直接返回缓存的索引"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    cached = _database_cache.get(path)
+    if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+        _database_cache.move_to_end(path)
+        return cached[2]
+    with open(path, "rb") as f:
+        data = f.read()
+    database = parse_bibtex(data, path)
+    _database_cache[path] = (stat.st_mtime, stat.st_size, database)
+    _database_cache.move_to_end(path)
+    while len(_database_cache) > MAX_CACHED_DATABASES:
+        _database_cache.popitem(last=False)
+    return database
+
+
+def rewrite_without(database: BibDatabase, keys: Iterable[str]) -> List[str]:
+    """从.bib文件中删除指定条目，一次写回，返回删除的键"""
+    data, removed = database.without(keys)
+    if not removed:
+        return removed
+    tmp_path = database.path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, database.path)
+    _database_cache.pop(database.path, None)
+    return removed
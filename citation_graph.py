@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+引用关系图缓存
+把按DOI展开得到的引用边（citing -> cited）和节点元数据保存在SQLite文件中，
+并记录每个节点在哪个方向上已经展开过，重复展开时直接读取本地边，只请求新的节点。
+
+引用列表（references）在论文发表后基本不变，展开一次即可；
+被引列表（cited_by）会持续增长，超过 THESIS_CITATION_GRAPH_TTL 秒（默认30天）后重新获取。
+图文件默认与响应缓存放在同一目录（THESIS_REF_CACHE_DIR）下。
+"""
+
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from env_config import env_float
+
+GRAPH_FILE_NAME = "citation_graph.sqlite3"
+
+# 展开方向：references为该论文引用的文献，cited_by为引用该论文的文献
+DIRECTIONS = ("references", "cited_by")
+
+CITED_BY_TTL = 30 * 86400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    doi TEXT PRIMARY KEY,
+    title TEXT,
+    year INTEGER,
+    authors TEXT,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edges (
+    citing TEXT NOT NULL,
+    cited TEXT NOT NULL,
+    PRIMARY KEY (citing, cited)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_edges_cited ON edges(cited);
+CREATE TABLE IF NOT EXISTS expansions (
+    doi TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    expanded REAL NOT NULL,
+    PRIMARY KEY (doi, direction)
+);
+"""
+
+
+class CitationGraph:
+    """基于SQLite的持久化引用图"""
+
+    def __init__(self, path: str, cited_by_ttl: float = CITED_BY_TTL):
+        self.path = path
+        self.cited_by_ttl = cited_by_ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> "CitationGraph":
+        cache_dir = os.environ.get("THESIS_REF_CACHE_DIR") or os.path.join(
+            os.path.expanduser("~"), ".cache", "thesis_reference_manager")
+        ttl = env_float("THESIS_CITATION_GRAPH_TTL", CITED_BY_TTL)
+        return cls(os.path.join(cache_dir, GRAPH_FILE_NAME), ttl)
+
+    def add_node(self, doi: str, title: Optional[str] = None, year: Optional[int] = None,
+                 authors: Optional[List[str]] = None):
+        """写入节点元数据；已有的非空字段不会被空值覆盖"""
+        self._conn.execute(
+            "INSERT INTO nodes (doi, title, year, authors, updated) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(doi) DO UPDATE SET "
+            "title = COALESCE(excluded.title, title), year = COALESCE(excluded.year, year), "
+            "authors = COALESCE(excluded.authors, authors), updated = excluded.updated",
+            (doi, title or None, year, json.dumps(authors, ensure_ascii=False) if authors else None, time.time()))
+
+    def record_expansion(self, doi: str, direction: str, neighbours: Iterable[str]):
+        """保存一次展开得到的边，并标记该节点在这个方向上已展开"""
+        if direction == "references":
+            rows = [(doi, other) for other in neighbours if other != doi]
+        else:
+            rows = [(other, doi) for other in neighbours if other != doi]
+        self._conn.execute("INSERT OR IGNORE INTO nodes (doi, updated) VALUES (?, ?)", (doi, time.time()))
+        self._conn.executemany("INSERT OR IGNORE INTO nodes (doi, updated) VALUES (?, ?)",
+                               [(other, time.time()) for row in rows for other in row if other != doi])
+        self._conn.executemany("INSERT OR IGNORE INTO edges (citing, cited) VALUES (?, ?)", rows)
+        self._conn.execute("INSERT OR REPLACE INTO expansions (doi, direction, expanded) VALUES (?, ?, ?)",
+                           (doi, direction, time.time()))
+        self._conn.commit()
+
+    def is_expanded(self, doi: str, direction: str) -> bool:
+        """该节点在这个方向上是否已展开且未过期"""
+        row = self._conn.execute("SELECT expanded FROM expansions WHERE doi = ? AND direction = ?",
+                                 (doi, direction)).fetchone()
+        if row is None:
+            return False
+        return direction == "references" or time.time() - row[0] < self.cited_by_ttl
+
+    def neighbours(self, doi: str, direction: str) -> List[str]:
+        if direction == "references":
+            sql = "SELECT cited FROM edges WHERE citing = ? ORDER BY cited"
+        else:
+            sql = "SELECT citing FROM edges WHERE cited = ? ORDER BY citing"
+        return [row[0] for row in self._conn.execute(sql, (doi,))]
+
+    def nodes(self, dois: Iterable[str]) -> Dict[str, Dict]:
+        """按DOI读取节点元数据"""
+        dois = list(dois)
+        result = {}
+        for start in range(0, len(dois), 500):
+            chunk = dois[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for doi, title, year, authors in self._conn.execute(
+                    f"SELECT doi, title, year, authors FROM nodes WHERE doi IN ({placeholders})", chunk):
+                result[doi] = {'doi': doi, 'title': title, 'year': year,
+                               'authors': json.loads(authors) if authors else []}
+        return result
+
+    def subgraph_edges(self, dois: Iterable[str]) -> List[Tuple[str, str]]:
+        """两端都在给定节点集合中的边"""
+        members = set(dois)
+        edges = []
+        for doi in members:
+            for cited in self.neighbours(doi, "references"):
+                if cited in members:
+                    edges.append((doi, cited))
+        edges.sort()
+        return edges
+
+    def stats(self) -> Dict:
+        return {
+            'nodes': self._conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0],
+            'edges': self._conn.execute("SELECT COUNT(*) FROM edges").fetchone()[0],
+            'expanded': self._conn.execute("SELECT COUNT(*) FROM expansions").fetchone()[0],
+            'path': self.path,
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+_shared_graph: Optional[CitationGraph] = None
+
+
+def get_citation_graph() -> CitationGraph:
+    """获取进程内共享的引用图缓存"""
+    global _shared_graph
+    if _shared_graph is None:
+        _shared_graph = CitationGraph.from_env()
+    return _shared_graph
@@ -4,17 +4,18 @@
 Document Processing MCP Server
 
 Core Tools (5):
-1. extract_docx_images(docx_path, user_working_dir, output_dir="pictures")
+1. extract_docx_images(docx_path, user_working_dir, output_dir="pictures", dedupe=True)
 2. extract_docx_text(docx_path, user_working_dir, max_chars=50000) - 现在包含表格和Excel内容
 3. extract_docx_tables(docx_path, user_working_dir, include_excel=True) - 专门提取表格和Excel
-4. extract_zip_assets(zip_path, user_working_dir, output_dir="pictures")
-5. tag_exported_images(image_dir, user_working_dir, ocr_lang="chi_sim+eng")
+4. extract_zip_assets(zip_path, user_working_dir, output_dir="pictures", dedupe=True)
+5. tag_exported_images(image_dir, user_working_dir, ocr_lang="chi_sim+eng", workers=0, ocr_timeout=60, use_cache=True, skip_textless=True)
 
 新增功能:
 - 提取Word文档中的表格内容
 - 提取嵌入在Word文档中的Excel文件内容
 - 支持多工作表Excel文件
 - 表格数据以结构化格式返回
+- 图片按内容寻址保存：相同内容只保存一份，重复运行跳过已有文件，manifest.json记录每个来源条目对应的文件
 
 IMPORTANT FOR AI USAGE:
 - user_working_dir is REQUIRED for all tools
@@ -40,11 +41,17 @@ EXAMPLE USAGE:
 Requirements: 
 - pip install mcp python-docx pillow pytesseract pandas openpyxl
 - For OCR (optional): install Tesseract and language data (e.g., chi_sim)
+- For faster OCR (optional): pip install tesserocr to keep engines loaded (see OCR_BACKEND in ocr_engine.py)
+- For skipping text-free images and OCR preprocessing (optional): pip install numpy
 - For Excel support: pandas and openpyxl are required
 """
 
+import hashlib
 import io
+import json
 import os
+import tempfile
+import time
 import zipfile
 from pathlib import Path
 
@@ -57,11 +64,9 @@ try:
 except Exception:
     DOCX_AVAILABLE = False
 
-try:
-    import pytesseract
-    OCR_AVAILABLE = True
-except Exception:
-    OCR_AVAILABLE = False
+from ocr_cache import get_ocr_cache
+from ocr_engine import OCR_AVAILABLE, default_workers, ocr_backend, ocr_images, ocr_summary
+from ocr_preprocess import preprocess_enabled
 
 try:
     import pandas as pd
@@ -86,14 +91,106 @@ def _bytes_to_image_info(b: bytes):
         return {"format": "unknown", "width": None, "height": None}
 
 
-def _ocr_image(path: Path, lang: str = "eng"):
-    if not OCR_AVAILABLE:
-        return ""
+def _stream_image_info(f):
     try:
-        with Image.open(path) as img:
-            return pytesseract.image_to_string(img, lang=lang).strip()
+        with Image.open(f) as im:
+            return {"format": im.format, "width": im.width, "height": im.height}
     except Exception:
-        return ""
+        return {"format": "unknown", "width": None, "height": None}
+
+
+MANIFEST_NAME = "manifest.json"
+_COPY_CHUNK = 1024 * 1024
+# 小于该大小的条目在内存中缓冲，更大的条目缓冲到临时文件
+_SPOOL_LIMIT = 8 * 1024 * 1024
+
+
+def _source_name(path: Path, base_dir: Path) -> str:
+    """Manifest key prefix for an archive: its path relative to user_working_dir,
+    or the resolved absolute path when it lives outside it."""
+    resolved = path.resolve()
+    try:
+        return resolved.relative_to(base_dir.resolve()).as_posix()
+    except ValueError:
+        return resolved.as_posix()
+
+
+class _ContentStore:
+    """Content-addressed image store for the extractors.
+
+    Each entry is hashed while it is streamed out of the archive and saved as
+    <sha256 prefix><ext>, so identical images are stored once and blobs already
+    in output_dir are not written again. manifest.json maps every source entry
+    ("<archive path>:<member>", see _source_name) to its stored file and is
+    merged across runs.
+    """
+
+    def __init__(self, output_path: Path):
+        self.output_path = output_path
+        self.manifest_path = output_path / MANIFEST_NAME
+        self.entries = self._load_manifest()
+        self.files_by_hash = {e["sha256"]: e["file"] for e in self.entries.values() if "sha256" in e and "file" in e}
+        self.first_source = {}
+        self.counters = {"written": 0, "existing": 0, "duplicates": 0, "bytes_written": 0}
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return dict(json.load(f).get("entries", {}))
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def store(self, source: str, stream, ext: str) -> dict:
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.SpooledTemporaryFile(max_size=_SPOOL_LIMIT) as spool:
+            for chunk in iter(lambda: stream.read(_COPY_CHUNK), b""):
+                digest.update(chunk)
+                spool.write(chunk)
+                size += len(chunk)
+            sha = digest.hexdigest()
+            spool.seek(0)
+            info = _stream_image_info(spool)
+
+            name = self.files_by_hash.get(sha) or f"{sha[:16]}{ext.lower()}"
+            out_path = self.output_path / name
+            item = {"entry": source, "filename": str(out_path), "relative_path": name, "sha256": sha, "size": size}
+            if sha in self.first_source:
+                # 本次运行中已保存过相同内容
+                item.update(status="duplicate", duplicate_of=self.first_source[sha])
+                self.counters["duplicates"] += 1
+            elif out_path.exists() and out_path.stat().st_size == size:
+                # 之前的运行已保存，跳过写入
+                item["status"] = "existing"
+                self.counters["existing"] += 1
+            else:
+                spool.seek(0)
+                part_path = out_path.with_name(name + ".part")
+                with open(part_path, "wb") as f:
+                    for chunk in iter(lambda: spool.read(_COPY_CHUNK), b""):
+                        f.write(chunk)
+                os.replace(part_path, out_path)
+                item["status"] = "written"
+                self.counters["written"] += 1
+                self.counters["bytes_written"] += size
+
+        self.first_source.setdefault(sha, source)
+        self.files_by_hash.setdefault(sha, name)
+        self.entries[source] = {"file": name, "sha256": sha, "size": size}
+        return {**item, **info}
+
+    def write_manifest(self):
+        tmp_path = self.manifest_path.with_name(MANIFEST_NAME + ".part")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": dict(sorted(self.entries.items()))}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def summary(self) -> dict:
+        return {
+            "unique": len(self.first_source),
+            **self.counters,
+            "manifest": str(self.manifest_path),
+        }
 
 
 def _extract_docx_tables(docx_path: Path) -> list:
@@ -194,7 +291,8 @@ def _validate_path(path_str: str, expected_ext: str = None) -> dict:
 
 
 @mcp.tool()
-def extract_docx_images(docx_path: str, user_working_dir: str, output_dir: str = "pictures") -> dict:
+def extract_docx_images(docx_path: str, user_working_dir: str, output_dir: str = "pictures",
+                        dedupe: bool = True) -> dict:
     """Extract images from a .docx file into output_dir. Return list and meta.
     
     IMPORTANT: AI must ask user for their project directory before calling this tool.
@@ -203,6 +301,9 @@ def extract_docx_images(docx_path: str, user_working_dir: str, output_dir: str =
         docx_path: Path to the .docx file (relative to user_working_dir if not absolute)
         user_working_dir: User's working directory (REQUIRED - ask user for this)
         output_dir: Output directory for extracted images (default: "pictures")
+        dedupe: Store images by content hash, once per unique image, and record
+            every entry in output_dir/manifest.json (default: True). False keeps the
+            old docx_img_NNN naming.
     
     Returns:
         dict: Contains count, images list, and success status
@@ -236,11 +337,30 @@ def extract_docx_images(docx_path: str, user_working_dir: str, output_dir: str =
         _ensure_dir(output_path)
         
         saved = []
+        store = _ContentStore(output_path) if dedupe else None
+        # 同名文件可能位于不同子目录，manifest按相对路径区分来源
+        source = _source_name(dp, base_dir)
         with zipfile.ZipFile(dp, "r") as zf:
             names = [n for n in zf.namelist() if n.startswith("word/media/")]
             if not names:
                 return {"count": 0, "images": [], "message": "No images found in the document"}
             
+            if store:
+                # 按内容寻址保存，边读边计算哈希
+                for name in names:
+                    with zf.open(name) as stream:
+                        saved.append(store.store(f"{source}:{name}", stream, os.path.splitext(name)[1] or ".png"))
+                store.write_manifest()
+                summary = store.summary()
+                return {
+                    "count": len(saved),
+                    "images": saved,
+                    **summary,
+                    "output_directory": str(output_path),
+                    "success": True,
+                    "message": f"Extracted {len(saved)} images ({summary['unique']} unique, {summary['written']} written) to {output_path}"
+                }
+            
             for i, name in enumerate(names, 1):
                 data = zf.read(name)
                 info = _bytes_to_image_info(data)
@@ -431,7 +551,7 @@ def extract_docx_tables(docx_path: str, user_working_dir: str, include_excel: bo
 
 
 @mcp.tool()
-def extract_zip_assets(zip_path: str, user_working_dir: str, output_dir: str = "pictures") -> dict:
+def extract_zip_assets(zip_path: str, user_working_dir: str, output_dir: str = "pictures", dedupe: bool = True) -> dict:
     """
     Extract images from a .zip file. If the zip contains .docx files, also
     extract images from each docx found. Images are placed into output_dir.
@@ -442,6 +562,8 @@ def extract_zip_assets(zip_path: str, user_working_dir: str, output_dir: str = "
         zip_path: Path to the .zip file (relative to user_working_dir if not absolute)
         user_working_dir: User's working directory (REQUIRED - ask user for this)
         output_dir: Output directory for extracted images
+        dedupe: Store images by content hash, once per unique image, and record
+            every entry in output_dir/manifest.json (default: True)
     """
     try:
         # 确定基础目录
@@ -469,11 +591,19 @@ def extract_zip_assets(zip_path: str, user_working_dir: str, output_dir: str = "
 
         total = 0
         details = []
+        store = _ContentStore(out) if dedupe else None
+        source = _source_name(zp, base_dir)
         with zipfile.ZipFile(zp, "r") as zf:
             names = zf.namelist()
             # Direct image files in zip
             for n in names:
                 if n.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")):
+                    if store:
+                        with zf.open(n) as stream:
+                            item = store.store(f"{source}:{n}", stream, os.path.splitext(n)[1])
+                        total += 1
+                        details.append({"from": n, **item})
+                        continue
                     data = zf.read(n)
                     info = _bytes_to_image_info(data)
                     ext = os.path.splitext(n)[1]
@@ -492,6 +622,13 @@ def extract_zip_assets(zip_path: str, user_working_dir: str, output_dir: str = "
                         with zipfile.ZipFile(io.BytesIO(b), "r") as dzip:
                             media = [m for m in dzip.namelist() if m.startswith("word/media/")]
                             for m in media:
+                                if store:
+                                    with dzip.open(m) as stream:
+                                        item = store.store(f"{source}:{n}:{m}", stream,
+                                                           os.path.splitext(m)[1] or ".png")
+                                    total += 1
+                                    details.append({"from_docx": n, **item})
+                                    continue
                                 data = dzip.read(m)
                                 info = _bytes_to_image_info(data)
                                 ext = os.path.splitext(m)[1] or ".png"
@@ -504,9 +641,12 @@ def extract_zip_assets(zip_path: str, user_working_dir: str, output_dir: str = "
                     except Exception as e:
                         details.append({"docx_in_zip": n, "error": str(e)})
 
+        if store:
+            store.write_manifest()
         return {
             "count": total, 
             "images": details,
+            **(store.summary() if store else {}),
             "output_directory": str(out),
             "success": True,
             "message": f"Successfully extracted {total} images to {out}"
@@ -517,7 +657,9 @@ def extract_zip_assets(zip_path: str, user_working_dir: str, output_dir: str = "
 
 
 @mcp.tool()
-def tag_exported_images(image_dir: str, user_working_dir: str, ocr_lang: str = "chi_sim+eng") -> dict:
+def tag_exported_images(image_dir: str, user_working_dir: str, ocr_lang: str = "chi_sim+eng",
+                        workers: int = 0, ocr_timeout: float = 60, use_cache: bool = True,
+                        skip_textless: bool = True) -> dict:
     """Assign simple tags (format/size + OCR preview if available) to images in a directory.
     
     IMPORTANT: AI must ask user for their project directory before calling this tool.
@@ -526,6 +668,10 @@ def tag_exported_images(image_dir: str, user_working_dir: str, ocr_lang: str = "
         image_dir: Directory containing images to tag (relative to user_working_dir if not absolute)
         user_working_dir: User's working directory (REQUIRED - ask user for this)
         ocr_lang: OCR language code (default: "chi_sim+eng")
+        workers: Parallel OCR workers (default: 0 = OCR_WORKERS env or CPU count, 1 = serial)
+        ocr_timeout: Per-image OCR timeout in seconds (default: 60)
+        use_cache: Reuse OCR results for unchanged images from .ocr_cache.sqlite3 in user_working_dir (default: True)
+        skip_textless: Skip OCR for images that a quick check finds unlikely to contain text, e.g. photos (default: True)
     """
     try:
         # 确定基础目录
@@ -544,17 +690,31 @@ def tag_exported_images(image_dir: str, user_working_dir: str, ocr_lang: str = "
         if not p.is_dir():
             return {"error": f"Not a directory: {image_dir}", "suggestion": "Please provide a directory path instead of a file"}
         
+        files = [fn for fn in sorted(p.iterdir())
+                 if fn.is_file() and fn.suffix.lower() in [".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp"]]
+        
+        # OCR在线程池/进程池中并行执行，结果与files顺序一致；单张失败不影响其他图片
+        # 按图片内容缓存识别结果，未变化（包括重命名、复制）的图片不再重新识别
+        workers = workers or default_workers()
+        cache = get_ocr_cache(base_dir) if use_cache and OCR_AVAILABLE else None
+        ocr_seconds = 0.0
+        if OCR_AVAILABLE and files:
+            start = time.perf_counter()
+            # 先快速判断是否含文字，跳过照片等无文字图片；其余图片缩小、二值化、纠偏后再识别
+            ocr_results = ocr_images(files, lang=ocr_lang, workers=workers, timeout=ocr_timeout, cache=cache,
+                                     prefilter=skip_textless, preprocess=preprocess_enabled())
+            ocr_seconds = time.perf_counter() - start
+        else:
+            ocr_results = [None] * len(files)
+        
         items = []
-        for fn in sorted(p.iterdir()):
-            if not fn.is_file():
-                continue
-            if fn.suffix.lower() not in [".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp"]:
-                continue
+        ocr_failures = 0
+        for fn, ocr in zip(files, ocr_results):
             try:
                 with open(fn, "rb") as f:
                     b = f.read()
                 info = _bytes_to_image_info(b)
-                ocr_text = _ocr_image(fn, lang=ocr_lang) if OCR_AVAILABLE else ""
+                ocr_text = ocr.text if ocr else ""
                 tags = []
                 if info["format"]:
                     tags.append(info["format"].lower())
@@ -562,21 +722,38 @@ def tag_exported_images(image_dir: str, user_working_dir: str, ocr_lang: str = "
                     tags.append(f"{info['width']}x{info['height']}")
                 if ocr_text:
                     tags.append("ocr")
-                items.append({
+                item = {
                     "file": str(fn),
                     "format": info["format"],
                     "width": info["width"],
                     "height": info["height"],
                     "ocr_preview": (ocr_text[:160] + "…") if len(ocr_text) > 160 else ocr_text,
                     "tags": tags
-                })
+                }
+                if ocr and ocr.skipped:
+                    item["ocr_skipped"] = True
+                if ocr and ocr.text_score is not None:
+                    item["text_score"] = round(ocr.text_score, 3)
+                if ocr and not ocr.ok:
+                    item["ocr_error"] = ocr.error
+                    ocr_failures += 1
+                items.append(item)
             except Exception as e:
                 items.append({"file": str(fn), "error": str(e)})
         
+        summary = ocr_summary([ocr for ocr in ocr_results if ocr])
         return {
             "count": len(items), 
             "items": items, 
             "ocr_available": OCR_AVAILABLE,
+            "ocr_workers": workers,
+            "ocr_backend": ocr_backend() if OCR_AVAILABLE else None,
+            "ocr_seconds": round(ocr_seconds, 2),
+            "ocr_failures": ocr_failures,
+            "ocr_cached": sum(1 for ocr in ocr_results if ocr and ocr.cached),
+            "ocr_skipped": summary["skipped"],
+            "ocr_time_saved": summary["time_saved"],
+            "ocr_cache": cache.stats() if cache else None,
             "directory": str(p),
             "success": True,
             "message": f"Successfully processed {len(items)} images in {p}"
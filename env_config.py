@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读取数值型环境变量
+参考文献工具和图像工具的超时、限速、缓存大小等设置都通过环境变量调整，
+变量未设置或不是合法数字时一律使用默认值，不让一个写错的变量导致工具无法启动
+"""
+
+import os
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
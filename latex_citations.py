@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LaTeX引用索引
+一次扫描LaTeX源码，记录所有引用命令（\\cite、\\citep、\\citet、\\nocite等，含可选参数）的位置，
+以及thebibliography环境中每个\\bibitem的范围，供分析、清理、格式转换工具共用
+
+多文件论文会沿着\\input/\\include/\\subfile追踪章节文件，每个文件的索引按路径、mtime和内容哈希
+持久化在主文件旁的缓存中，只有修改过的章节才会重新扫描
+"""
+
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# natbib / biblatex 中所有以键列表为参数的引用命令
+CITE_COMMANDS = {
+    "cite", "citep", "citet", "citealp", "citealt", "citeauthor", "citeyear", "citeyearpar",
+    "citenum", "parencite", "textcite", "autocite", "footcite", "supercite", "smartcite",
+    "Cite", "Citep", "Citet", "Parencite", "Textcite", "Autocite", "nocite",
+}
+
+# 只输出编号的引用命令，可以安全地转换为上标
+NUMERIC_CITE_COMMANDS = {"cite", "citep", "citealp", "citenum", "parencite", "autocite", "supercite"}
+
+# 引入其它源文件的命令
+INCLUDE_COMMANDS = {"input", "include", "subfile"}
+
+# 指定.bib数据库的命令（BibTeX和biblatex）
+BIB_RESOURCE_COMMANDS = {"bibliography", "addbibresource"}
+
+# 持久化索引的文件名（放在主文件所在目录）
+INDEX_CACHE_NAME = ".citation_index_cache.json"
+# 索引格式变化时递增，旧缓存自动失效
+INDEX_CACHE_VERSION = 2
+
+# 一次匹配控制序列、转义字符或注释
+_TOKEN_RE = re.compile(r'\\([A-Za-z@]+\*?)|\\.|%[^\n]*', re.DOTALL)
+
+
+@dataclass
+class CiteOccurrence:
+    """一次引用命令的出现"""
+    command: str
+    keys: List[str]
+    start: int
+    end: int
+    options: List[str] = field(default_factory=list)
+
+    @property
+    def is_nocite(self) -> bool:
+        return self.command.rstrip("*") == "nocite"
+
+
+@dataclass
+class BibItem:
+    """thebibliography环境中的一个条目，范围从\\bibitem到下一个条目或环境结束"""
+    key: str
+    start: int
+    end: int
+
+
+@dataclass
+class CitationIndex:
+    """单个LaTeX源文件的引用索引"""
+    cites: List[CiteOccurrence] = field(default_factory=list)
+    bibitems: List[BibItem] = field(default_factory=list)
+    # (\\begin{thebibliography}起始位置, \\end{thebibliography}结束位置)
+    bibliography_spans: List[Tuple[int, int]] = field(default_factory=list)
+    # \\input/\\include引入的文件：(原样记录的文件名, 命令所在位置)
+    includes: List[Tuple[str, int]] = field(default_factory=list)
+    # \\bibliography{a,b}/\\addbibresource{refs.bib}指定的数据库（原样记录）
+    bib_resources: List[str] = field(default_factory=list)
+
+    def used_keys(self) -> List[str]:
+        """按首次出现顺序返回被引用的键（\\nocite{*}不计入）"""
+        seen: Dict[str, None] = {}
+        for cite in self.cites:
+            for key in cite.keys:
+                if key != "*":
+                    seen.setdefault(key, None)
+        return list(seen)
+
+    def defined_keys(self) -> List[str]:
+        seen: Dict[str, None] = {}
+        for item in self.bibitems:
+            seen.setdefault(item.key, None)
+        return list(seen)
+
+    def cites_all(self) -> bool:
+        """是否存在\\nocite{*}"""
+        return any(cite.is_nocite and "*" in cite.keys for cite in self.cites)
+
+    def unused_keys(self) -> List[str]:
+        if self.cites_all():
+            return []
+        used = set(self.used_keys())
+        return [key for key in self.defined_keys() if key not in used]
+
+    def undefined_keys(self) -> List[str]:
+        defined = set(self.defined_keys())
+        return [key for key in self.used_keys() if key not in defined]
+
+    @classmethod
+    def merge(cls, indexes: List["CitationIndex"]) -> "CitationIndex":
+        """合并多个文件的索引用于整体统计（合并后的偏移量不再对应具体文件）"""
+        merged = cls()
+        for index in indexes:
+            merged.cites.extend(index.cites)
+            merged.bibitems.extend(index.bibitems)
+            merged.bib_resources.extend(index.bib_resources)
+        return merged
+
+    def to_dict(self) -> Dict:
+        return {
+            "cites": [[c.command, c.keys, c.start, c.end, c.options] for c in self.cites],
+            "bibitems": [[b.key, b.start, b.end] for b in self.bibitems],
+            "bibliography_spans": [list(span) for span in self.bibliography_spans],
+            "includes": self.includes,
+            "bib_resources": self.bib_resources,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CitationIndex":
+        return cls(
+            cites=[CiteOccurrence(c[0], c[1], c[2], c[3], c[4]) for c in data["cites"]],
+            bibitems=[BibItem(b[0], b[1], b[2]) for b in data["bibitems"]],
+            bibliography_spans=[tuple(span) for span in data["bibliography_spans"]],
+            includes=[tuple(include) for include in data["includes"]],
+            bib_resources=data["bib_resources"],
+        )
+
+
+def _skip_space(text: str, pos: int) -> int:
+    n = len(text)
+    while pos < n and text[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def _read_group(text: str, pos: int, open_char: str, close_char: str) -> Optional[Tuple[str, int]]:
+    """读取从pos开始的一个括号分组（支持嵌套），返回(内容, 结束位置)"""
+    if pos >= len(text) or text[pos] != open_char:
+        return None
+    depth = 0
+    i = pos
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == open_char:
+            depth += 1
+        elif ch == close_char:
+            depth -= 1
+            if depth == 0:
+                return text[pos + 1:i], i + 1
+        i += 1
+    return None
+
+
+def build_citation_index(text: str) -> CitationIndex:
+    """一次扫描LaTeX源码，建立引用索引"""
+    index = CitationIndex()
+    open_items: List[BibItem] = []
+    bib_begin: Optional[int] = None
+
+    def close_open_items(end: int):
+        for item in open_items:
+            item.end = end
+        open_items.clear()
+
+    pos = 0
+    while True:
+        match = _TOKEN_RE.search(text, pos)
+        if match is None:
+            break
+        pos = match.end()
+        command = match.group(1)
+        if command is None:
+            # 注释或转义字符，直接跳过
+            continue
+
+        base = command.rstrip("*")
+        if base in CITE_COMMANDS:
+            options = []
+            cursor = _skip_space(text, pos)
+            # 最多两个可选参数，如 \cite[see][p.~3]{key}
+            while len(options) < 2:
+                group = _read_group(text, cursor, "[", "]")
+                if group is None:
+                    break
+                options.append(group[0])
+                cursor = _skip_space(text, group[1])
+            group = _read_group(text, cursor, "{", "}")
+            if group is None:
+                continue
+            keys = [key.strip() for key in group[0].split(",") if key.strip()]
+            index.cites.append(CiteOccurrence(command, keys, match.start(), group[1], options))
+            pos = group[1]
+
+        elif base == "bibitem":
+            cursor = _skip_space(text, pos)
+            label = _read_group(text, cursor, "[", "]")
+            if label is not None:
+                cursor = _skip_space(text, label[1])
+            group = _read_group(text, cursor, "{", "}")
+            if group is None:
+                continue
+            close_open_items(match.start())
+            item = BibItem(group[0].strip(), match.start(), len(text))
+            index.bibitems.append(item)
+            open_items.append(item)
+            pos = group[1]
+
+        elif base in INCLUDE_COMMANDS:
+            group = _read_group(text, _skip_space(text, pos), "{", "}")
+            if group is None:
+                continue
+            index.includes.append((group[0].strip(), match.start()))
+            pos = group[1]
+
+        elif base in BIB_RESOURCE_COMMANDS:
+            cursor = _skip_space(text, pos)
+            option = _read_group(text, cursor, "[", "]")
+            if option is not None:
+                cursor = _skip_space(text, option[1])
+            group = _read_group(text, cursor, "{", "}")
+            if group is None:
+                continue
+            index.bib_resources.extend(name.strip() for name in group[0].split(",") if name.strip())
+            pos = group[1]
+
+        elif base in ("begin", "end"):
+            group = _read_group(text, _skip_space(text, pos), "{", "}")
+            if group is None or group[0].strip() != "thebibliography":
+                continue
+            if base == "begin":
+                bib_begin = match.start()
+            else:
+                close_open_items(match.start())
+                index.bibliography_spans.append((bib_begin if bib_begin is not None else match.start(), group[1]))
+                bib_begin = None
+            pos = group[1]
+
+    return index
+
+
+def remove_bibitems(text: str, index: CitationIndex, keys) -> Tuple[str, List[str]]:
+    """按索引中的bibitem范围一次性删除指定条目，返回(新内容, 实际删除的键)"""
+    keys = set(keys)
+    parts = []
+    removed: Dict[str, None] = {}
+    last = 0
+    for item in index.bibitems:
+        if item.key not in keys:
+            continue
+        parts.append(text[last:item.start])
+        last = item.end
+        removed.setdefault(item.key, None)
+    parts.append(text[last:])
+    return "".join(parts), list(removed)
+
+
+@dataclass
+class ThesisFile:
+    """论文中的一个源文件及其引用索引"""
+    path: str
+    index: CitationIndex
+
+
+class CitationIndexCache:
+    """按路径持久化的文件索引缓存
+
+    mtime和大小都没变时直接复用；变了则读取文件比较内容哈希，哈希相同也复用，
+    只有内容真正改变的文件才重新扫描。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.scanned = 0
+        self.reused = 0
+        self._dirty = False
+        self._entries: Dict[str, Dict] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_CACHE_VERSION:
+                self._entries = data.get("files", {})
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get_index(self, path: str) -> CitationIndex:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self._entries.get(path)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            self.reused += 1
+            return CitationIndex.from_dict(entry["index"])
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        if entry and entry["hash"] == digest:
+            entry["mtime"] = stat.st_mtime
+            entry["size"] = stat.st_size
+            self._dirty = True
+            self.reused += 1
+            return CitationIndex.from_dict(entry["index"])
+
+        index = build_citation_index(raw.decode("utf-8"))
+        self._entries[path] = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": digest,
+            "index": index.to_dict(),
+        }
+        self._dirty = True
+        self.scanned += 1
+        return index
+
+    def update(self, path: str, text: str, index: Optional[CitationIndex] = None) -> CitationIndex:
+        """文件被工具改写后直接登记新内容的索引，下次不必重新扫描"""
+        path = os.path.abspath(path)
+        index = index or build_citation_index(text)
+        stat = os.stat(path)
+        self._entries[path] = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+            "index": index.to_dict(),
+        }
+        self._dirty = True
+        return index
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_CACHE_VERSION, "files": self._entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError:
+            # 缓存写不进去（如只读目录）不影响分析结果
+            pass
+
+
+def read_tex(path: str) -> str:
+    """读取源文件，保留原有的换行符（\r\n）
+
+    索引中的位置按原始字节解码后的文本计算，改写文件时必须使用同样的表示，
+    否则CRLF文件中每换一行位置就偏移一个字符。
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def write_tex(path: str, text: str):
+    """写回源文件，不转换换行符"""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+
+
+def open_index_cache(root_tex: str) -> CitationIndexCache:
+    """打开主文件对应的持久化索引缓存"""
+    base_dir = os.path.dirname(os.path.abspath(root_tex))
+    return CitationIndexCache(os.path.join(base_dir, INDEX_CACHE_NAME))
+
+
+def _resolve_include(name: str, base_dir: str) -> str:
+    path = name if os.path.isabs(name) else os.path.join(base_dir, name)
+    if not os.path.splitext(path)[1]:
+        path += ".tex"
+    return os.path.normpath(path)
+
+
+def load_thesis(root_tex: str, cache: Optional[CitationIndexCache] = None) -> Tuple[List[ThesisFile], List[str]]:
+    """从主文件开始沿\\input/\\include追踪所有章节文件
+
+    返回(按引入顺序排列的文件列表, 找不到的被引入文件)。相对路径按主文件所在目录解析，
+    与LaTeX在主文件目录下编译时的行为一致。
+    """
+    root_tex = os.path.abspath(root_tex)
+    base_dir = os.path.dirname(root_tex)
+    if cache is None:
+        cache = open_index_cache(root_tex)
+
+    files: List[ThesisFile] = []
+    missing: List[str] = []
+    visited = set()
+
+    def visit(path: str):
+        if path in visited:
+            return
+        visited.add(path)
+        index = cache.get_index(path)
+        files.append(ThesisFile(path, index))
+        for name, _ in index.includes:
+            child = _resolve_include(name, base_dir)
+            if os.path.exists(child):
+                visit(child)
+            else:
+                missing.append(name)
+
+    visit(root_tex)
+    return files, missing
+
+
+def document_order_cites(files: List[ThesisFile]) -> List[Tuple[str, CiteOccurrence]]:
+    """按排版顺序列出所有引用：章节文件中的引用出现在主文件\\input命令的位置"""
+    if not files:
+        return []
+    by_path = {f.path: f for f in files}
+    base_dir = os.path.dirname(files[0].path)
+    ordered: List[Tuple[str, CiteOccurrence]] = []
+    visited = set()
+
+    def walk(path: str):
+        if path in visited or path not in by_path:
+            return
+        visited.add(path)
+        index = by_path[path].index
+        includes = [(offset, _resolve_include(name, base_dir)) for name, offset in index.includes]
+        i = 0
+        for cite in index.cites:
+            while i < len(includes) and includes[i][0] < cite.start:
+                walk(includes[i][1])
+                i += 1
+            ordered.append((path, cite))
+        for _, child in includes[i:]:
+            walk(child)
+
+    walk(files[0].path)
+    return ordered
+
+
+def resolve_bib_resources(files: List[ThesisFile]) -> Tuple[List[str], List[str]]:
+    """解析论文引用的.bib数据库路径，返回(存在的文件, 找不到的名称)"""
+    if not files:
+        return [], []
+    base_dir = os.path.dirname(files[0].path)
+    found: Dict[str, None] = {}
+    missing: List[str] = []
+    for thesis_file in files:
+        for name in thesis_file.index.bib_resources:
+            path = name if os.path.isabs(name) else os.path.join(base_dir, name)
+            if not path.lower().endswith(".bib"):
+                path += ".bib"
+            path = os.path.normpath(path)
+            if os.path.exists(path):
+                found.setdefault(path, None)
+            else:
+                missing.append(name)
+    return list(found), missing
@@ -19,12 +19,10 @@ from typing import Dict, List, Optional
 from PIL import Image
 from mcp.server.fastmcp import FastMCP
 
-# 尝试导入OCR功能
-try:
-    import pytesseract
-    OCR_AVAILABLE = True
-except ImportError:
-    OCR_AVAILABLE = False
+# OCR功能（pytesseract不可用时OCR_AVAILABLE为False）
+from ocr_cache import get_ocr_cache
+from ocr_engine import OCR_AVAILABLE, default_timeout, ocr_images, ocr_summary
+from ocr_preprocess import preprocess_enabled
 
 # 初始化MCP服务器
 mcp = FastMCP("local-image-analyzer")
@@ -44,18 +42,14 @@ def _get_image_info(image_path: Path) -> Dict:
     except Exception as e:
         return {"error": f"Failed to get image info: {e}"}
 
-def _extract_text_with_ocr(image_path: Path) -> str:
-    """使用OCR提取图像中的文字"""
+def _extract_text_with_ocr(image_path: Path, cache=None, skip_textless: bool = True) -> str:
+    """使用OCR提取图像中的文字；cache为OCRCache时复用相同内容图片的识别结果"""
     if not OCR_AVAILABLE:
         return ""
     
-    try:
-        with Image.open(image_path) as img:
-            # 尝试中英文OCR
-            text = pytesseract.image_to_string(img, lang='chi_sim+eng').strip()
-            return text
-    except Exception:
-        return ""
+    # 尝试中英文OCR，识别失败时按无文字处理；判断为无文字的图片不识别
+    return ocr_images([image_path], lang='chi_sim+eng', workers=1, timeout=default_timeout(), cache=cache,
+                      prefilter=skip_textless, preprocess=preprocess_enabled())[0].text
 
 def _analyze_image_features(image_path: Path) -> Dict:
     """分析图像特征"""
@@ -196,8 +190,8 @@ def _extract_keywords(image_type: str, ocr_text: str, features: Dict) -> List[st
     
     return keywords
 
-def _analyze_image_comprehensive(image_path: Path, context: str = "") -> Dict:
-    """综合分析图像"""
+def _analyze_image_comprehensive(image_path: Path, context: str = "", ocr_text: Optional[str] = None) -> Dict:
+    """综合分析图像；ocr_text为None时在此处执行OCR（批量分析时已由OCR引擎并行识别）"""
     try:
         # 获取基本信息
         image_info = _get_image_info(image_path)
@@ -210,7 +204,8 @@ def _analyze_image_comprehensive(image_path: Path, context: str = "") -> Dict:
             return features
         
         # OCR文本提取
-        ocr_text = _extract_text_with_ocr(image_path)
+        if ocr_text is None:
+            ocr_text = _extract_text_with_ocr(image_path)
         
         # 图像类型分类
         image_type = _classify_image_type(features, ocr_text)
@@ -276,7 +271,8 @@ def analyze_single_image(image_path: str, user_working_dir: str, context: str =
             return {"error": f"Unsupported image format: {img_path.suffix}"}
         
         # 分析图像
-        analysis_result = _analyze_image_comprehensive(img_path, context)
+        ocr_text = _extract_text_with_ocr(img_path, get_ocr_cache(base_dir))
+        analysis_result = _analyze_image_comprehensive(img_path, context, ocr_text)
         
         if "error" in analysis_result:
             return analysis_result
@@ -298,8 +294,17 @@ def analyze_single_image(image_path: str, user_working_dir: str, context: str =
         return {"error": f"Failed to analyze image: {e}"}
 
 @mcp.tool()
-def batch_analyze_images(image_dir: str, user_working_dir: str, context: str = "") -> Dict:
-    """批量分析目录中的图像"""
+def batch_analyze_images(image_dir: str, user_working_dir: str, context: str = "", workers: int = 0,
+                         skip_textless: bool = True) -> Dict:
+    """批量分析目录中的图像
+    
+    Args:
+        image_dir: 图像目录
+        user_working_dir: 用户工作目录
+        context: 上下文信息
+        workers: 并行OCR数量（0表示使用OCR_WORKERS环境变量或CPU核数，1表示逐张识别）
+        skip_textless: 跳过快速判断为不含文字的图像（照片、无标注的图表等）
+    """
     try:
         # 路径处理
         base_dir = Path(user_working_dir)
@@ -319,17 +324,24 @@ def batch_analyze_images(image_dir: str, user_working_dir: str, context: str = "
         # 支持的图像格式
         supported_formats = [".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp"]
         
+        image_files = [img_file for img_file in sorted(dir_path.iterdir())
+                       if img_file.is_file() and img_file.suffix.lower() in supported_formats]
+        
+        # 先并行识别所有图像的文字，识别失败的图像按无文字处理
+        if OCR_AVAILABLE and image_files:
+            ocr_results = ocr_images(image_files, workers=workers or None, cache=get_ocr_cache(base_dir),
+                                     prefilter=skip_textless, preprocess=preprocess_enabled())
+        else:
+            ocr_results = []
+        ocr_texts = [result.text for result in ocr_results] or [""] * len(image_files)
+        summary = ocr_summary(ocr_results)
+        
         # 分析所有图像
         results = []
-        for img_file in sorted(dir_path.iterdir()):
-            if not img_file.is_file():
-                continue
-            if img_file.suffix.lower() not in supported_formats:
-                continue
-            
+        for img_file, ocr_text in zip(image_files, ocr_texts):
             try:
                 # 分析单个图像
-                analysis_result = _analyze_image_comprehensive(img_file, context)
+                analysis_result = _analyze_image_comprehensive(img_file, context, ocr_text)
                 image_info = _get_image_info(img_file)
                 
                 results.append({
@@ -355,6 +367,8 @@ def batch_analyze_images(image_dir: str, user_working_dir: str, context: str = "
             "successful_analyses": len([r for r in results if r.get("success", False)]),
             "results": results,
             "ocr_available": OCR_AVAILABLE,
+            "ocr_skipped": summary["skipped"],
+            "ocr_time_saved": summary["time_saved"],
             "message": f"Analyzed {len(results)} images in {dir_path}"
         }
         
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+OCR结果缓存
+按 图片内容哈希 + 识别语言 + OCR设置 保存识别出的文字，重复标注同一目录时不再调用tesseract；
+缓存键只与图片内容有关，重命名或复制到其他位置的图片同样命中。
+缓存文件默认放在用户工作目录下（.ocr_cache.sqlite3），按总大小做LRU淘汰。
+
+可通过环境变量调整:
+- OCR_CACHE            设为0时关闭缓存
+- OCR_CACHE_DIR        缓存目录，默认为用户工作目录
+- OCR_CACHE_MAX_MB     缓存总大小上限(MB)，默认50
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+
+from env_config import env_float
+
+OCR_CACHE_FILE_NAME = ".ocr_cache.sqlite3"
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_digest(path: Union[str, Path]) -> str:
+    """分块读取文件计算SHA-256，大图片也不会整体读入内存"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_ocr_key(content_hash: str, lang: str, settings: str = "") -> str:
+    """内容哈希、语言和OCR设置共同决定缓存键；任一项变化都会重新识别"""
+    raw = json.dumps([content_hash, lang, settings], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_enabled() -> bool:
+    return os.environ.get("OCR_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class OCRCache:
+    """基于SQLite的持久化OCR结果缓存"""
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ocr_results (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_results_accessed ON ocr_results(accessed)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_results").fetchone()[0]
+
+    @classmethod
+    def for_workspace(cls, workspace: Union[str, Path]) -> "OCRCache":
+        cache_dir = os.environ.get("OCR_CACHE_DIR") or str(workspace)
+        max_mb = env_float("OCR_CACHE_MAX_MB", 50)
+        return cls(os.path.join(cache_dir, OCR_CACHE_FILE_NAME), int(max_mb * 1024 * 1024))
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """批量读取，返回命中的 {key: text}；按每次查找计数，内容相同的多张图片分别计入命中"""
+        requested = list(keys)
+        keys = list(dict.fromkeys(requested))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(self._conn.execute(
+                    f"SELECT key, text FROM ocr_results WHERE key IN ({placeholders})", chunk).fetchall())
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE ocr_results SET accessed = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+            hits = sum(1 for key in requested if key in found)
+            self.counters["hits"] += hits
+            self.counters["misses"] += len(requested) - hits
+        return found
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, str]):
+        """在一个事务中写入多条识别结果"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            for key, text in items.items():
+                size = len(text.encode("utf-8")) + len(key)
+                old = self._conn.execute("SELECT size FROM ocr_results WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO ocr_results (key, text, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, text, size, now, now))
+                self._total_bytes += size - (old[0] if old else 0)
+            self._conn.commit()
+            self.counters["stores"] += len(items)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def put(self, key: str, text: str):
+        self.put_many({key: text})
+
+    def _evict(self):
+        """按最近访问时间淘汰条目，直到总大小降到上限的90%以下"""
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM ocr_results ORDER BY accessed ASC").fetchall()
+        victims = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            victims.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM ocr_results WHERE key = ?", victims)
+        self._conn.commit()
+        self.counters["evictions"] += len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM ocr_results")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict:
+        """返回命中统计和缓存占用"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM ocr_results").fetchone()[0]
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+            "entries": entries,
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "path": self.path,
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+_shared_caches: Dict[str, OCRCache] = {}
+
+
+def get_ocr_cache(workspace: Union[str, Path]) -> Optional[OCRCache]:
+    """获取工作目录对应的共享缓存；OCR_CACHE=0 时返回None"""
+    if not is_enabled():
+        return None
+    cache_dir = os.path.abspath(os.environ.get("OCR_CACHE_DIR") or str(workspace))
+    cache = _shared_caches.get(cache_dir)
+    if cache is None:
+        cache = _shared_caches[cache_dir] = OCRCache.for_workspace(cache_dir)
+    return cache
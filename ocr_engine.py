@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+OCR引擎
+docx_image_tagger 和 local_image_analyzer 共用的OCR入口：识别单张图片，
+以及用线程池/进程池并行识别一批图片。
+
+- 结果按输入顺序返回
+- 每张图片有独立的超时（交给tesseract在超时后结束进程；tesserocr和自定义识别函数由期限兜底，
+  逐张识别时也一样，卡住的调用留在后台线程中，不阻塞后续图片）
+- 单张图片失败（损坏、超时）只记录在该条结果中，不影响其他图片
+- 传入OCRCache时先按图片内容哈希查缓存，只识别未命中的图片（内容相同的图片只识别一次）
+- prefilter=True 时先用ocr_preprocess估计文字可能性，跳过照片、纯图表等没有文字的图片；
+  preprocess=True 时把图片缩小、二值化、纠偏后再交给tesseract（两者都需要numpy，没有时忽略）
+
+小图片的识别时间主要花在启动tesseract进程和加载traineddata上，因此提供三种后端:
+- tesserocr     安装了tesserocr时使用，引擎常驻在进程内，每种语言只加载一次，用完放回引擎池
+- batch         把一批图片路径写入列表文件，一次tesseract调用识别整批，输出按分页符切分；
+                某一批失败（损坏的图片、超时）时改为逐张识别，以隔离失败的图片
+- pytesseract   每张图片启动一个tesseract进程（原来的方式）
+
+可通过环境变量调整:
+- OCR_WORKERS    默认并行数，默认为CPU核数（最多8）
+- OCR_TIMEOUT    单张图片的超时（秒），默认60
+- OCR_EXECUTOR   thread 或 process，默认thread（tesseract在子进程中运行，线程池即可占满多核）
+- OCR_BACKEND    auto、tesserocr、batch 或 pytesseract，默认auto（有tesserocr时用tesserocr，否则用batch）
+- OCR_BATCH_SIZE batch后端每次tesseract调用最多识别的图片数，默认32
+"""
+
+import functools
+import math
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from PIL import Image
+
+from env_config import env_float, env_int
+from ocr_cache import OCRCache, file_digest, make_ocr_key
+from ocr_preprocess import (
+    NUMPY_AVAILABLE, preprocess_image, preprocess_settings, text_likelihood, text_threshold
+)
+
+try:
+    import pytesseract
+    PYTESSERACT_AVAILABLE = True
+except Exception:
+    PYTESSERACT_AVAILABLE = False
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except Exception:
+    TESSEROCR_AVAILABLE = False
+
+OCR_AVAILABLE = PYTESSERACT_AVAILABLE or TESSEROCR_AVAILABLE
+
+OCR_BACKENDS = ("auto", "tesserocr", "batch", "pytesseract")
+
+DEFAULT_LANG = "chi_sim+eng"
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_BATCH_SIZE = 32
+MAX_DEFAULT_WORKERS = 8
+
+# ocr_func(path, lang, timeout) -> text
+OCRFunc = Callable[[str, str, float], str]
+
+
+@dataclass
+class OCRResult:
+    """一张图片的识别结果；error不为空表示识别失败"""
+    path: str
+    text: str = ""
+    error: Optional[str] = None
+    elapsed: float = 0.0
+    cached: bool = False
+    skipped: bool = False
+    text_score: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def default_workers() -> int:
+    workers = env_int("OCR_WORKERS", 0)
+    if workers > 0:
+        return workers
+    return max(1, min(os.cpu_count() or 1, MAX_DEFAULT_WORKERS))
+
+
+def default_timeout() -> float:
+    return env_float("OCR_TIMEOUT", DEFAULT_TIMEOUT)
+
+
+def ocr_backend(backend: Optional[str] = None) -> str:
+    """解析要使用的OCR后端，auto按可用的依赖选择"""
+    backend = (backend or os.environ.get("OCR_BACKEND") or "auto").strip().lower()
+    if backend not in OCR_BACKENDS:
+        raise ValueError(f"不支持的OCR后端: {backend}，可选 {'、'.join(OCR_BACKENDS)}")
+    if backend == "auto":
+        if TESSEROCR_AVAILABLE:
+            return "tesserocr"
+        return "batch" if PYTESSERACT_AVAILABLE else "pytesseract"
+    return backend
+
+
+@functools.lru_cache(maxsize=None)
+def ocr_settings(backend: str = "pytesseract") -> str:
+    """参与缓存键的OCR设置；包含后端和tesseract版本，升级后旧的识别结果自动失效"""
+    version = ""
+    try:
+        if backend == "tesserocr" and TESSEROCR_AVAILABLE:
+            version = tesserocr.tesseract_version().split()[1]
+        elif PYTESSERACT_AVAILABLE:
+            version = str(pytesseract.get_tesseract_version())
+    except Exception:
+        pass
+    return f"{backend};tesseract={version}"
+
+
+def ocr_file(path: Union[str, Path], lang: str = DEFAULT_LANG, timeout: float = 0) -> str:
+    """识别单张图片，失败时抛出异常；timeout为0表示不限时"""
+    if not PYTESSERACT_AVAILABLE:
+        return ""
+    with Image.open(path) as img:
+        return pytesseract.image_to_string(img, lang=lang, timeout=timeout or 0).strip()
+
+
+class _EnginePool:
+    """常驻的tesserocr引擎，按语言缓存；并发识别时每个线程借用一个空闲引擎"""
+
+    def __init__(self):
+        self._idle: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def engine(self, lang: str):
+        with self._lock:
+            idle = self._idle.setdefault(lang, [])
+            api = idle.pop() if idle else None
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=lang)
+        try:
+            yield api
+        finally:
+            with self._lock:
+                self._idle[lang].append(api)
+
+
+_engines = _EnginePool()
+
+
+def tesserocr_file(path: Union[str, Path], lang: str = DEFAULT_LANG, timeout: float = 0) -> str:
+    """用引擎池中的tesserocr引擎识别单张图片（tesserocr不支持超时，由_run_batch的期限兜底）"""
+    with Image.open(path) as img, _engines.engine(lang) as api:
+        api.SetImage(img)
+        return api.GetUTF8Text().strip()
+
+
+def split_pages(output: str, count: int) -> List[str]:
+    """按分页符切分tesseract的输出；不同版本在每页之后或页与页之间写分页符，两种都接受"""
+    pages = output.split("\f")
+    if len(pages) == count + 1 and not pages[-1].strip():
+        pages.pop()
+    if len(pages) != count:
+        raise RuntimeError(f"tesseract输出 {len(pages)} 页，预期 {count} 页")
+    return [page.strip() for page in pages]
+
+
+def tesseract_file_list(paths: Sequence[str], lang: str = DEFAULT_LANG, timeout: float = 0) -> List[str]:
+    """一次tesseract调用识别多张图片，返回与paths顺序一致的文字；失败或超时抛出异常"""
+    command = pytesseract.pytesseract.tesseract_cmd if PYTESSERACT_AVAILABLE else "tesseract"
+    with tempfile.TemporaryDirectory() as tmp:
+        list_path = os.path.join(tmp, "images.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            f.write("".join(os.path.abspath(path) + "\n" for path in paths))
+        # subprocess.run在超时后会结束tesseract进程
+        proc = subprocess.run([command, list_path, "stdout", "-l", lang],
+                              capture_output=True, timeout=timeout or None)
+    if proc.returncode != 0:
+        message = proc.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise RuntimeError(f"tesseract exited with {proc.returncode}: {message[-1] if message else ''}")
+    return split_pages(proc.stdout.decode("utf-8", "replace"), len(paths))
+
+
+def _run_one(ocr_func: OCRFunc, path: str, lang: str, timeout: float) -> OCRResult:
+    start = time.perf_counter()
+    try:
+        text = ocr_func(path, lang, timeout)
+    except Exception as e:
+        # pytesseract超时后抛出 RuntimeError("Tesseract process timeout")
+        error = "timeout" if "timeout" in str(e).lower() else f"{type(e).__name__}: {e}"
+        return OCRResult(path, error=error, elapsed=time.perf_counter() - start)
+    return OCRResult(path, text=text or "", elapsed=time.perf_counter() - start)
+
+
+def _run_with_deadline(ocr_func: OCRFunc, path: str, lang: str, timeout: float) -> OCRResult:
+    """在单独的线程中识别一张图片，到期（与整批期限一样为两倍超时）仍未完成时记为超时"""
+    pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        return pool.submit(_run_one, ocr_func, path, lang, timeout).result(timeout=timeout * 2)
+    except FutureTimeout:
+        return OCRResult(path, error="timeout")
+    finally:
+        pool.shutdown(wait=False)
+
+
+def ocr_images(paths: Sequence[Union[str, Path]], lang: str = DEFAULT_LANG, workers: Optional[int] = None,
+               timeout: Optional[float] = None, executor: Optional[str] = None,
+               ocr_func: Optional[OCRFunc] = None, cache: Optional[OCRCache] = None,
+               settings: Optional[str] = None, backend: Optional[str] = None, prefilter: bool = False,
+               preprocess: bool = False, threshold: Optional[float] = None) -> List[OCRResult]:
+    """并行识别一批图片，按输入顺序返回OCRResult
+
+    ocr_func为空时按backend（默认OCR_BACKEND环境变量）选择后端，传入ocr_func时逐张调用它。
+    cache不为空时按 内容哈希 + lang + settings 查找缓存，命中的结果cached=True；
+    settings默认取ocr_settings(后端)加上前处理参数。识别失败的图片不写入缓存，下次重新识别。
+    prefilter为True时文字得分低于threshold（默认OCR_TEXT_THRESHOLD）的图片不识别，结果skipped=True。
+    没有安装numpy时prefilter和preprocess不起作用，所有图片按原图识别。
+    """
+    paths = [str(path) for path in paths]
+    prefilter = prefilter and NUMPY_AVAILABLE
+    preprocess = preprocess and NUMPY_AVAILABLE
+    backend = ocr_backend(backend)
+    threshold = text_threshold() if threshold is None else threshold
+    results: List[Optional[OCRResult]] = [None] * len(paths)
+    keys: Dict[int, str] = {}
+    if cache is not None:
+        if settings is None:
+            settings = ocr_settings(backend)
+            if prefilter:
+                settings += f";prefilter={threshold}"
+            if preprocess:
+                settings += ";" + preprocess_settings()
+        for index, path in enumerate(paths):
+            try:
+                keys[index] = make_ocr_key(file_digest(path), lang, settings)
+            except OSError:
+                # 无法读取的文件交给识别函数报告错误
+                pass
+        hits = cache.get_many(keys.values())
+        for index, key in keys.items():
+            if key in hits:
+                results[index] = OCRResult(paths[index], text=hits[key], cached=True)
+
+    # 内容相同的图片只识别第一张
+    pending: List[int] = []
+    first_by_key: Dict[str, int] = {}
+    duplicates: Dict[int, int] = {}
+    for index, result in enumerate(results):
+        if result is not None:
+            continue
+        key = keys.get(index)
+        if key is not None and key in first_by_key:
+            duplicates[index] = first_by_key[key]
+            continue
+        if key is not None:
+            first_by_key[key] = index
+        pending.append(index)
+
+    pending_paths = [paths[index] for index in pending]
+    if prefilter or preprocess:
+        batch = _prepare_and_recognize(pending_paths, lang, workers, timeout, executor, ocr_func, backend,
+                                       prefilter, preprocess, threshold)
+    else:
+        batch = _recognize(pending_paths, lang, workers, timeout, executor, ocr_func, backend)
+    for index, result in zip(pending, batch):
+        results[index] = result
+    for index, first in duplicates.items():
+        results[index] = OCRResult(paths[index], text=results[first].text, error=results[first].error,
+                                   skipped=results[first].skipped, text_score=results[first].text_score)
+
+    if cache is not None:
+        cache.put_many({keys[index]: results[index].text for index in pending
+                        if index in keys and results[index].ok})
+    return results
+
+
+def ocr_summary(results: Sequence[OCRResult]) -> Dict:
+    """统计跳过的图片数，并按本批实际识别的平均耗时估计节省的时间（秒）"""
+    recognized = [r.elapsed for r in results if r.ok and not r.cached and not r.skipped]
+    skipped = sum(1 for r in results if r.skipped)
+    average = sum(recognized) / len(recognized) if recognized else 0.0
+    return {"skipped": skipped, "time_saved": round(skipped * average, 2)}
+
+
+def _recognize(paths: List[str], lang: str, workers: Optional[int], timeout: Optional[float],
+               executor: Optional[str], ocr_func: Optional[OCRFunc], backend: str) -> List[OCRResult]:
+    """按后端识别一批图片"""
+    if ocr_func is None and backend == "batch" and len(paths) > 1:
+        return _run_file_lists(paths, lang, workers, timeout)
+    ocr_func = ocr_func or (tesserocr_file if backend == "tesserocr" else ocr_file)
+    return _run_batch(paths, lang, workers, timeout, executor, ocr_func)
+
+
+def _prepare(index: int, path: str, prefilter: bool, preprocess: bool, threshold: float,
+             workdir: str) -> Tuple[Optional[str], Optional[float], float]:
+    """返回 (交给OCR的文件, 文字得分, 耗时)；文件为None表示跳过识别"""
+    start = time.perf_counter()
+    try:
+        with Image.open(path) as img:
+            img.load()
+            score = text_likelihood(img)["score"] if prefilter else None
+            if score is not None and score < threshold:
+                return None, score, time.perf_counter() - start
+            if not preprocess:
+                return path, score, time.perf_counter() - start
+            # 保留原文件名，识别函数和错误信息仍能对应到原图
+            target_dir = os.path.join(workdir, str(index))
+            os.makedirs(target_dir)
+            target = os.path.join(target_dir, os.path.basename(path))
+            preprocess_image(img).save(target, format="PNG")
+            return target, score, time.perf_counter() - start
+    except Exception:
+        # 无法读取的图片按原样交给OCR后端，由后端报告错误
+        return path, None, time.perf_counter() - start
+
+
+def _prepare_and_recognize(paths: List[str], lang: str, workers: Optional[int], timeout: Optional[float],
+                           executor: Optional[str], ocr_func: Optional[OCRFunc], backend: str,
+                           prefilter: bool, preprocess: bool, threshold: float) -> List[OCRResult]:
+    """并行完成文字判断和前处理，只识别需要识别的图片，结果的path仍为原图路径"""
+    workers = max(1, int(workers or default_workers()))
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare = functools.partial(_prepare, prefilter=prefilter, preprocess=preprocess,
+                                    threshold=threshold, workdir=workdir)
+        if workers > 1 and len(paths) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+                prepared = list(pool.map(prepare, range(len(paths)), paths))
+        else:
+            prepared = [prepare(index, path) for index, path in enumerate(paths)]
+        selected = [index for index, (target, _, _) in enumerate(prepared) if target is not None]
+        recognized = _recognize([prepared[index][0] for index in selected], lang, workers, timeout,
+                                executor, ocr_func, backend)
+
+    results = []
+    by_index = dict(zip(selected, recognized))
+    for index, (path, (target, score, elapsed)) in enumerate(zip(paths, prepared)):
+        if target is None:
+            results.append(OCRResult(path, elapsed=elapsed, skipped=True, text_score=score))
+            continue
+        result = by_index[index]
+        results.append(OCRResult(path, text=result.text, error=result.error, elapsed=result.elapsed + elapsed,
+                                 text_score=score))
+    return results
+
+
+def _run_file_lists(paths: List[str], lang: str, workers: Optional[int], timeout: Optional[float]) -> List[OCRResult]:
+    """batch后端：把图片分成若干批，每批一次tesseract调用，各批并行"""
+    workers = max(1, int(workers or default_workers()))
+    timeout = default_timeout() if timeout is None else max(0.0, float(timeout))
+    batch_size = max(1, env_int("OCR_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+    size = min(batch_size, math.ceil(len(paths) / workers))
+    chunks = [paths[start:start + size] for start in range(0, len(paths), size)]
+
+    def run_chunk(chunk: List[str]) -> List[OCRResult]:
+        start = time.perf_counter()
+        try:
+            texts = tesseract_file_list(chunk, lang, timeout * len(chunk))
+        except Exception:
+            # 整批失败时逐张识别，只有出问题的图片带error
+            return _run_batch(chunk, lang, 1, timeout, None, ocr_file)
+        elapsed = (time.perf_counter() - start) / len(chunk)
+        return [OCRResult(path, text=text, elapsed=elapsed) for path, text in zip(chunk, texts)]
+
+    if len(chunks) == 1:
+        return run_chunk(chunks[0])
+    with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        return [result for results in pool.map(run_chunk, chunks) for result in results]
+
+
+def _run_batch(paths: List[str], lang: str, workers: Optional[int], timeout: Optional[float],
+               executor: Optional[str], ocr_func: OCRFunc) -> List[OCRResult]:
+    """在线程池/进程池中识别，workers为1时逐张识别
+
+    使用线程池时无法强行结束卡住的调用，因此另外按 每张超时 × 轮数 给整批设一个期限，
+    到期仍未完成的图片记为超时并直接返回。逐张识别时每张图片在单独的线程中运行并有各自的期限，
+    只有不限时（timeout为0）时才在当前线程中调用。
+    """
+    workers = max(1, int(workers or default_workers()))
+    timeout = default_timeout() if timeout is None else max(0.0, float(timeout))
+    if workers == 1 or len(paths) <= 1:
+        if not timeout:
+            return [_run_one(ocr_func, path, lang, timeout) for path in paths]
+        return [_run_with_deadline(ocr_func, path, lang, timeout) for path in paths]
+
+    executor = (executor or os.environ.get("OCR_EXECUTOR") or "thread").lower()
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    workers = min(workers, len(paths))
+    pool = pool_class(max_workers=workers)
+    try:
+        futures = [pool.submit(_run_one, ocr_func, path, lang, timeout) for path in paths]
+        deadline = timeout * (math.ceil(len(paths) / workers) + 1) if timeout else None
+        done, _ = wait(futures, timeout=deadline)
+        results = []
+        for path, future in zip(paths, futures):
+            if future not in done:
+                future.cancel()
+                results.append(OCRResult(path, error="timeout"))
+                continue
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # 进程池中的工作进程崩溃等情况
+                results.append(OCRResult(path, error=f"{type(e).__name__}: {e}"))
+        return results
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
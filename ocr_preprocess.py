@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+OCR前处理
+在调用tesseract之前用NumPy对缩小的灰度图做快速判断：
+- text_likelihood  估计图片含有文字的可能性，照片、纯色块、无标注的图表得分很低，可以直接跳过OCR
+- preprocess_image 对需要识别的图片做 缩小 → Otsu二值化 → 纠偏，让tesseract处理更小、更干净的输入
+
+判断依据是文字行的特征：二值化后，含文字的行在水平方向上有很多次前景/背景切换，
+且每段前景（笔画）相对字号都很窄；照片的明暗块和图表中的色块、粗线条不满足这两点。
+笔画宽度的上限随所在文字行的高度放大，标题、海报等大字号文字不会被当成色块。
+
+可通过环境变量调整:
+- OCR_TEXT_THRESHOLD  文字行占比低于该值时跳过OCR，默认0.01（只有一行小标注的图表约为0.02）
+- OCR_PREPROCESS      设为0时不做二值化和纠偏，直接识别原图
+- OCR_MAX_SIDE        识别前把长边缩小到该尺寸以内，默认2000
+
+需要numpy；没有安装numpy时NUMPY_AVAILABLE为False，OCR引擎不做判断和前处理，直接识别原图。
+"""
+
+import os
+from typing import Dict, Optional
+
+from PIL import Image
+
+from env_config import env_float
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+DETECT_SIDE = 512
+DEFAULT_TEXT_THRESHOLD = 0.01
+DEFAULT_MAX_SIDE = 2000
+
+# 前景与背景的平均灰度差低于该值视为没有可识别的对比度
+MIN_CONTRAST = 40
+# 一行中至少有这么多次切换（约两个笔画）才可能是文字行
+MIN_ROW_TRANSITIONS = 4
+# 检测尺寸下笔画的最大平均宽度（像素），更宽的是色块或粗线
+MAX_STROKE_WIDTH = 6.0
+# 大字号时笔画宽度上限按行高放大：笔画不超过行高的该比例（粗体约0.2）
+MAX_STROKE_TO_LINE = 0.25
+# 高度超过图片该比例的连续候选行不按一行文字放大上限（图表的柱子、照片）
+MAX_LINE_FRACTION = 0.5
+
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+
+
+def text_threshold() -> float:
+    return env_float("OCR_TEXT_THRESHOLD", DEFAULT_TEXT_THRESHOLD)
+
+
+def preprocess_enabled() -> bool:
+    if not NUMPY_AVAILABLE:
+        return False
+    return os.environ.get("OCR_PREPROCESS", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def preprocess_settings() -> str:
+    """前处理参数，参与OCR缓存键"""
+    return f"max_side={int(env_float('OCR_MAX_SIDE', DEFAULT_MAX_SIDE))};otsu;deskew"
+
+
+def _grayscale(img: Image.Image) -> Image.Image:
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        # 透明背景按白色处理，否则透明区域会变成黑色
+        background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        background.alpha_composite(img.convert("RGBA"))
+        img = background
+    return img.convert("L")
+
+
+def _downscale(img: Image.Image, max_side: int) -> Image.Image:
+    if max(img.size) <= max_side:
+        return img
+    scale = max_side / max(img.size)
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.BILINEAR)
+
+
+def otsu_threshold(gray: "np.ndarray") -> int:
+    """Otsu阈值：使前景和背景的类间方差最大的灰度"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between)) + 1
+
+
+def _foreground(gray: "np.ndarray") -> Optional["np.ndarray"]:
+    """二值化并取占少数的一类为前景（深色文字或反色文字）；对比度不足时返回None"""
+    threshold = otsu_threshold(gray)
+    fg = gray < threshold
+    if fg.mean() > 0.5:
+        fg = ~fg
+    if not fg.any() or fg.all():
+        return None
+    if abs(float(gray[fg].mean()) - float(gray[~fg].mean())) < MIN_CONTRAST:
+        return None
+    return fg
+
+
+def _stroke_limits(candidates: "np.ndarray") -> "np.ndarray":
+    """每行允许的最大笔画宽度：连续的候选行视为一行文字，上限随其高度放大"""
+    edges = np.diff(np.concatenate(([0], candidates.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    line_height = np.zeros(len(candidates))
+    for start, end in zip(starts, ends):
+        if end - start <= MAX_LINE_FRACTION * len(candidates):
+            line_height[start:end] = end - start
+    return np.maximum(MAX_STROKE_WIDTH, MAX_STROKE_TO_LINE * line_height)
+
+
+def text_likelihood(img: Image.Image) -> Dict:
+    """返回 {"score": 文字行占比, "edge_density": 切换点密度}，score在0到1之间"""
+    gray = np.asarray(_downscale(_grayscale(img), DETECT_SIDE), dtype=np.uint8)
+    if gray.ndim != 2 or min(gray.shape) < 2:
+        return {"score": 0.0, "edge_density": 0.0}
+    fg = _foreground(gray)
+    if fg is None:
+        return {"score": 0.0, "edge_density": 0.0}
+
+    transitions = (fg[:, 1:] != fg[:, :-1]).sum(axis=1)
+    # 每行前景段的个数和平均宽度
+    runs = (fg[:, 1:] & ~fg[:, :-1]).sum(axis=1) + fg[:, 0]
+    stroke_width = fg.sum(axis=1) / np.maximum(runs, 1)
+    candidates = transitions >= MIN_ROW_TRANSITIONS
+    text_rows = candidates & (stroke_width <= _stroke_limits(candidates))
+    return {
+        "score": float(text_rows.mean()),
+        "edge_density": float(transitions.sum() / fg.size),
+    }
+
+
+def estimate_skew(binary: "np.ndarray") -> float:
+    """投影法估计倾斜角：文字行对齐时，各行前景数的方差最大"""
+    img = Image.fromarray((binary * 255).astype(np.uint8))
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + DESKEW_STEP / 2, DESKEW_STEP):
+        rotated = np.asarray(img.rotate(float(angle), resample=Image.NEAREST, fillcolor=0))
+        profile = rotated.sum(axis=1, dtype=np.float64)
+        score = float(np.var(profile))
+        if score > best_score + 1e-9 or (abs(score - best_score) <= 1e-9 and abs(angle) < abs(best_angle)):
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def preprocess_image(img: Image.Image, max_side: Optional[int] = None) -> Image.Image:
+    """缩小、Otsu二值化并纠偏，返回黑字白底的二值图（mode "L"）"""
+    max_side = max_side or int(env_float("OCR_MAX_SIDE", DEFAULT_MAX_SIDE))
+    gray = _downscale(_grayscale(img), max_side)
+    pixels = np.asarray(gray, dtype=np.uint8)
+    fg = _foreground(pixels)
+    if fg is None:
+        return gray
+    # 在检测尺寸上估计倾斜角，再旋转原尺寸的二值图
+    small = np.asarray(_downscale(Image.fromarray(fg.astype(np.uint8) * 255), DETECT_SIDE)) > 127
+    angle = estimate_skew(small)
+    binary = Image.fromarray(np.where(fg, 0, 255).astype(np.uint8))
+    if angle:
+        binary = binary.rotate(angle, resample=Image.NEAREST, expand=True, fillcolor=255)
+    return binary
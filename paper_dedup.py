@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+论文近似重复检测
+同一篇论文常以arXiv预印本、Crossref DOI记录等不同形式出现，标题大小写、标点、
+LaTeX标记也各不相同。这里对标题做规范化后取字符3-gram，用MinHash签名估计相似度，
+再按LSH分桶只与同桶的候选比较，新增论文不需要和整个论文库逐一比对
+"""
+
+import re
+import unicodedata
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# 12段x5行：相似度0.8的两条记录至少落入同一个桶的概率约99%，0.5时约32%
+SIGNATURE_SIZE = 60
+LSH_BANDS = 12
+LSH_ROWS = SIGNATURE_SIZE // LSH_BANDS
+
+# 标题估计相似度达到该值视为同一篇；缺少作者信息时要求更高
+TITLE_THRESHOLD = 0.8
+TITLE_ONLY_THRESHOLD = 0.9
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 固定种子生成的哈希参数，签名在不同进程间保持一致（可以持久化到论文库）
+def _hash_params(count: int) -> List[Tuple[int, int]]:
+    params = []
+    state = 0x9E3779B97F4A7C15
+    for _ in range(count):
+        state = (state * 6364136223846793005 + 1442695040888963407) & ((1 << 64) - 1)
+        a = (state >> 3) % (_MERSENNE_PRIME - 1) + 1
+        state = (state * 6364136223846793005 + 1442695040888963407) & ((1 << 64) - 1)
+        b = (state >> 3) % _MERSENNE_PRIME
+        params.append((a, b))
+    return params
+
+_HASH_PARAMS = _hash_params(SIGNATURE_SIZE)
+
+_ARXIV_VERSION_RE = re.compile(r'v\d+$')
+_LATEX_COMMAND_RE = re.compile(r'\\[A-Za-z]+\*?')
+_NON_WORD_RE = re.compile(r'[\W_]+')
+_CJK_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+
+
+def normalize_arxiv_id(arxiv_id: Optional[str]) -> Optional[str]:
+    """去掉前缀和版本号，同一篇预印本的不同版本视为同一条记录"""
+    if not arxiv_id:
+        return None
+    arxiv_id = str(arxiv_id).strip()
+    for prefix in ("arXiv:", "arxiv:", "https://arxiv.org/abs/", "http://arxiv.org/abs/"):
+        if arxiv_id.startswith(prefix):
+            arxiv_id = arxiv_id[len(prefix):]
+    return _ARXIV_VERSION_RE.sub("", arxiv_id) or None
+
+
+def normalize_doi(doi: Optional[str]) -> Optional[str]:
+    if not doi:
+        return None
+    doi = str(doi).strip()
+    for prefix in ("https://doi.org/", "http://doi.org/", "https://dx.doi.org/", "http://dx.doi.org/", "doi:"):
+        if doi.lower().startswith(prefix):
+            doi = doi[len(prefix):]
+    return doi.strip().lower() or None
+
+
+def normalize_title(title: str) -> str:
+    """去掉重音、LaTeX命令、大小写和标点差异"""
+    text = unicodedata.normalize("NFKD", title or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _LATEX_COMMAND_RE.sub(" ", text)
+    return _NON_WORD_RE.sub(" ", text.lower()).strip()
+
+
+def author_keys(authors: Sequence[str]) -> List[str]:
+    """作者姓氏列表，兼容 "名 姓" 和 "姓, 名" 两种写法"""
+    keys = []
+    for author in authors or []:
+        author = author.strip()
+        if not author:
+            continue
+        if "," in author:
+            surname = author.split(",", 1)[0]
+        elif _CJK_RE.search(author):
+            surname = author
+        else:
+            surname = author.split()[-1]
+        key = normalize_title(surname)
+        if key:
+            keys.append(key)
+    return keys
+
+
+def title_shingles(title: str) -> Set[str]:
+    """规范化标题的字符3-gram（对短标题和中文标题都适用）"""
+    text = normalize_title(title)
+    if len(text) <= 3:
+        return {text} if text else set()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def minhash_signature(shingles: Iterable[str]) -> Optional[array]:
+    """计算MinHash签名，没有shingle时返回None"""
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles]
+    if not hashes:
+        return None
+    prime = _MERSENNE_PRIME
+    return array("I", [min([(a * h + b) % prime for h in hashes]) & _MAX_HASH for a, b in _HASH_PARAMS])
+
+
+def lsh_buckets(signature: array) -> List[Tuple[int, int]]:
+    """把签名切成若干段，每段哈希成一个桶，返回(段号, 桶)"""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        buckets.append((band, zlib.crc32(rows.tobytes())))
+    return buckets
+
+
+def estimated_similarity(sig_a: array, sig_b: array) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / SIGNATURE_SIZE
+
+
+def paper_year(paper: Dict) -> Optional[int]:
+    """优先取year字段，没有时取published的前四位；都无法解析时返回None"""
+    year = paper.get("year") or str(paper.get("published") or "")[:4]
+    try:
+        return int(year)
+    except (TypeError, ValueError):
+        return None
+
+
+def _identifiers_conflict(a: Dict, b: Dict) -> bool:
+    """两条记录带有不同的arXiv ID或DOI时不能合并"""
+    arxiv_a, arxiv_b = normalize_arxiv_id(a.get("arxiv_id")), normalize_arxiv_id(b.get("arxiv_id"))
+    if arxiv_a and arxiv_b and arxiv_a != arxiv_b:
+        return True
+    doi_a, doi_b = normalize_doi(a.get("doi")), normalize_doi(b.get("doi"))
+    return bool(doi_a and doi_b and doi_a != doi_b)
+
+
+def is_duplicate(a: Dict, b: Dict, sig_a: array, sig_b: array) -> bool:
+    """判断两条记录是否为同一篇论文"""
+    if _identifiers_conflict(a, b):
+        return False
+    similarity = estimated_similarity(sig_a, sig_b)
+    if similarity < TITLE_THRESHOLD:
+        return False
+    year_a, year_b = paper_year(a), paper_year(b)
+    # 预印本和正式发表之间通常相差一年左右
+    if year_a and year_b and abs(year_a - year_b) > 1:
+        return False
+    authors_a, authors_b = author_keys(a.get("authors", [])), author_keys(b.get("authors", []))
+    if not authors_a or not authors_b:
+        return similarity >= TITLE_ONLY_THRESHOLD
+    if authors_a[0] == authors_b[0]:
+        return True
+    overlap = len(set(authors_a) & set(authors_b))
+    return overlap / min(len(set(authors_a)), len(set(authors_b))) >= 0.5
+
+
+def merge_records(base: Dict, other: Dict) -> Dict:
+    """把other中非空的字段合并进base，记录所有来源"""
+    merged = dict(base)
+    merged.update({k: v for k, v in other.items() if v not in (None, "", [])})
+    # 作者列表保留较完整的那一份（Crossref有时只列出部分作者）
+    if len(base.get("authors") or []) > len(other.get("authors") or []):
+        merged["authors"] = base["authors"]
+    if base.get("domains") and other.get("domains"):
+        merged["domains"] = sorted(set(base["domains"]) | set(other["domains"]))
+    sources = []
+    for record in (base, other):
+        for source in record.get("sources") or [record.get("source")]:
+            if source and source not in sources:
+                sources.append(source)
+    if sources:
+        merged["sources"] = sources
+    return merged
+
+
+class DedupIndex:
+    """内存中的近似重复索引，用于一批记录（保存前、导出时）的合并"""
+
+    def __init__(self):
+        self.records: List[Dict] = []
+        self._signatures: List[Optional[array]] = []
+        self._buckets: Dict[Tuple[int, int], List[int]] = {}
+        self.merged = 0
+
+    def add(self, record: Dict) -> int:
+        """加入一条记录，与已有记录重复时合并，返回其在records中的位置"""
+        signature = minhash_signature(title_shingles(record.get("title", "")))
+        if signature is not None:
+            buckets = lsh_buckets(signature)
+            seen = set()
+            for bucket in buckets:
+                for position in self._buckets.get(bucket, ()):
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    if is_duplicate(self.records[position], record, self._signatures[position], signature):
+                        self.records[position] = merge_records(self.records[position], record)
+                        self.merged += 1
+                        return position
+        position = len(self.records)
+        self.records.append(record)
+        self._signatures.append(signature)
+        if signature is not None:
+            for bucket in buckets:
+                self._buckets.setdefault(bucket, []).append(position)
+        return position
+
+
+def dedupe_records(records: Iterable[Dict]) -> Tuple[List[Dict], int]:
+    """合并一批记录中的近似重复，返回(合并后的记录, 合并掉的数量)"""
+    index = DedupIndex()
+    for record in records:
+        index.add(record)
+    return index.records, index.merged
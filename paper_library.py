@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地论文库
+每个工作区的 references/ 目录下维护一个SQLite数据库，按arXiv ID/DOI合并保存论文，
+记录所属领域标签，并用FTS5对标题、作者、摘要建立全文索引。
+没有相同ID的论文通过持久化的MinHash/LSH分桶查找近似重复（见paper_dedup），
+每次保存只与同桶的候选比较。
+另外维护一个中英文混合分词的倒排索引，供离线BM25检索使用；
+导出时分配的BibTeX键也保存在库中，同一篇论文每次导出使用相同的键
+"""
+
+import glob
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import Counter
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from paper_dedup import (
+    TITLE_THRESHOLD, estimated_similarity, is_duplicate, lsh_buckets, merge_records, minhash_signature, normalize_arxiv_id,
+    normalize_doi, paper_year, title_shingles
+)
+from reference_export import KeyAllocator, citation_key_base
+
+LIBRARY_FILE_NAME = "library.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    id INTEGER PRIMARY KEY,
+    arxiv_id TEXT UNIQUE,
+    doi TEXT UNIQUE,
+    title_key TEXT,
+    title TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    abstract TEXT,
+    published TEXT,
+    year INTEGER,
+    journal TEXT,
+    url TEXT,
+    source TEXT,
+    data TEXT NOT NULL,
+    added REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_papers_title_key ON papers(title_key);
+CREATE TABLE IF NOT EXISTS paper_domains (
+    paper_id INTEGER NOT NULL REFERENCES papers(id) ON DELETE CASCADE,
+    domain TEXT NOT NULL,
+    PRIMARY KEY (paper_id, domain)
+);
+CREATE INDEX IF NOT EXISTS idx_paper_domains_domain ON paper_domains(domain);
+CREATE TABLE IF NOT EXISTS paper_signatures (
+    paper_id INTEGER PRIMARY KEY REFERENCES papers(id) ON DELETE CASCADE,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS paper_lsh (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    paper_id INTEGER NOT NULL REFERENCES papers(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_paper_lsh_bucket ON paper_lsh(band, bucket);
+CREATE INDEX IF NOT EXISTS idx_paper_lsh_paper ON paper_lsh(paper_id);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    paper_id INTEGER NOT NULL REFERENCES papers(id) ON DELETE CASCADE,
+    tf REAL NOT NULL,
+    PRIMARY KEY (term, paper_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_paper ON postings(paper_id);
+CREATE TABLE IF NOT EXISTS doc_lengths (
+    paper_id INTEGER PRIMARY KEY REFERENCES papers(id) ON DELETE CASCADE,
+    length REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS imported_files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS citation_keys (
+    paper_id INTEGER PRIMARY KEY REFERENCES papers(id) ON DELETE CASCADE,
+    key TEXT NOT NULL UNIQUE
+);
+"""
+
+_NON_WORD_RE = re.compile(r'\W+')
+
+# 英文/数字词，以及连续的中日韩汉字
+_TOKEN_RE = re.compile(r'[a-z0-9]+(?:[.\-\'][a-z0-9]+)*|[\u3400-\u9fff\uf900-\ufaff]+')
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on",
+    "or", "that", "the", "this", "to", "with", "we", "our", "via", "using",
+}
+
+# BM25参数；标题中的词按两倍词频计算
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 2.0
+
+
+def title_key(title: str) -> str:
+    """用于在没有ID时匹配同一篇论文的标题键"""
+    return _NON_WORD_RE.sub(" ", (title or "").lower()).strip()
+
+
+def tokenize(text: str) -> List[str]:
+    """中英文混合分词：英文按词（去停用词），中文取单字和相邻两字"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize("NFKC", text or "").lower()):
+        token = match.group()
+        if token[0] >= "\u3400":
+            tokens.extend(token)
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        elif token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+class PaperLibrary:
+    """一个工作区的论文库"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.near_duplicates = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+        self.fts_available = self._create_fts()
+        self._conn.commit()
+        self._backfill_indexes()
+
+    @classmethod
+    def open(cls, base_path: str) -> "PaperLibrary":
+        """打开 base_path（通常是 工作区/references）下的论文库"""
+        return cls(os.path.join(base_path, LIBRARY_FILE_NAME))
+
+    def _create_fts(self) -> bool:
+        try:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(title, authors, abstract)")
+            return True
+        except sqlite3.OperationalError:
+            # 部分Python发行版的SQLite没有编译FTS5，退回到LIKE查询
+            return False
+
+    def _backfill_indexes(self):
+        """为还没有签名或倒排索引的论文（旧版论文库）补建索引"""
+        rows = self._conn.execute(
+            "SELECT id, title FROM papers WHERE id NOT IN (SELECT paper_id FROM paper_signatures)").fetchall()
+        unindexed = self._conn.execute(
+            "SELECT * FROM papers WHERE id NOT IN (SELECT paper_id FROM doc_lengths)").fetchall()
+        if not rows and not unindexed:
+            return
+        with self._conn:
+            for row in rows:
+                self._index_signature(row["id"], minhash_signature(title_shingles(row["title"])))
+            for row in unindexed:
+                self._index_terms(row["id"], json.loads(row["data"]))
+
+    def _index_terms(self, paper_id: int, record: Dict):
+        """重建一篇论文的倒排索引（标题、作者、摘要和领域标签）"""
+        self._conn.execute("DELETE FROM postings WHERE paper_id = ?", (paper_id,))
+        domains = [r[0] for r in self._conn.execute(
+            "SELECT domain FROM paper_domains WHERE paper_id = ?", (paper_id,))]
+        counts: Counter = Counter()
+        for token in tokenize(record.get("title", "")):
+            counts[token] += TITLE_WEIGHT
+        body = " ".join([" ".join(record.get("authors", [])),
+                         record.get("summary") or record.get("abstract") or "", " ".join(domains)])
+        counts.update(tokenize(body))
+        self._conn.executemany("INSERT INTO postings (term, paper_id, tf) VALUES (?, ?, ?)",
+                               [(term, paper_id, tf) for term, tf in counts.items()])
+        self._conn.execute("INSERT OR REPLACE INTO doc_lengths (paper_id, length) VALUES (?, ?)",
+                           (paper_id, sum(counts.values())))
+
+    def _index_signature(self, paper_id: int, signature: Optional[array]):
+        self._conn.execute("DELETE FROM paper_lsh WHERE paper_id = ?", (paper_id,))
+        if signature is None:
+            self._conn.execute("DELETE FROM paper_signatures WHERE paper_id = ?", (paper_id,))
+            return
+        self._conn.execute("INSERT OR REPLACE INTO paper_signatures (paper_id, signature) VALUES (?, ?)",
+                           (paper_id, sqlite3.Binary(signature.tobytes())))
+        self._conn.executemany("INSERT INTO paper_lsh (band, bucket, paper_id) VALUES (?, ?, ?)",
+                               [(band, bucket, paper_id) for band, bucket in lsh_buckets(signature)])
+
+    def _find_near_duplicate(self, paper: Dict, signature: Optional[array]) -> Optional[sqlite3.Row]:
+        """只比较与新论文落在同一LSH桶中的候选"""
+        if signature is None:
+            return None
+        buckets = lsh_buckets(signature)
+        # 每个桶单独走(band, bucket)索引，再合并候选
+        lookups = " UNION ".join(["SELECT paper_id FROM paper_lsh WHERE band = ? AND bucket = ?"] * len(buckets))
+        params = [value for bucket in buckets for value in bucket]
+        rows = self._conn.execute(
+            f"SELECT p.*, s.signature FROM papers p JOIN paper_signatures s ON s.paper_id = p.id "
+            f"WHERE p.id IN ({lookups}) ORDER BY p.id", params).fetchall()
+        for row in rows:
+            candidate_signature = array("I")
+            candidate_signature.frombytes(row["signature"])
+            # 先用签名粗筛，避免为每个候选解析JSON
+            if estimated_similarity(candidate_signature, signature) < TITLE_THRESHOLD:
+                continue
+            if is_duplicate(json.loads(row["data"]), paper, candidate_signature, signature):
+                self.near_duplicates += 1
+                return row
+        return None
+
+    def _find_existing(self, arxiv_id: Optional[str], doi: Optional[str], key: str) -> Optional[sqlite3.Row]:
+        if arxiv_id:
+            row = self._conn.execute("SELECT * FROM papers WHERE arxiv_id = ?", (arxiv_id,)).fetchone()
+            if row:
+                return row
+        if doi:
+            row = self._conn.execute("SELECT * FROM papers WHERE doi = ?", (doi,)).fetchone()
+            if row:
+                return row
+        if not arxiv_id and not doi and key:
+            row = self._conn.execute(
+                "SELECT * FROM papers WHERE title_key = ? AND arxiv_id IS NULL AND doi IS NULL",
+                (key,)).fetchone()
+            if row:
+                return row
+        return None
+
+    def upsert(self, paper: Dict, domain: Optional[str] = None) -> Tuple[int, bool]:
+        """按arXiv ID/DOI（其次按近似重复）插入或合并一篇论文，返回(论文ID, 是否新插入)"""
+        arxiv_id = normalize_arxiv_id(paper.get("arxiv_id"))
+        doi = normalize_doi(paper.get("doi"))
+        key = title_key(paper.get("title", ""))
+        now = time.time()
+        signature = minhash_signature(title_shingles(paper.get("title", "")))
+        existing = self._find_existing(arxiv_id, doi, key) or self._find_near_duplicate(paper, signature)
+
+        if existing is None:
+            record = paper
+            created = True
+        else:
+            # 新记录中非空的字段覆盖旧记录，其余保留
+            previous = json.loads(existing["data"])
+            record = merge_records(previous, paper)
+            arxiv_id = arxiv_id or existing["arxiv_id"]
+            doi = doi or existing["doi"]
+            # 新带来的DOI已属于另一条记录时保持原值，避免违反唯一约束；
+            # 保存的记录中也恢复原值，否则导出时两篇论文带同一个DOI
+            if doi != existing["doi"] and self._conn.execute(
+                    "SELECT 1 FROM papers WHERE doi = ? AND id != ?", (doi, existing["id"])).fetchone():
+                doi = existing["doi"]
+                if previous.get("doi"):
+                    record["doi"] = previous["doi"]
+                else:
+                    record.pop("doi", None)
+            created = False
+
+        values = (
+            arxiv_id, doi, title_key(record.get("title", "")),
+            record.get("title", ""),
+            json.dumps(record.get("authors", []), ensure_ascii=False),
+            record.get("summary") or record.get("abstract") or "",
+            record.get("published") or "",
+            paper_year(record),
+            record.get("journal") or "",
+            record.get("url") or "",
+            record.get("source") or "",
+            json.dumps(record, ensure_ascii=False),
+        )
+        if created:
+            cursor = self._conn.execute(
+                "INSERT INTO papers (arxiv_id, doi, title_key, title, authors, abstract, published, year, "
+                "journal, url, source, data, added, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                values + (now, now))
+            paper_id = cursor.lastrowid
+        else:
+            paper_id = existing["id"]
+            self._conn.execute(
+                "UPDATE papers SET arxiv_id = ?, doi = ?, title_key = ?, title = ?, authors = ?, abstract = ?, "
+                "published = ?, year = ?, journal = ?, url = ?, source = ?, data = ?, updated = ? WHERE id = ?",
+                values + (now, paper_id))
+
+        if self.fts_available:
+            self._conn.execute("DELETE FROM papers_fts WHERE rowid = ?", (paper_id,))
+            self._conn.execute(
+                "INSERT INTO papers_fts (rowid, title, authors, abstract) VALUES (?, ?, ?, ?)",
+                (paper_id, values[3], " ".join(record.get("authors", [])), values[5]))
+        if created or existing["title"] != values[3]:
+            if record.get("title") != paper.get("title"):
+                signature = minhash_signature(title_shingles(values[3]))
+            self._index_signature(paper_id, signature)
+        if domain:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO paper_domains (paper_id, domain) VALUES (?, ?)", (paper_id, domain))
+        self._index_terms(paper_id, record)
+        return paper_id, created
+
+    def upsert_all(self, papers: List[Dict], domain: Optional[str] = None) -> List[Tuple[int, bool]]:
+        """批量保存，在一个事务中完成，按输入顺序返回每篇的(论文ID, 是否新插入)"""
+        with self._conn:
+            return [self.upsert(paper, domain) for paper in papers]
+
+    def upsert_many(self, papers: List[Dict], domain: Optional[str] = None) -> Tuple[int, int]:
+        """批量保存，返回(新插入数量, 合并更新数量)"""
+        saved = self.upsert_all(papers, domain)
+        inserted = sum(1 for _, created in saved if created)
+        return inserted, len(saved) - inserted
+
+    def citation_keys(self, papers: Dict[int, Dict]) -> Dict[int, str]:
+        """返回 论文ID -> BibTeX键；没有键的论文按作者-年份-标题分配一个库内唯一的键并保存"""
+        keys = {}
+        allocator = KeyAllocator()
+        loaded = set()
+        with self._conn:
+            for paper_id, paper in papers.items():
+                row = self._conn.execute("SELECT key FROM citation_keys WHERE paper_id = ?", (paper_id,)).fetchone()
+                if row is not None:
+                    keys[paper_id] = row[0]
+                    continue
+                base = citation_key_base(paper)
+                if base not in loaded:
+                    # 一次读出以该基础键开头的全部已用键（后缀只有小写字母，都小于"{"）
+                    allocator.taken.update(r[0] for r in self._conn.execute(
+                        "SELECT key FROM citation_keys WHERE key >= ? AND key < ?", (base, base + "{")))
+                    loaded.add(base)
+                key = allocator.allocate_base(base)
+                self._conn.execute("INSERT INTO citation_keys (paper_id, key) VALUES (?, ?)", (paper_id, key))
+                keys[paper_id] = key
+        return keys
+
+    def _row_to_paper(self, row: sqlite3.Row) -> Dict:
+        paper = json.loads(row["data"])
+        paper["library_id"] = row["id"]
+        paper["domains"] = [r[0] for r in self._conn.execute(
+            "SELECT domain FROM paper_domains WHERE paper_id = ? ORDER BY domain", (row["id"],))]
+        return paper
+
+    def _match_sql(self, query: Optional[str], domain: Optional[str]) -> Tuple[str, List]:
+        clauses = []
+        params: List = []
+        order = "p.updated DESC"
+        joins = ""
+        if query and query.strip():
+            if self.fts_available:
+                # 每个词作为短语匹配，避免用户输入被当成FTS语法
+                terms = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+                joins = " JOIN papers_fts f ON f.rowid = p.id"
+                clauses.append("papers_fts MATCH ?")
+                params.append(terms)
+                order = "f.rank"
+            else:
+                for term in query.split():
+                    clauses.append("(p.title LIKE ? OR p.authors LIKE ? OR p.abstract LIKE ?)")
+                    params.extend([f"%{term}%"] * 3)
+        if domain:
+            clauses.append("p.id IN (SELECT paper_id FROM paper_domains WHERE domain = ?)")
+            params.append(domain)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return f"SELECT p.* FROM papers p{joins}{where} ORDER BY {order}", params
+
+    def search(self, query: Optional[str] = None, domain: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """全文检索论文库，可按领域过滤"""
+        sql, params = self._match_sql(query, domain)
+        rows = self._conn.execute(f"{sql} LIMIT ?", params + [limit]).fetchall()
+        return [self._row_to_paper(row) for row in rows]
+
+    def iter_papers(self, query: Optional[str] = None, domain: Optional[str] = None) -> Iterator[Dict]:
+        """逐条遍历符合条件的论文（导出时使用，不一次性加载全部）"""
+        sql, params = self._match_sql(query, domain)
+        for row in self._conn.execute(sql, params):
+            yield self._row_to_paper(row)
+
+    def bm25_search(self, query: str, domain: Optional[str] = None,
+                    limit: int = 20) -> List[Tuple[float, Dict]]:
+        """用倒排索引按BM25打分检索，返回[(得分, 论文)]"""
+        terms = Counter(tokenize(query))
+        if not terms:
+            return []
+        total, avg_length = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(AVG(length), 0) FROM doc_lengths").fetchone()
+        if not total:
+            return []
+        allowed = None
+        if domain:
+            allowed = {r[0] for r in self._conn.execute(
+                "SELECT paper_id FROM paper_domains WHERE domain = ?", (domain,))}
+
+        scores: Dict[int, float] = {}
+        for term, query_tf in terms.items():
+            postings = self._conn.execute(
+                "SELECT p.paper_id, p.tf, d.length FROM postings p JOIN doc_lengths d ON d.paper_id = p.paper_id "
+                "WHERE p.term = ?", (term,)).fetchall()
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for paper_id, tf, length in postings:
+                if allowed is not None and paper_id not in allowed:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[paper_id] = scores.get(paper_id, 0.0) + query_tf * idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        results = []
+        for paper_id, score in ranked:
+            row = self._conn.execute("SELECT * FROM papers WHERE id = ?", (paper_id,)).fetchone()
+            results.append((score, self._row_to_paper(row)))
+        return results
+
+    def import_exports(self, base_path: str) -> int:
+        """把 references/领域/papers_*.json 旧导出文件并入论文库，已导入且未修改的文件跳过"""
+        imported = 0
+        for path in sorted(glob.glob(os.path.join(base_path, "*", "papers_*.json"))):
+            row = self._conn.execute("SELECT mtime FROM imported_files WHERE path = ?", (path,)).fetchone()
+            if row and row[0] == os.path.getmtime(path):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    papers = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if isinstance(papers, list):
+                papers = [paper for paper in papers if isinstance(paper, dict) and paper.get("title")]
+                self.upsert_many(papers, os.path.basename(os.path.dirname(path)))
+                imported += len(papers)
+            self.mark_imported(path)
+        return imported
+
+    def mark_imported(self, path: str):
+        """记录导出文件的内容已在论文库中（save_search_results写出导出文件后调用）"""
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO imported_files (path, mtime) VALUES (?, ?)",
+                               (path, os.path.getmtime(path)))
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def domains(self) -> Dict[str, int]:
+        return {row[0]: row[1] for row in self._conn.execute(
+            "SELECT domain, COUNT(*) FROM paper_domains GROUP BY domain ORDER BY domain")}
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+参考文献管理工具的本地响应缓存
+把arXiv、Crossref的原始响应按规范化后的请求参数保存在SQLite文件中，
+支持TTL过期、按总大小的LRU淘汰，以及上游不可用时返回过期条目的离线模式
+
+可通过环境变量调整:
+- THESIS_REF_CACHE_DIR     缓存目录，默认 ~/.cache/thesis_reference_manager
+- THESIS_REF_CACHE_MAX_MB  缓存总大小上限(MB)，默认200
+- THESIS_REF_CACHE_TTL     默认过期时间(秒)，默认86400
+- THESIS_REF_OFFLINE       设为1时完全不访问网络，只使用缓存
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from env_config import env_float
+
+
+def _normalize_value(value) -> str:
+    # 查询词大小写、多余空白不影响arXiv和Crossref的结果
+    return " ".join(str(value).split()).lower()
+
+
+def make_cache_key(url: str, params: Optional[Dict] = None) -> str:
+    """根据URL和规范化后的参数生成缓存键"""
+    normalized = {
+        "url": url.rstrip("/").lower(),
+        "params": sorted((str(k), _normalize_value(v)) for k, v in (params or {}).items()),
+    }
+    raw = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_offline() -> bool:
+    """是否处于强制离线模式"""
+    return os.environ.get("THESIS_REF_OFFLINE", "").strip().lower() in ("1", "true", "yes")
+
+
+class ResponseCache:
+    """基于SQLite的持久化响应缓存"""
+
+    def __init__(self, path: str, max_bytes: int = 200 * 1024 * 1024, default_ttl: float = 86400.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.counters = {"hits": 0, "misses": 0, "stale_hits": 0, "stores": 0, "evictions": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                expires REAL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        cache_dir = os.environ.get("THESIS_REF_CACHE_DIR") or os.path.join(
+            os.path.expanduser("~"), ".cache", "thesis_reference_manager")
+        max_mb = env_float("THESIS_REF_CACHE_MAX_MB", 200)
+        ttl = env_float("THESIS_REF_CACHE_TTL", 86400)
+        return cls(os.path.join(cache_dir, "responses.sqlite3"), int(max_mb * 1024 * 1024), ttl)
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[bytes]:
+        """读取缓存条目；过期条目只有在allow_stale=True时返回"""
+        row = self._conn.execute(
+            "SELECT body, expires FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None:
+            self.counters["misses"] += 1
+            return None
+        body, expires = row
+        stale = expires is not None and expires <= now
+        if stale and not allow_stale:
+            self.counters["misses"] += 1
+            return None
+        self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.counters["stale_hits" if stale else "hits"] += 1
+        return bytes(body)
+
+    def contains(self, key: str) -> bool:
+        """是否有未过期的条目（不计入命中统计，预取时判断是否需要请求）"""
+        row = self._conn.execute("SELECT expires FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and (row[0] is None or row[0] > time.time())
+
+    def put(self, key: str, body: bytes, ttl: Optional[float] = None, permanent: bool = False):
+        """写入缓存条目；ttl为空时使用默认过期时间，permanent=True表示永不过期"""
+        now = time.time()
+        expires = None if permanent else now + (self.default_ttl if ttl is None else ttl)
+        old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, body, size, created, expires, accessed) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, sqlite3.Binary(body), len(body), now, expires, now))
+        self._conn.commit()
+        self._total_bytes += len(body) - (old[0] if old else 0)
+        self.counters["stores"] += 1
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """按最近访问时间淘汰条目，直到总大小降到上限的90%以下"""
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall()
+        victims = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            victims.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._conn.commit()
+        self.counters["evictions"] += len(victims)
+
+    def clear(self):
+        self._conn.execute("DELETE FROM responses")
+        self._conn.commit()
+        self._total_bytes = 0
+
+    def stats(self) -> Dict:
+        """返回命中统计和缓存占用"""
+        entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.counters["hits"] + self.counters["stale_hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": (self.counters["hits"] + self.counters["stale_hits"]) / lookups if lookups else 0.0,
+            "entries": entries,
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "path": self.path,
+            "offline": is_offline(),
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+_shared_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """获取进程内共享的响应缓存"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = ResponseCache.from_env()
+    return _shared_cache
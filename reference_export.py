@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+参考文献导出
+把搜索结果和论文库中的论文统一转换成ExportRecord，再由JSON、BibTeX、CSL-JSON、Markdown
+四种写出器逐条写入文件，导出几万条记录时也不会在内存中拼接整个输出。
+
+BibTeX键按 作者姓氏 + 年份 + 标题首个实词 生成（如 vaswani2017attention），
+姓氏无法转成ASCII（如中文作者）时用DOI或arXiv ID代替姓氏（如 arxiv210100001 + 年份），
+重复时依次追加 a、b、c…；论文库会保存已分配的键，之后的导出保持不变
+"""
+
+import json
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, IO, Iterable, Iterator, List, Optional
+
+from paper_dedup import normalize_arxiv_id, normalize_doi, paper_year
+
+EXPORT_FORMATS = ("json", "bibtex", "csl-json", "markdown")
+
+# 生成键时跳过的标题虚词
+_KEY_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "for", "from", "in", "is", "of", "on", "or", "the", "to",
+    "towards", "toward", "via", "with", "what", "when", "how", "why", "do", "does", "can",
+}
+
+_CJK_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+# BibTeX中需要转义的字符
+_BIBTEX_SPECIAL = {
+    '\\': r'\textbackslash{}', '{': r'\{', '}': r'\}', '&': r'\&', '%': r'\%', '$': r'\$',
+    '#': r'\#', '_': r'\_', '~': r'\textasciitilde{}', '^': r'\textasciicircum{}',
+}
+_BIBTEX_SPECIAL_RE = re.compile('|'.join(re.escape(char) for char in _BIBTEX_SPECIAL))
+
+# Crossref的type -> (BibTeX条目类型, CSL类型)
+_ENTRY_TYPES = {
+    'journal-article': ('article', 'article-journal'),
+    'proceedings-article': ('inproceedings', 'paper-conference'),
+    'book': ('book', 'book'),
+    'monograph': ('book', 'book'),
+    'book-chapter': ('incollection', 'chapter'),
+    'dissertation': ('phdthesis', 'thesis'),
+    'report': ('techreport', 'report'),
+    'posted-content': ('misc', 'article'),
+}
+_CONTAINER_FIELDS = {'article': 'journal', 'inproceedings': 'booktitle', 'incollection': 'booktitle'}
+
+
+@dataclass
+class ExportRecord:
+    """各导出格式共用的论文记录"""
+    key: str
+    title: str
+    authors: List[str] = field(default_factory=list)
+    year: Optional[int] = None
+    journal: str = ""
+    doi: str = ""
+    arxiv_id: str = ""
+    url: str = ""
+    abstract: str = ""
+    published: str = ""
+    source: str = ""
+    work_type: str = ""
+    domains: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_paper(cls, paper: Dict, key: Optional[str] = None) -> "ExportRecord":
+        """从搜索结果或论文库记录构建；缺失的字段按空值处理"""
+        return cls(
+            key=key or citation_key_base(paper),
+            title=paper.get('title') or "",
+            authors=list(paper.get('authors') or []),
+            year=paper_year(paper),
+            journal=paper.get('journal') or "",
+            doi=paper.get('doi') or "",
+            arxiv_id=paper.get('arxiv_id') or "",
+            url=paper.get('url') or "",
+            abstract=paper.get('summary') or paper.get('abstract') or "",
+            published=paper.get('published') or "",
+            source=paper.get('source') or "",
+            work_type=paper.get('type') or "",
+            domains=list(paper.get('domains') or []),
+        )
+
+    @property
+    def entry_type(self) -> str:
+        return _ENTRY_TYPES.get(self.work_type, ('article', 'article-journal'))[0]
+
+    @property
+    def csl_type(self) -> str:
+        if not self.work_type and self.arxiv_id and not self.journal:
+            # 只有arXiv预印本
+            return 'article'
+        return _ENTRY_TYPES.get(self.work_type, ('article', 'article-journal'))[1]
+
+    def to_dict(self) -> Dict:
+        """JSON导出用的字典，去掉空字段；字段名与搜索结果一致，可以重新保存到论文库"""
+        record = {'citation_key': self.key, 'title': self.title, 'authors': self.authors, 'year': self.year,
+                  'published': self.published, 'journal': self.journal, 'doi': self.doi,
+                  'arxiv_id': self.arxiv_id, 'url': self.url, 'abstract': self.abstract,
+                  'source': self.source, 'type': self.work_type, 'domains': self.domains}
+        return {name: value for name, value in record.items() if value not in (None, "", [])}
+
+
+def _ascii_words(text: str) -> List[str]:
+    folded = unicodedata.normalize('NFKD', text or "").encode('ascii', 'ignore').decode('ascii')
+    return _WORD_RE.findall(folded.lower())
+
+
+def _surname(author: str) -> str:
+    author = author.strip()
+    if ',' in author:
+        return author.split(',', 1)[0]
+    if _CJK_RE.search(author):
+        return author
+    return author.split()[-1] if author.split() else ""
+
+
+def _identifier_stem(paper: Dict) -> str:
+    """由arXiv ID或DOI生成的键前缀，用于姓氏无法转成ASCII的论文；DOI取后缀的末尾部分"""
+    arxiv_id = normalize_arxiv_id(paper.get('arxiv_id'))
+    if arxiv_id:
+        return "arxiv" + "".join(_ascii_words(arxiv_id))
+    doi = normalize_doi(paper.get('doi'))
+    if doi:
+        return "doi" + "".join(_ascii_words(doi.split('/', 1)[-1]))[-20:]
+    return ""
+
+
+def citation_key_base(paper: Dict) -> str:
+    """作者姓氏 + 年份 + 标题首个实词，只含小写ASCII字母和数字；没有ASCII姓氏时用DOI或arXiv ID代替"""
+    authors = paper.get('authors') or []
+    surname = "".join(_ascii_words(_surname(authors[0]))) if authors else ""
+    surname = surname or _identifier_stem(paper)
+    year = paper_year(paper)
+    words = [word for word in _ascii_words(paper.get('title') or "") if word not in _KEY_STOPWORDS]
+    key = f"{surname or 'anon'}{year or ''}{words[0] if words else ''}"
+    return key[:48]
+
+
+def key_candidates(base: str) -> Iterator[str]:
+    """base, basea, baseb, …, basez, baseaa, …"""
+    yield base
+    n = 0
+    while True:
+        suffix = ""
+        value = n
+        while True:
+            suffix = chr(ord('a') + value % 26) + suffix
+            value = value // 26 - 1
+            if value < 0:
+                break
+        yield base + suffix
+        n += 1
+
+
+class KeyAllocator:
+    """分配不与taken重复的键
+
+    每个基础键记住候选序列的位置，同一作者同一年的大量论文也不需要每次从头试探。
+    """
+
+    def __init__(self, taken: Iterable[str] = ()):
+        self.taken = set(taken)
+        self._candidates: Dict[str, Iterator[str]] = {}
+
+    def allocate_base(self, base: str) -> str:
+        candidates = self._candidates.setdefault(base, key_candidates(base))
+        for key in candidates:
+            if key not in self.taken:
+                self.taken.add(key)
+                return key
+
+    def allocate(self, paper: Dict) -> str:
+        return self.allocate_base(citation_key_base(paper))
+
+
+def bibtex_escape(text: str) -> str:
+    """转义BibTeX/LaTeX特殊字符，并把空白压缩为单个空格"""
+    return _BIBTEX_SPECIAL_RE.sub(lambda m: _BIBTEX_SPECIAL[m.group()], " ".join(str(text).split()))
+
+
+def render_bibtex(record: ExportRecord) -> str:
+    entry_type = record.entry_type
+    fields = [('title', bibtex_escape(record.title)),
+              ('author', " and ".join(bibtex_escape(author) for author in record.authors))]
+    if record.arxiv_id and not record.journal:
+        fields.append(('journal', f"arXiv preprint arXiv:{bibtex_escape(record.arxiv_id)}"))
+    elif record.journal:
+        fields.append((_CONTAINER_FIELDS.get(entry_type, 'publisher'), bibtex_escape(record.journal)))
+    if record.year:
+        fields.append(('year', str(record.year)))
+    if record.arxiv_id:
+        fields.append(('eprint', bibtex_escape(record.arxiv_id)))
+        fields.append(('archivePrefix', 'arXiv'))
+    if record.doi:
+        fields.append(('doi', _strip_braces(record.doi)))
+    if record.url:
+        # URL由\url处理，只去掉会破坏条目结构的花括号
+        fields.append(('url', _strip_braces(record.url)))
+    body = ",\n".join(f"    {name}={{{value}}}" for name, value in fields if value)
+    return f"@{entry_type}{{{record.key},\n{body}\n}}"
+
+
+def _strip_braces(text: str) -> str:
+    return str(text).replace('{', '').replace('}', '')
+
+
+def _csl_name(author: str) -> Dict:
+    author = author.strip()
+    if ',' in author:
+        family, given = (part.strip() for part in author.split(',', 1))
+        return {'family': family, 'given': given}
+    parts = author.split()
+    if _CJK_RE.search(author) or len(parts) < 2:
+        return {'literal': author}
+    return {'family': parts[-1], 'given': " ".join(parts[:-1])}
+
+
+def render_csl(record: ExportRecord) -> Dict:
+    item = {'id': record.key, 'type': record.csl_type, 'title': record.title,
+            'author': [_csl_name(author) for author in record.authors if author.strip()]}
+    if record.year:
+        item['issued'] = {'date-parts': [[record.year]]}
+    if record.journal:
+        item['container-title'] = record.journal
+    elif record.arxiv_id:
+        item['container-title'] = 'arXiv'
+        item['number'] = record.arxiv_id
+    if record.doi:
+        item['DOI'] = record.doi
+    if record.url:
+        item['URL'] = record.url
+    if record.abstract:
+        item['abstract'] = record.abstract
+    return item
+
+
+def render_markdown(index: int, record: ExportRecord) -> str:
+    identifier = record.arxiv_id or record.doi or 'N/A'
+    text = f"{index}. **{record.title}** [`{record.key}`]\n"
+    text += f"   作者: {', '.join(record.authors[:3])}\n"
+    text += f"   年份: {record.year or 'N/A'}  ID: {identifier}\n"
+    if record.domains:
+        text += f"   领域: {', '.join(record.domains)}\n"
+    if record.url:
+        text += f"   链接: {record.url}\n"
+    return text + "\n"
+
+
+def write_records(records: Iterable[ExportRecord], f: IO[str], format: str = "json") -> int:
+    """按format逐条写出记录，返回写出的条数"""
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {format}，可选 {'、'.join(EXPORT_FORMATS)}")
+    as_array = format in ("json", "csl-json")
+    if as_array:
+        f.write("[")
+    count = 0
+    for record in records:
+        count += 1
+        if format == "json":
+            f.write(("," if count > 1 else "") + "\n" + json.dumps(record.to_dict(), ensure_ascii=False, indent=2))
+        elif format == "csl-json":
+            f.write(("," if count > 1 else "") + "\n" + json.dumps(render_csl(record), ensure_ascii=False, indent=2))
+        elif format == "bibtex":
+            f.write(render_bibtex(record) + "\n\n")
+        else:
+            f.write(render_markdown(count, record))
+    if as_array:
+        f.write("\n]\n")
+    return count
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+参考文献管理工具的异步HTTP层
+所有对arXiv、Crossref等外部服务的请求都经过这里，共享一个带keep-alive连接池的客户端，
+这样并发的工具调用不会互相阻塞事件循环
+
+可通过环境变量调整:
+- THESIS_HTTP_CONNECT_TIMEOUT  连接超时(秒)，默认10
+- THESIS_HTTP_READ_TIMEOUT     读取超时(秒)，默认30
+- THESIS_HTTP_MAX_CONNECTIONS  连接池总连接数上限，默认20
+- THESIS_HTTP_MAX_KEEPALIVE    保持的空闲keep-alive连接数，默认10
+- THESIS_HTTP_PER_HOST_LIMIT   单个主机的并发请求上限，默认4
+- THESIS_HTTP_BREAKER_THRESHOLD 连续失败多少次后熔断该主机，默认5
+- THESIS_HTTP_BREAKER_RESET    熔断后多久(秒)放行一次试探请求，默认30
+- THESIS_HTTP_MAX_BACKOFF      重试退避的最长等待(秒)，默认30
+"""
+
+import asyncio
+import os
+import random
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
+
+import httpx
+
+from env_config import env_float, env_int
+
+
+# 这些状态码表示上游暂时不可用，可以稍后重试
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def _host_of(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """解析Retry-After头（秒数或HTTP日期）"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """令牌桶限速：按rate每秒补充令牌，最多攒capacity个（允许的突发量）
+
+    capacity=1时等价于固定最小间隔，适合arXiv这类要求请求间隔的接口。
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.waiting = 0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        self.waiting += 1
+        try:
+            # 排队按到达顺序取令牌
+            async with self._lock:
+                self._refill()
+                while self.tokens < 1:
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+                    self._refill()
+                self.tokens -= 1
+        finally:
+            self.waiting -= 1
+
+    def stats(self) -> Dict:
+        self._refill()
+        return {"rate": self.rate, "capacity": self.capacity,
+                "tokens": round(self.tokens, 2), "queued": self.waiting}
+
+
+class CircuitOpenError(httpx.TransportError):
+    """主机处于熔断状态，请求未发出直接失败"""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"上游 {host} 暂时不可用（熔断中，约{retry_in:.0f}秒后重试）")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """单个主机的熔断器
+
+    closed: 正常放行，连续失败达到阈值后转为open；
+    open: 直接失败，不再等待超时，reset_timeout秒后转为half_open；
+    half_open: 只放行一个试探请求，成功则closed，失败则重新open。
+    """
+
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.host = host
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.counters = {"rejected": 0, "opened": 0}
+
+    def before_request(self):
+        """请求前调用；熔断时抛出CircuitOpenError"""
+        if self.state == "open":
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.reset_timeout:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(self.host, self.reset_timeout - elapsed)
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                self.counters["rejected"] += 1
+                raise CircuitOpenError(self.host, 0)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release(self):
+        """请求结束但没有结果（例如被取消）时释放试探名额"""
+        if self.state == "half_open":
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.counters["opened"] += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        retry_in = 0.0
+        if self.state == "open":
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        return {"state": self.state, "consecutive_failures": self.failures,
+                "retry_in": round(retry_in, 1), **self.counters}
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """合并相同的并发请求：同一个键同时只有一个请求在访问上游，其他调用等待并共享结果
+
+    用于多个工具调用（或重试）同时请求同一个arXiv查询、同一个DOI的情况，减少对上游限额的占用。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counters = {"leaders": 0, "coalesced": 0}
+
+    def _current(self, key: str) -> Optional[asyncio.Future]:
+        future = self._inflight.get(key)
+        # 其他事件循环遗留的请求不能等待（例如测试中多次asyncio.run）
+        if future is not None and (future.done() or future.get_loop() is not asyncio.get_running_loop()):
+            self._inflight.pop(key, None)
+            return None
+        return future
+
+    def _register(self, key: str, future: asyncio.Future):
+        self._inflight[key] = future
+        self.counters["leaders"] += 1
+
+        def release(done: asyncio.Future):
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+        future.add_done_callback(release)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """执行fn()；已有相同键的请求在进行时直接等待它的结果（包括异常）"""
+        future = self._current(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+        else:
+            future = asyncio.ensure_future(fn())
+            self._register(key, future)
+        # 单个调用方被取消时不影响其他等待者
+        return await asyncio.shield(future)
+
+    async def wait(self, key: str) -> bool:
+        """有相同键的请求在进行时等待其完成并返回True（结果由调用方从缓存读取）"""
+        future = self._current(key)
+        if future is None:
+            return False
+        self.counters["coalesced"] += 1
+        await asyncio.wait([future])
+        return True
+
+    @asynccontextmanager
+    async def lead(self, key: str) -> AsyncIterator[None]:
+        """登记一个由调用方自己完成的请求（例如流式读取），退出时唤醒等待者"""
+        future = asyncio.get_running_loop().create_future()
+        self._register(key, future)
+        try:
+            yield
+        finally:
+            future.set_result(None)
+
+    def stats(self) -> Dict:
+        return {**self.counters, "in_flight": len(self._inflight)}
+
+
+class HTTPConfig:
+    """HTTP客户端配置"""
+
+    def __init__(self, connect_timeout: float = 10.0, read_timeout: float = 30.0,
+                 max_connections: int = 20, max_keepalive: int = 10,
+                 per_host_limit: int = 4, user_agent: str = "thesis-reference-manager",
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0, max_backoff: float = 30.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.per_host_limit = max(1, per_host_limit)
+        self.user_agent = user_agent
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.max_backoff = max_backoff
+
+    @classmethod
+    def from_env(cls) -> "HTTPConfig":
+        """从环境变量读取配置"""
+        return cls(
+            connect_timeout=env_float("THESIS_HTTP_CONNECT_TIMEOUT", 10.0),
+            read_timeout=env_float("THESIS_HTTP_READ_TIMEOUT", 30.0),
+            max_connections=env_int("THESIS_HTTP_MAX_CONNECTIONS", 20),
+            max_keepalive=env_int("THESIS_HTTP_MAX_KEEPALIVE", 10),
+            per_host_limit=env_int("THESIS_HTTP_PER_HOST_LIMIT", 4),
+            breaker_threshold=env_int("THESIS_HTTP_BREAKER_THRESHOLD", 5),
+            breaker_reset=env_float("THESIS_HTTP_BREAKER_RESET", 30.0),
+            max_backoff=env_float("THESIS_HTTP_MAX_BACKOFF", 30.0),
+        )
+
+
+class AsyncHTTPClient:
+    """共享的异步HTTP客户端
+
+    内部持有一个httpx.AsyncClient连接池，并为每个主机维护一个信号量限制并发数、
+    一个令牌桶限制请求速率、一个熔断器在主机不可用时快速失败。
+    连接池与事件循环绑定，如果在新的事件循环中使用（例如测试中多次asyncio.run），会自动重建。
+    """
+
+    def __init__(self, config: Optional[HTTPConfig] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.config = config or HTTPConfig.from_env()
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._rate_limits: Dict[str, Tuple[float, float]] = {}
+        self._rate_limiters: Dict[str, TokenBucket] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._active: Dict[str, int] = {}
+
+    def set_rate_limit(self, host: str, per_second: float, burst: float = 1.0):
+        """限制某个主机每秒最多发出的请求数，burst为允许的突发请求数"""
+        host = host.lower()
+        if self._rate_limits.get(host) == (per_second, burst):
+            return
+        self._rate_limits[host] = (per_second, burst)
+        self._rate_limiters.pop(host, None)
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        host = host.lower()
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host, self.config.breaker_threshold, self.config.breaker_reset)
+            self._breakers[host] = breaker
+        return breaker
+
+    def _build_client(self) -> httpx.AsyncClient:
+        cfg = self.config
+        timeout = httpx.Timeout(
+            connect=cfg.connect_timeout,
+            read=cfg.read_timeout,
+            write=cfg.read_timeout,
+            pool=cfg.read_timeout,
+        )
+        limits = httpx.Limits(
+            max_connections=cfg.max_connections,
+            max_keepalive_connections=cfg.max_keepalive,
+        )
+        return httpx.AsyncClient(
+            timeout=timeout,
+            limits=limits,
+            follow_redirects=True,
+            headers={"User-Agent": cfg.user_agent},
+            transport=self._transport,
+        )
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # 旧循环上的连接不能复用，直接丢弃
+            self._client = self._build_client()
+            self._loop = loop
+            self._host_limits = {}
+            self._rate_limiters = {}
+        return self._client
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = _host_of(url)
+        sem = self._host_limits.get(host)
+        if sem is None:
+            sem = asyncio.Semaphore(self.config.per_host_limit)
+            self._host_limits[host] = sem
+        return sem
+
+    @asynccontextmanager
+    async def _slot(self, url: str) -> AsyncIterator[CircuitBreaker]:
+        """占用主机的并发名额和一个令牌；熔断时在排队前就失败"""
+        host = _host_of(url)
+        breaker = self.breaker(host)
+        breaker.before_request()
+        self._active[host] = self._active.get(host, 0) + 1
+        try:
+            async with self._host_semaphore(url):
+                limiter = self._rate_limiter(url)
+                if limiter is not None:
+                    await limiter.acquire()
+                yield breaker
+        finally:
+            self._active[host] -= 1
+            breaker.release()
+
+    @staticmethod
+    def _record(breaker: CircuitBreaker, response: httpx.Response):
+        if response.status_code in RETRYABLE_STATUS:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    async def get(self, url: str, params: Optional[Dict] = None,
+                  headers: Optional[Dict] = None) -> httpx.Response:
+        """发送GET请求并读取完整响应体"""
+        client = self._ensure_client()
+        async with self._slot(url) as breaker:
+            try:
+                response = await client.get(url, params=params, headers=headers)
+            except httpx.TransportError:
+                breaker.record_failure()
+                raise
+            self._record(breaker, response)
+            return response
+
+    @asynccontextmanager
+    async def _stream_once(self, url: str, params: Optional[Dict] = None,
+                           headers: Optional[Dict] = None) -> AsyncIterator[httpx.Response]:
+        client = self._ensure_client()
+        async with self._slot(url) as breaker:
+            try:
+                async with client.stream("GET", url, params=params, headers=headers) as response:
+                    self._record(breaker, response)
+                    yield response
+            except httpx.TransportError:
+                breaker.record_failure()
+                raise
+
+    @asynccontextmanager
+    async def stream(self, url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+                     retries: int = 0, backoff: float = 0.5) -> AsyncIterator[httpx.Response]:
+        """以流的方式发送GET请求，响应体由调用方用aiter_bytes()逐块读取
+
+        收到响应头之前的网络错误和429/5xx按get_with_retry的规则重试；
+        响应交给调用方之后不再重试（已经读出的数据无法撤回）。
+        """
+        attempt = 0
+        while True:
+            stack = AsyncExitStack()
+            try:
+                response = await stack.enter_async_context(self._stream_once(url, params, headers))
+            except CircuitOpenError:
+                raise
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+                delay = self._backoff_delay(backoff, attempt)
+            else:
+                delay = None
+                if response.status_code in RETRYABLE_STATUS and attempt < retries:
+                    delay = self._retry_delay(response, backoff, attempt)
+                if delay is None:
+                    async with stack:
+                        yield response
+                    return
+                await stack.aclose()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _rate_limiter(self, url: str) -> Optional[TokenBucket]:
+        host = _host_of(url)
+        if host not in self._rate_limits:
+            return None
+        limiter = self._rate_limiters.get(host)
+        if limiter is None:
+            limiter = TokenBucket(*self._rate_limits[host])
+            self._rate_limiters[host] = limiter
+        return limiter
+
+    def _backoff_delay(self, backoff: float, attempt: int) -> float:
+        """带抖动的指数退避：在[d/2, d]之间随机，避免多个调用方同时重试"""
+        delay = min(self.config.max_backoff, backoff * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _retry_delay(self, response: httpx.Response, backoff: float, attempt: int) -> Optional[float]:
+        """429/5xx响应后重试前的等待时间；上游要求等待超过max_backoff时返回None，不再重试"""
+        delay = _retry_after(response)
+        if delay is None:
+            return self._backoff_delay(backoff, attempt)
+        return delay if delay <= self.config.max_backoff else None
+
+    def status(self) -> Dict[str, Dict]:
+        """各主机的熔断器状态、限速器排队情况和进行中的请求数"""
+        hosts = set(self._rate_limits) | set(self._breakers) | set(self._active)
+        result = {}
+        for host in sorted(hosts):
+            limiter = self._rate_limiters.get(host)
+            rate, burst = self._rate_limits.get(host, (0.0, 1.0))
+            result[host] = {
+                "breaker": self.breaker(host).stats(),
+                "limiter": limiter.stats() if limiter else {"rate": rate, "capacity": burst,
+                                                            "tokens": burst, "queued": 0},
+                "active": self._active.get(host, 0),
+            }
+        return result
+
+    async def get_with_retry(self, url: str, params: Optional[Dict] = None,
+                             headers: Optional[Dict] = None, retries: int = 3,
+                             backoff: float = 0.5) -> httpx.Response:
+        """发送GET请求，遇到429/5xx或网络错误时按带抖动的指数退避重试
+
+        优先使用上游返回的Retry-After；Retry-After超过max_backoff、或重试用尽时
+        返回最后一次的响应（或抛出网络错误），由调用方决定如何处理（例如退回过期缓存）。
+        主机熔断时不再重试，立即抛出CircuitOpenError。
+        """
+        attempt = 0
+        while True:
+            try:
+                response = await self.get(url, params=params, headers=headers)
+            except CircuitOpenError:
+                raise
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+                delay = self._backoff_delay(backoff, attempt)
+            else:
+                if response.status_code not in RETRYABLE_STATUS or attempt >= retries:
+                    return response
+                delay = self._retry_delay(response, backoff, attempt)
+                if delay is None:
+                    return response
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+        self._host_limits = {}
+        self._rate_limiters = {}
+
+
+_shared_client: Optional[AsyncHTTPClient] = None
+_shared_flight: Optional[SingleFlight] = None
+
+
+def get_http_client() -> AsyncHTTPClient:
+    """获取进程内共享的HTTP客户端"""
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = AsyncHTTPClient()
+    return _shared_client
+
+
+def get_single_flight() -> SingleFlight:
+    """获取进程内共享的请求合并器"""
+    global _shared_flight
+    if _shared_flight is None:
+        _shared_flight = SingleFlight()
+    return _shared_flight
+
+
+async def close_http_client():
+    """关闭共享的HTTP客户端（服务器退出时调用）"""
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
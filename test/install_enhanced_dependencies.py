@@ -23,7 +23,7 @@ def main():
     
     # 必需的依赖项
     dependencies = [
-        "requests",  # HTTP请求库
+        "httpx",     # 异步HTTP请求库（连接池）
         "mcp",       # MCP协议支持
     ]
     
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试用的替身上游 - 用MockTransport代替arXiv、Crossref等外部服务
+
+在临时目录中换上新的共享HTTP客户端、请求合并器、响应缓存和引用图缓存，
+退出时关闭临时缓存并恢复原来的对象和环境变量，各测试只需提供自己的handler。
+"""
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import httpx
+
+# 添加项目根目录到Python路径，以便导入参考文献管理工具的模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import citation_graph
+import reference_cache
+import reference_http
+from citation_graph import CitationGraph
+from reference_http import AsyncHTTPClient, HTTPConfig, SingleFlight
+
+
+@contextmanager
+def fake_upstream(handler, env=None, config=None):
+    """用handler响应所有上游请求，返回临时目录
+
+    默认把ARXIV_REQUEST_INTERVAL设为0，测试不必等待arXiv的请求间隔；env中的变量覆盖默认值。
+    """
+    env = {"ARXIV_REQUEST_INTERVAL": "0", **(env or {})}
+    saved_env = {name: os.environ.get(name) for name in env}
+    saved = (reference_http._shared_client, reference_http._shared_flight, reference_cache._shared_cache,
+             citation_graph._shared_graph)
+    with tempfile.TemporaryDirectory() as tmp:
+        reference_http._shared_client = AsyncHTTPClient(config or HTTPConfig(),
+                                                         transport=httpx.MockTransport(handler))
+        reference_http._shared_flight = SingleFlight()
+        reference_cache._shared_cache = reference_cache.ResponseCache(os.path.join(tmp, "cache.sqlite3"))
+        citation_graph._shared_graph = CitationGraph(os.path.join(tmp, "graph.sqlite3"))
+        os.environ.update(env)
+        try:
+            yield tmp
+        finally:
+            reference_cache._shared_cache.close()
+            citation_graph._shared_graph.close()
+            (reference_http._shared_client, reference_http._shared_flight, reference_cache._shared_cache,
+             citation_graph._shared_graph) = saved
+            for name, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试arXiv请求 - 批量详情按id_list分块并匹配带/不带版本号的ID，搜索结果按页拉取和page_token翻页，
+以及跨块边界的增量Atom解析
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+
+import httpx
+
+# 添加项目根目录到Python路径，以便导入thesis_reference_manager模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import reference_http
+from fake_upstream import fake_upstream
+from thesis_reference_manager import (
+    _decode_page_token, _iter_arxiv_feed, aclosing, get_arxiv_details_batch, iter_arxiv_search, search_papers_arxiv
+)
+
+# 替身arXiv中的论文：基础ID -> 最新版本号
+VERSIONS = {"1706.03762": 5, "1810.04805": 2, "1512.03385": 1, "hep-th/9901001": 3}
+# 替身arXiv搜索的结果总数
+SEARCH_TOTAL = 230
+
+
+def arxiv_entry(arxiv_id, title):
+    return (f"<entry><id>http://arxiv.org/abs/{arxiv_id}</id><published>2017-06-12T17:57:34Z</published>"
+            f"<title>{title}</title><summary>Summary of {arxiv_id}.</summary>"
+            f"<author><name>Author {arxiv_id}</name></author></entry>")
+
+
+def atom_feed(entries, total=None):
+    head = ('<?xml version="1.0" encoding="UTF-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom" '
+            'xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">')
+    if total is not None:
+        head += f"<opensearch:totalResults>{total}</opensearch:totalResults>"
+    return (head + "".join(entries) + "</feed>").encode()
+
+
+def id_list_feed(id_list):
+    """与arXiv一致：返回的ID总是带版本号，未知ID返回标题为Error的条目"""
+    entries = []
+    for paper_id in id_list.split(","):
+        base, version = re.match(r"(.+?)(v\d+)?$", paper_id).groups()
+        if base in VERSIONS:
+            entries.append(arxiv_entry(base + (version or f"v{VERSIONS[base]}"), f"Paper {base}"))
+        else:
+            entries.append(arxiv_entry(paper_id, "Error"))
+    return atom_feed(entries)
+
+
+def search_feed(start, size):
+    entries = [arxiv_entry(f"2101.{i:05d}v1", f"Result {i}") for i in range(start, min(start + size, SEARCH_TOTAL))]
+    return atom_feed(entries, SEARCH_TOTAL)
+
+
+def run_with_fake_arxiv(scenario):
+    """用MockTransport代替arXiv，返回(场景结果, 每次请求的查询参数)"""
+    requests = []
+
+    def handler(request):
+        params = dict(request.url.params)
+        requests.append(params)
+        if "id_list" in params:
+            return httpx.Response(200, content=id_list_feed(params["id_list"]))
+        return httpx.Response(200, content=search_feed(int(params["start"]), int(params["max_results"])))
+
+    with fake_upstream(handler):
+        result = asyncio.run(scenario())
+    return result, requests
+
+
+def test_batch_details_chunked_id_list():
+    """按chunk_size分块请求；带版本号的ID精确匹配，不带版本号的按基础ID匹配到最新版本"""
+    ids = ["1706.03762", "arXiv:1810.04805v1", "https://arxiv.org/abs/1512.03385v1",
+           "hep-th/9901001", "2101.99999", "not-an-id", "1706.03762"]
+
+    async def scenario():
+        return json.loads((await get_arxiv_details_batch(ids, chunk_size=2))[0].text)
+
+    response, requests = run_with_fake_arxiv(scenario)
+    assert [r["id_list"] for r in requests] == ["1706.03762,1810.04805v1", "1512.03385v1,hep-th/9901001",
+                                                "2101.99999"]
+    assert requests[0]["max_results"] == "2"
+    statuses = {r["id"]: r["status"] for r in response["results"]}
+    assert statuses == {"1706.03762": "ok", "1810.04805v1": "ok", "1512.03385v1": "ok",
+                        "hep-th/9901001": "ok", "2101.99999": "not_found", "not-an-id": "invalid_id"}
+    papers = {r["id"]: r["paper"] for r in response["results"] if r["status"] == "ok"}
+    assert papers["1706.03762"]["arxiv_id"] == "1706.03762v5"
+    assert papers["1810.04805v1"]["arxiv_id"] == "1810.04805v1"
+    assert papers["hep-th/9901001"]["arxiv_id"] == "hep-th/9901001v3"
+    assert response["requested"] == 6 and response["found"] == 4
+    assert response["missing"] == ["2101.99999", "not-an-id"]
+    print("✓ 批量详情分块请求并匹配版本号")
+
+
+def test_output_file_fetches_all_pages():
+    """指定output_file时按页拉取全部结果，逐条写入JSON Lines"""
+    with tempfile.TemporaryDirectory() as tmp:
+        output_file = os.path.join(tmp, "results.jsonl")
+
+        async def scenario():
+            complete = json.loads((await search_papers_arxiv("graph", 300, output_file=output_file,
+                                                             output_format="json"))[0].text)
+            with open(output_file, encoding="utf-8") as f:
+                lines = [json.loads(line) for line in f]
+            partial = json.loads((await search_papers_arxiv("graph", 150, start=20, output_file=output_file,
+                                                            output_format="json"))[0].text)
+            return complete, lines, partial
+
+        (complete, lines, partial), requests = run_with_fake_arxiv(scenario)
+    assert [(r["start"], r["max_results"]) for r in requests[:3]] == [("0", "100"), ("100", "100"), ("200", "100")]
+    assert complete["written"] == SEARCH_TOTAL and "next_page_token" not in complete
+    assert [line["arxiv_id"] for line in lines] == [f"2101.{i:05d}v1" for i in range(SEARCH_TOTAL)]
+    # 只取150条时在第二页中途停止，返回从第170条继续的令牌
+    assert [(r["start"], r["max_results"]) for r in requests[3:]] == [("20", "100"), ("120", "50")]
+    assert partial["written"] == 150 and _decode_page_token("graph", partial["next_page_token"]) == 170
+    print("✓ output_file按页拉取全部结果")
+
+
+def test_page_token_round_trip():
+    """page_token从上一页的末尾继续；其他查询的令牌和损坏的令牌被拒绝"""
+    async def scenario():
+        first = json.loads((await search_papers_arxiv("graph", 10, output_format="json"))[0].text)
+        second = json.loads((await search_papers_arxiv("graph", 10, page_token=first["next_page_token"],
+                                                       output_format="json"))[0].text)
+        foreign = (await search_papers_arxiv("transformer", 10, page_token=first["next_page_token"]))[0].text
+        broken = (await search_papers_arxiv("graph", 10, page_token="not-a-token"))[0].text
+        return first, second, foreign, broken
+
+    (first, second, foreign, broken), requests = run_with_fake_arxiv(scenario)
+    assert first["total"] == SEARCH_TOTAL and first["results"][-1]["arxiv_id"] == "2101.00009v1"
+    assert second["start"] == 10 and second["results"][0]["arxiv_id"] == "2101.00010v1"
+    assert "page_token与当前查询词不匹配" in foreign and "无效的page_token" in broken
+    # 被拒绝的令牌不会访问上游
+    assert [r["start"] for r in requests] == ["0", "10"]
+    print("✓ page_token往返并校验查询词")
+
+
+def test_feed_parsed_across_chunk_boundaries():
+    """响应按7字节切块（包括切断多字节字符）时结果不变，且每个entry解析完就立即产出"""
+    entries = [arxiv_entry(f"2101.{i:05d}v1", f"Graph Über Netzwerke {i}") for i in range(3)]
+    body = atom_feed(entries, 3)
+    pieces = [body[i:i + 7] for i in range(0, len(body), 7)]
+    fed = []
+
+    async def chunks():
+        for piece in pieces:
+            fed.append(piece)
+            yield piece
+
+    async def scenario():
+        meta = {}
+        seen = []
+        async for paper in _iter_arxiv_feed(chunks(), meta):
+            seen.append((paper, len(fed)))
+        return seen, meta
+
+    seen, meta = asyncio.run(scenario())
+    assert [paper["title"] for paper, _ in seen] == [f"Graph Über Netzwerke {i}" for i in range(3)]
+    assert meta["total"] == 3 and seen[0][0]["authors"] == ["Author 2101.00000v1"]
+    # 第一条在读完整个响应之前就已产出
+    assert seen[0][1] < seen[1][1] < len(pieces)
+    print("✓ 跨块边界增量解析Atom")
+
+
+def test_early_stop_closes_stream():
+    """调用方提前停止时响应流立即关闭，同一查询的请求合并登记随之释放"""
+    async def scenario():
+        async with aclosing(iter_arxiv_search("graph", 300)) as papers:
+            async for paper in papers:
+                break
+        # 请求合并登记在完成回调中移除，让事件循环先执行一轮
+        await asyncio.sleep(0)
+        client = reference_http._shared_client
+        return paper, reference_http._shared_flight.stats(), client.status()["export.arxiv.org"]["active"]
+
+    (paper, flight, active), requests = run_with_fake_arxiv(scenario)
+    assert paper["arxiv_id"] == "2101.00000v1" and len(requests) == 1
+    assert flight["in_flight"] == 0 and active == 0
+    print("✓ 提前停止时关闭响应流")
+
+
+if __name__ == "__main__":
+    test_batch_details_chunked_id_list()
+    test_output_file_fetches_all_pages()
+    test_page_token_round_trip()
+    test_feed_parsed_across_chunk_boundaries()
+    test_early_stop_closes_stream()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试引用图展开 - 广度优先、节点预算、入度排序，以及重复展开时读取本地图缓存
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+# 添加项目根目录到Python路径，以便导入thesis_reference_manager模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from fake_upstream import fake_upstream
+from thesis_reference_manager import build_citation_graph, expand_citation_graph
+
+# A 引用 B、C；B 引用 C、D；C 引用 D；D 没有参考文献
+REFERENCES = {
+    "10.1000/a": ["10.1000/b", "10.1000/c"],
+    "10.1000/b": ["10.1000/c", "10.1000/d"],
+    "10.1000/c": ["10.1000/d"],
+    "10.1000/d": [],
+}
+# OpenCitations 中引用 D 的文献（新版接口的标识符格式）
+CITED_BY = {"10.1000/d": ["omid:br/0601 doi:10.1000/b", "omid:br/0602 doi:10.1000/c pmid:123"]}
+
+
+def crossref_work(doi):
+    return {"message": {"DOI": doi, "title": [f"Paper {doi[-1].upper()}"], "issued": {"date-parts": [[2020]]},
+                        "reference": [{"key": "ref1", "DOI": ref.upper(), "year": "2019"}
+                                      for ref in REFERENCES[doi]] + [{"key": "ref2", "unstructured": "No DOI"}]}}
+
+
+def run_with_fake_upstream(scenario):
+    """用MockTransport代替Crossref和OpenCitations，返回(场景结果, 上游请求URL列表)"""
+    requests = []
+
+    def handler(request):
+        requests.append(str(request.url))
+        path = request.url.path
+        if request.url.host == "api.crossref.org":
+            return httpx.Response(200, content=json.dumps(crossref_work(path.split("/works/")[1])).encode())
+        doi = path.split("/citations/")[1]
+        return httpx.Response(200, content=json.dumps([{"citing": c, "cited": doi}
+                                                       for c in CITED_BY.get(doi, [])]).encode())
+
+    with fake_upstream(handler):
+        result = asyncio.run(scenario())
+    return result, requests
+
+
+def test_breadth_first_expansion_and_ranking():
+    """两层展开得到完整子图，按入度排序；节点预算限制子图大小"""
+    async def scenario():
+        full = await build_citation_graph(["https://doi.org/10.1000/A"], depth=2)
+        limited = await build_citation_graph(["10.1000/a"], depth=2, max_nodes=2)
+        return full, limited
+
+    (full, limited), requests = run_with_fake_upstream(scenario)
+    assert [node["doi"] for node in full["nodes"]] == ["10.1000/c", "10.1000/d", "10.1000/b", "10.1000/a"]
+    assert [node["in_degree"] for node in full["nodes"]] == [2, 2, 1, 0]
+    assert sorted(map(tuple, full["edges"])) == [("10.1000/a", "10.1000/b"), ("10.1000/a", "10.1000/c"),
+                                                 ("10.1000/b", "10.1000/c"), ("10.1000/b", "10.1000/d"),
+                                                 ("10.1000/c", "10.1000/d")]
+    assert full["nodes"][-1]["title"] == "Paper A" and full["nodes"][0]["year"] == 2020
+    # 第二层的B、C已展开，第三层的D未展开；没有DOI的参考文献不进入图
+    assert full["stats"]["fetched"] == 3 and len(requests) == 3
+    # 第二次展开全部来自本地图缓存
+    assert limited["stats"] == {"fetched": 0, "from_cache": 1, "errors": {}}
+    assert limited["truncated"] and len(limited["nodes"]) == 2
+    print("✓ 广度优先展开、节点预算和入度排序正常")
+
+
+def test_cited_by_and_incremental_cache():
+    """被引方向使用OpenCitations；再次展开更深一层时只请求新节点"""
+    async def scenario():
+        cited = json.loads((await expand_citation_graph(["10.1000/d"], direction="cited_by",
+                                                        output_format="json"))[0].text)
+        first = await build_citation_graph(["10.1000/a"], depth=1)
+        deeper = await build_citation_graph(["10.1000/a"], depth=2)
+        text = (await expand_citation_graph(["10.1000/a"], depth=2))[0].text
+        return cited, first, deeper, text
+
+    (cited, first, deeper, text), requests = run_with_fake_upstream(scenario)
+    assert {node["doi"] for node in cited["nodes"]} == {"10.1000/b", "10.1000/c", "10.1000/d"}
+    assert cited["nodes"][0] == {"doi": "10.1000/d", "depth": 0, "in_degree": 2, "out_degree": 0}
+    assert first["stats"]["fetched"] == 1
+    assert deeper["stats"]["fetched"] == 2 and deeper["stats"]["from_cache"] == 1
+    assert "请求上游 0 次" in text and "1. Paper C (2020)" in text
+    assert sum("opencitations" in url for url in requests) == 1 and len(requests) == 4
+    print("✓ 被引展开和增量图缓存正常")
+
+
+if __name__ == "__main__":
+    test_breadth_first_expansion_and_ranking()
+    test_cited_by_and_incremental_cache()
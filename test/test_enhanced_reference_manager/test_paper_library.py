@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试工作区论文库 - 保存时按arXiv ID/DOI合并、领域标签、全文检索和导出
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+# 添加项目根目录到Python路径，以便导入thesis_reference_manager模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from paper_dedup import dedupe_records, paper_year
+from paper_library import PaperLibrary, tokenize
+from thesis_reference_manager import export_library, query_library, save_search_results, search_local_library
+
+ARXIV_RESULTS = [
+    {
+        "title": "Attention Is All You Need",
+        "authors": ["Ashish Vaswani", "Noam Shazeer"],
+        "published": "2017-06-12T17:57:34Z",
+        "summary": "The dominant sequence transduction models are based on recurrent networks.",
+        "arxiv_id": "1706.03762v1",
+        "url": "http://arxiv.org/abs/1706.03762v1",
+        "source": "arxiv",
+    },
+    {
+        "title": "Deep Residual Learning for Image Recognition",
+        "authors": ["Kaiming He", "Xiangyu Zhang"],
+        "published": "2015-12-10T19:51:55Z",
+        "summary": "Deeper neural networks are more difficult to train.",
+        "arxiv_id": "1512.03385v1",
+        "url": "http://arxiv.org/abs/1512.03385v1",
+        "source": "arxiv",
+    },
+]
+
+
+def test_save_upserts_and_tags_domains():
+    """同一篇论文的新版本和其他来源合并为一条记录，领域标签累加"""
+    with tempfile.TemporaryDirectory() as workspace:
+        result = asyncio.run(save_search_results(ARXIV_RESULTS, "nlp", user_workspace=workspace,
+                                                 export_files=False))
+        assert "新增 2" in result[0].text
+        assert not os.path.exists(os.path.join(workspace, "references", "nlp"))
+
+        newer = dict(ARXIV_RESULTS[0], arxiv_id="1706.03762v5", url="http://arxiv.org/abs/1706.03762v5")
+        crossref = {"title": "Attention Is All You Need", "authors": ["Ashish Vaswani"], "year": 2017,
+                    "doi": "10.5555/3295222.3295349", "journal": "NeurIPS", "source": "crossref"}
+        result = asyncio.run(save_search_results([newer], "transformers", user_workspace=workspace))
+        assert "合并 1" in result[0].text
+        assert os.path.isdir(os.path.join(workspace, "references", "transformers"))
+
+        library = PaperLibrary.open(os.path.join(workspace, "references"))
+        try:
+            assert library.count() == 2
+            paper = library.search("attention")[0]
+            assert paper["url"].endswith("v5")
+            assert paper["domains"] == ["nlp", "transformers"]
+            # Crossref上的正式版本按标题/作者并入arXiv预印本，之后可按DOI直接命中
+            library.upsert_many([crossref], "nlp")
+            assert library.count() == 2 and library.near_duplicates == 1
+            library.upsert_many([dict(crossref, doi="https://doi.org/10.5555/3295222.3295349")], "venues")
+            assert library.count() == 2 and library.near_duplicates == 1
+            paper = library.search("attention")[0]
+            assert paper["doi"].endswith("10.5555/3295222.3295349") and paper["arxiv_id"] == "1706.03762v5"
+            assert paper["sources"] == ["arxiv", "crossref"]
+            assert library.domains() == {"nlp": 2, "transformers": 1, "venues": 1}
+        finally:
+            library.close()
+    print("✓ 论文库按arXiv ID/DOI和近似重复合并并累加领域标签")
+
+
+def test_doi_owned_by_another_record():
+    """合并时带来的DOI已属于另一条记录时保留原DOI，整批保存不会因唯一约束回滚"""
+    with tempfile.TemporaryDirectory() as workspace:
+        asyncio.run(save_search_results([ARXIV_RESULTS[0], {"title": "Some Other Paper", "doi": "10.1000/x",
+                                                            "authors": ["Someone Else"], "source": "crossref"}],
+                                        "nlp", user_workspace=workspace, export_files=False))
+        result = asyncio.run(save_search_results([dict(ARXIV_RESULTS[0], doi="10.1000/x"), ARXIV_RESULTS[1]],
+                                                 "nlp", user_workspace=workspace, export_files=False))
+        assert "新增 1" in result[0].text and "合并 1" in result[0].text
+
+        library = PaperLibrary.open(os.path.join(workspace, "references"))
+        try:
+            assert library.count() == 3
+            assert not library.search("attention")[0].get("doi")
+            assert library.search("other")[0]["doi"] == "10.1000/x"
+        finally:
+            library.close()
+    print("✓ 已被占用的DOI不会导致保存失败")
+
+
+def test_query_and_export():
+    """全文检索按领域过滤，导出的JSON可以重新读取"""
+    with tempfile.TemporaryDirectory() as workspace:
+        asyncio.run(save_search_results(ARXIV_RESULTS[:1], "nlp", user_workspace=workspace, export_files=False))
+        asyncio.run(save_search_results(ARXIV_RESULTS[1:], "vision", user_workspace=workspace, export_files=False))
+
+        text = asyncio.run(query_library("residual", user_workspace=workspace))[0].text
+        assert "Deep Residual Learning" in text and "Attention" not in text
+        text = asyncio.run(query_library("", domain="nlp", user_workspace=workspace))[0].text
+        assert "匹配 1 篇" in text and "Attention" in text
+
+        asyncio.run(export_library("all.json", user_workspace=workspace))
+        with open(os.path.join(workspace, "all.json"), encoding="utf-8") as f:
+            exported = json.load(f)
+        assert {paper["arxiv_id"] for paper in exported} == {"1706.03762v1", "1512.03385v1"}
+
+        asyncio.run(export_library("vision.bib", format="bibtex", domain="vision", user_workspace=workspace))
+        with open(os.path.join(workspace, "vision.bib"), encoding="utf-8") as f:
+            bibtex = f.read()
+        assert bibtex.count("@article") == 1 and "Residual" in bibtex
+    print("✓ 论文库检索和导出正常")
+
+
+def test_near_duplicate_detection():
+    """标题写法不同的同一篇论文被合并，标题相近但作者、ID不同的论文保持独立"""
+    records = [
+        {"title": "BERT: Pre-training of Deep Bidirectional Transformers for Language Understanding",
+         "authors": ["Jacob Devlin", "Ming-Wei Chang"], "published": "2018-10-11", "arxiv_id": "1810.04805v2",
+         "source": "arxiv"},
+        {"title": "{BERT}: pre-training of deep bidirectional transformers for language understanding.",
+         "authors": ["Devlin, Jacob", "Chang, Ming-Wei", "Lee, Kenton"], "year": 2019,
+         "doi": "10.18653/v1/N19-1423", "source": "crossref"},
+        {"title": "BERT: Pre-training of Deep Bidirectional Transformers for Language Understanding",
+         "authors": ["Someone Else"], "year": 2018, "arxiv_id": "1999.99999", "source": "arxiv"},
+        {"title": "Deep Residual Learning for Image Recognition", "authors": ["Kaiming He"], "year": 2016,
+         "source": "crossref"},
+    ]
+    merged, count = dedupe_records(records)
+    assert count == 1 and len(merged) == 3
+    assert merged[0]["doi"] == "10.18653/v1/N19-1423" and len(merged[0]["authors"]) == 3
+
+    with tempfile.TemporaryDirectory() as workspace:
+        # 先保存大量无关论文，新增论文只与同桶候选比较
+        library = PaperLibrary.open(os.path.join(workspace, "references"))
+        try:
+            library.upsert_many([{"title": f"Unrelated study number {i} on topic {i * 7}",
+                                  "authors": [f"Author {i}"], "year": 2020, "source": "crossref"}
+                                 for i in range(200)], "misc")
+            inserted, updated = library.upsert_many(records, "nlp")
+            assert (inserted, updated) == (3, 1)
+            assert library.count() == 203
+        finally:
+            library.close()
+    print("✓ 近似重复检测正常")
+
+
+def test_bm25_local_search():
+    """BM25检索支持中英文混合，增量索引新保存的论文和旧的导出文件"""
+    assert tokenize("基于Transformer的图像分割") == [
+        "基", "于", "基于", "transformer", "的", "图", "像", "分", "割", "的图", "图像", "像分", "分割"]
+
+    chinese = {"title": "基于深度学习的医学图像分割方法综述", "authors": ["张三", "李四"], "year": 2022,
+               "summary": "本文综述了卷积神经网络和Transformer在医学图像分割中的应用。", "source": "crossref",
+               "doi": "10.1234/cn.2022.001"}
+    with tempfile.TemporaryDirectory() as workspace:
+        asyncio.run(save_search_results(ARXIV_RESULTS, "深度学习", user_workspace=workspace, export_files=False))
+        asyncio.run(save_search_results([chinese], "医学影像", user_workspace=workspace, export_files=False))
+
+        text = asyncio.run(search_local_library("图像分割 sequence transduction", user_workspace=workspace))[0].text
+        assert "匹配 2 篇" in text
+        assert text.index("医学图像分割") < text.index("Attention Is All You Need")
+
+        # 领域名也可以作为检索词（单字"学"也会命中"深度学习"，但排在后面）
+        text = asyncio.run(search_local_library("医学影像", user_workspace=workspace))[0].text
+        assert text.index("医学图像分割") < text.index("Residual")
+        text = asyncio.run(search_local_library("residual networks", domain="深度学习",
+                                                user_workspace=workspace))[0].text
+        assert text.index("Deep Residual Learning") < text.index("Attention Is All You Need")
+
+        # 功能上线前按领域导出的JSON文件在检索时并入，之后不再重复导入
+        legacy_dir = os.path.join(workspace, "references", "legacy")
+        os.makedirs(legacy_dir)
+        with open(os.path.join(legacy_dir, "papers_20240101_000000.json"), "w", encoding="utf-8") as f:
+            json.dump([{"title": "Graph Attention Networks", "authors": ["Petar Velickovic"],
+                        "published": "2017-10-30", "arxiv_id": "1710.10903", "source": "arxiv"}], f)
+        text = asyncio.run(search_local_library("graph attention", user_workspace=workspace))[0].text
+        assert "并入 1 条" in text and text.index("Graph Attention Networks") < text.index("Attention Is All")
+        text = asyncio.run(search_local_library("graph attention", user_workspace=workspace))[0].text
+        assert "并入" not in text
+    print("✓ 本地BM25检索正常")
+
+
+def test_paper_year():
+    """合并、论文库和导出共用的年份解析：空的year退回到published，无法解析时为None"""
+    assert paper_year({"year": 2019, "published": "2018-10-11"}) == 2019
+    assert paper_year({"year": "", "published": "2018-10-11T00:50:01Z"}) == 2018
+    assert paper_year({"year": None}) is None and paper_year({"year": 0}) is None
+    assert paper_year({"year": "n.d.", "published": "2018"}) is None
+    print("✓ 年份解析一致")
+
+
+if __name__ == "__main__":
+    test_save_upserts_and_tags_domains()
+    test_doi_owned_by_another_record()
+    test_query_and_export()
+    test_near_duplicate_detection()
+    test_bm25_local_search()
+    test_paper_year()
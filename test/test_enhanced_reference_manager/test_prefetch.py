@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试搜索后的后台预取 - 详情查询命中本地缓存、时间预算和繁忙时取消
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+# 添加项目根目录到Python路径，以便导入thesis_reference_manager模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import reference_cache
+import thesis_reference_manager
+from fake_upstream import fake_upstream
+from reference_cache import make_cache_key
+from thesis_reference_manager import ARXIV_API_URL, call_tool, get_paper_details, schedule_prefetch, search_papers_arxiv
+
+SEARCH_FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+  <opensearch:totalResults>3</opensearch:totalResults>
+  <entry><id>http://arxiv.org/abs/1706.03762v5</id><published>2017-06-12T17:57:34Z</published>
+    <title>Attention Is All You Need</title><summary>The dominant sequence models.</summary>
+    <author><name>Ashish Vaswani</name></author><author><name>Noam Shazeer</name></author></entry>
+  <entry><id>http://arxiv.org/abs/1810.04805v2</id><published>2018-10-11T00:50:01Z</published>
+    <title>BERT: Pre-training of Deep Bidirectional Transformers</title><summary>We introduce BERT &amp; more.</summary>
+    <author><name>Jacob Devlin</name></author></entry>
+  <entry><id>http://arxiv.org/abs/1512.03385v1</id><published>2015-12-10T19:51:55Z</published>
+    <title>Deep Residual Learning</title><summary>Deeper networks.</summary>
+    <author><name>Kaiming He</name></author></entry>
+</feed>"""
+
+CROSSREF_WORK = {"message": {"DOI": "10.1109/cvpr.2016.90", "title": ["Deep Residual Learning"],
+                             "author": [{"given": "Kaiming", "family": "He"}], "issued": {"date-parts": [[2016]]}}}
+
+
+def run_with_fake_upstream(scenario, crossref_delay=0.0, env=None):
+    """用MockTransport代替arXiv/Crossref，返回(场景结果, 上游请求URL列表)"""
+    requests = []
+
+    async def handler(request):
+        requests.append(str(request.url))
+        if request.url.host == "api.crossref.org":
+            await asyncio.sleep(crossref_delay)
+            return httpx.Response(200, content=json.dumps(CROSSREF_WORK).encode())
+        return httpx.Response(200, content=SEARCH_FEED)
+
+    with fake_upstream(handler, env):
+        result = asyncio.run(scenario())
+    return result, requests
+
+
+async def wait_for_prefetch():
+    while thesis_reference_manager._prefetch_tasks:
+        await asyncio.sleep(0.01)
+
+
+def test_prefetched_details_are_served_locally():
+    """搜索时预取前2条，随后的详情查询不再访问arXiv，第3条仍需请求"""
+    async def scenario():
+        text = (await search_papers_arxiv("attention", 3, prefetch=2))[0].text
+        assert "预取前 2 条" in text
+        await wait_for_prefetch()
+        # 预取写入的是改写后的搜索结果，带版本号的ID也不永久缓存
+        expires = dict(reference_cache._shared_cache._conn.execute("SELECT key, expires FROM responses"))
+        assert expires[make_cache_key(ARXIV_API_URL, {"id_list": "1706.03762v5"})] is not None
+        details = [(await get_paper_details(paper_id, "arxiv"))[0].text
+                   for paper_id in ("1706.03762v5", "1810.04805", "1810.04805v2")]
+        await get_paper_details("1512.03385v1", "arxiv")
+        return details
+
+    details, requests = run_with_fake_upstream(scenario)
+    assert "Attention Is All You Need" in details[0] and "Ashish Vaswani, Noam Shazeer" in details[0]
+    assert "We introduce BERT & more." in details[1] and "@article{devlin2018bert" in details[1]
+    # 1次搜索 + 第3条未预取的详情查询
+    assert len(requests) == 2 and "1512.03385" in requests[1]
+    print("✓ 预取后的详情查询直接读取本地缓存")
+
+
+def test_prefetch_budget_and_busy_cancel():
+    """Crossref结果在时间预算内获取；服务器繁忙时取消进行中的预取"""
+    doi_paper = {"title": "Deep Residual Learning", "doi": "10.1109/CVPR.2016.90", "source": "crossref"}
+
+    async def over_budget():
+        before = dict(thesis_reference_manager._prefetch_stats)
+        assert schedule_prefetch([doi_paper], 1) == 1
+        await wait_for_prefetch()
+        return before, dict(thesis_reference_manager._prefetch_stats)
+
+    (before, after), requests = run_with_fake_upstream(over_budget, crossref_delay=1.0,
+                                                       env={"THESIS_PREFETCH_BUDGET": "0.1"})
+    assert after["timed_out"] == before["timed_out"] + 1 and after["fetched"] == before["fetched"]
+
+    async def busy():
+        before = dict(thesis_reference_manager._prefetch_stats)
+        assert schedule_prefetch([doi_paper], 1) == 1
+        await asyncio.sleep(0.05)
+        # 繁忙阈值为0：任何新的工具调用都会取消预取
+        await call_tool("get_cache_stats", {})
+        await wait_for_prefetch()
+        return before, dict(thesis_reference_manager._prefetch_stats)
+
+    (before, after), _ = run_with_fake_upstream(busy, crossref_delay=1.0, env={"THESIS_PREFETCH_BUSY_CALLS": "0"})
+    assert after["cancelled"] == before["cancelled"] + 1
+
+    async def quick():
+        schedule_prefetch([doi_paper], 1)
+        await wait_for_prefetch()
+        return (await get_paper_details("10.1109/CVPR.2016.90", "doi"))[0].text
+
+    text, requests = run_with_fake_upstream(quick)
+    assert "Deep Residual Learning" in text and len(requests) == 1
+    print("✓ 预取遵守时间预算，繁忙时取消")
+
+
+if __name__ == "__main__":
+    test_prefetched_details_are_served_locally()
+    test_prefetch_budget_and_busy_cancel()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试参考文献导出 - BibTeX转义、作者-年份-标题键的去重与持久化、CSL-JSON和逐条写出
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+
+# 添加项目根目录到Python路径，以便导入thesis_reference_manager模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from reference_export import (
+    ExportRecord, KeyAllocator, bibtex_escape, citation_key_base, render_bibtex, render_csl, write_records
+)
+from thesis_reference_manager import export_library, save_search_results
+
+RESNET = {"title": "Deep Residual Learning for Image Recognition", "authors": ["Kaiming He", "Xiangyu Zhang"],
+          "year": 2016, "doi": "10.1109/CVPR.2016.90", "journal": "CVPR", "type": "proceedings-article",
+          "source": "crossref"}
+RESNET_V2 = {"title": "Deep Residual Networks with 1000 Layers", "authors": ["Kaiming He"], "year": 2016,
+             "doi": "10.1007/978-3-319-46493-0_38", "source": "crossref"}
+
+
+def test_keys_and_escaping():
+    assert citation_key_base({"title": "The Élan of Graph_Networks", "authors": ["Müller, Jörg"],
+                              "published": "2021-03-01"}) == "muller2021elan"
+    assert citation_key_base({"title": "基于深度学习的图像分割", "authors": ["张三"]}) == "anon"
+    allocator = KeyAllocator()
+    assert [allocator.allocate(RESNET), allocator.allocate(RESNET_V2), allocator.allocate(RESNET)] == [
+        "he2016deep", "he2016deepa", "he2016deepb"]
+
+    assert bibtex_escape("R&D {50%} of $x_1$ #1") == r"R\&D \{50\%\} of \$x\_1\$ \#1"
+    entry = render_bibtex(ExportRecord.from_paper(dict(RESNET, title="Residual & Skip_Connections",
+                                                       url="https://example.org/a_b%20c"), "he2016residual"))
+    assert entry.startswith("@inproceedings{he2016residual,")
+    assert r"title={Residual \& Skip\_Connections}" in entry and "booktitle={CVPR}" in entry
+    # URL和DOI原样保留，交给\url处理
+    assert "url={https://example.org/a_b%20c}" in entry and "doi={10.1109/CVPR.2016.90}" in entry
+
+    csl = render_csl(ExportRecord.from_paper(dict(RESNET, authors=["He, Kaiming", "张三"]), "he2016deep"))
+    assert csl["type"] == "paper-conference" and csl["issued"] == {"date-parts": [[2016]]}
+    assert csl["author"] == [{"family": "He", "given": "Kaiming"}, {"literal": "张三"}]
+    print("✓ 键生成和BibTeX转义正常")
+
+
+def test_cjk_keys_use_identifiers():
+    """中文作者的姓氏无法转成ASCII时，用arXiv ID或DOI代替姓氏，不同论文不会都落到anon"""
+    paper = {"title": "基于深度学习的图像分割", "authors": ["张三"], "published": "2021-01-04"}
+    assert citation_key_base(dict(paper, arxiv_id="arXiv:2101.00001v2")) == "arxiv2101000012021"
+    assert citation_key_base(dict(paper, doi="https://doi.org/10.11897/SP.J.1016.2021.00001")) == \
+        "doispj10162021000012021"
+    # 英文标题的实词照常接在年份后面
+    assert citation_key_base({"title": "Graph Networks", "authors": ["李四"], "year": 2020,
+                              "arxiv_id": "hep-th/9901001"}) == "arxivhepth99010012020graph"
+    print("✓ 中文作者的键由DOI或arXiv ID生成")
+
+
+def test_streaming_writer():
+    """写出器逐条写入，输出可被标准JSON解析"""
+    class CountingFile(io.StringIO):
+        writes = 0
+
+        def write(self, text):
+            self.writes += 1
+            return super().write(text)
+
+    records = (ExportRecord.from_paper(dict(RESNET, title=f"Paper {i}"), f"key{i}") for i in range(1000))
+    f = CountingFile()
+    assert write_records(records, f, "csl-json") == 1000
+    assert f.writes > 1000 and len(json.loads(f.getvalue())) == 1000
+    empty = io.StringIO()
+    assert write_records([], empty, "json") == 0 and json.loads(empty.getvalue()) == []
+    print("✓ 写出器逐条写入")
+
+
+def test_keys_are_stable_across_saves():
+    """没有URL的记录也能保存；同一篇论文在多次保存和导出中使用相同的键"""
+    with tempfile.TemporaryDirectory() as workspace:
+        text = asyncio.run(save_search_results([RESNET], "vision", user_workspace=workspace))[0].text
+        assert "✅" in text
+        asyncio.run(save_search_results([RESNET_V2, RESNET], "vision", user_workspace=workspace))
+        bib_files = sorted(name for name in os.listdir(os.path.join(workspace, "references", "vision"))
+                           if name.endswith(".bib"))
+        with open(os.path.join(workspace, "references", "vision", bib_files[-1]), encoding="utf-8") as f:
+            latest = f.read()
+        assert "@inproceedings{he2016deep," in latest and "@article{he2016deepa," in latest
+
+        asyncio.run(export_library("all.bib", format="bibtex", user_workspace=workspace))
+        asyncio.run(export_library("all.csl.json", format="csl-json", user_workspace=workspace))
+        with open(os.path.join(workspace, "all.bib"), encoding="utf-8") as f:
+            exported = f.read()
+        with open(os.path.join(workspace, "all.csl.json"), encoding="utf-8") as f:
+            csl = json.load(f)
+        assert exported.count("@") == 2 and "{he2016deep," in exported and "{he2016deepa," in exported
+        assert {item["id"] for item in csl} == {"he2016deep", "he2016deepa"}
+    print("✓ 论文库中的BibTeX键保持稳定")
+
+
+if __name__ == "__main__":
+    test_keys_and_escaping()
+    test_cjk_keys_use_identifiers()
+    test_streaming_writer()
+    test_keys_are_stable_across_saves()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试并发请求合并 - 相同的arXiv查询/DOI同时请求时只访问一次上游
+"""
+
+import asyncio
+import os
+import sys
+
+import httpx
+
+# 添加项目根目录到Python路径，以便导入thesis_reference_manager模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import reference_http
+from fake_upstream import fake_upstream
+from thesis_reference_manager import _fetch_bytes, _stream_bytes
+
+ATOM_FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom"></feed>"""
+
+
+def run_with_fake_upstream(coro_factory, status=200):
+    """用MockTransport代替上游，返回(协程结果, 上游请求列表, 请求合并统计)"""
+    requests = []
+
+    async def handler(request):
+        requests.append(str(request.url))
+        await asyncio.sleep(0.05)
+        return httpx.Response(status, content=ATOM_FEED)
+
+    with fake_upstream(handler):
+        result = asyncio.run(coro_factory())
+        flight = reference_http._shared_flight.stats()
+    return result, requests, flight
+
+
+def test_concurrent_fetches_share_one_request():
+    """5个相同的并发请求只访问一次上游，都拿到同样的结果"""
+    async def scenario():
+        params = {"search_query": "all:attention", "start": 0, "max_results": 10}
+        return await asyncio.gather(*(_fetch_bytes("http://export.arxiv.org/api/query", params)
+                                      for _ in range(5)))
+
+    results, requests, flight = run_with_fake_upstream(scenario)
+    assert results == [ATOM_FEED] * 5
+    assert len(requests) == 1
+    assert flight == {"leaders": 1, "coalesced": 4, "in_flight": 0}
+    print("✓ 相同的并发请求只访问一次上游")
+
+
+def test_errors_are_shared():
+    """上游出错时所有等待者收到同一个异常，之后的请求重新访问上游"""
+    async def scenario():
+        outcomes = await asyncio.gather(*(_fetch_bytes("https://api.crossref.org/works/10.1/x")
+                                          for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(o, httpx.HTTPStatusError) for o in outcomes)
+        await asyncio.gather(_fetch_bytes("https://api.crossref.org/works/10.1/x"), return_exceptions=True)
+
+    _, requests, flight = run_with_fake_upstream(scenario, status=404)
+    assert len(requests) == 2
+    assert flight["coalesced"] == 2 and flight["in_flight"] == 0
+    print("✓ 上游错误共享给所有等待者")
+
+
+def test_concurrent_streams_share_one_request():
+    """相同的流式请求等待第一个请求写入缓存后直接读取"""
+    async def collect():
+        chunks = []
+        async for chunk in _stream_bytes("http://export.arxiv.org/api/query", {"search_query": "all:gnn"}):
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def scenario():
+        return await asyncio.gather(*(collect() for _ in range(4)))
+
+    results, requests, flight = run_with_fake_upstream(scenario)
+    assert results == [ATOM_FEED] * 4
+    assert len(requests) == 1 and flight["coalesced"] == 3
+    print("✓ 相同的流式请求只访问一次上游")
+
+
+if __name__ == "__main__":
+    test_concurrent_fetches_share_one_request()
+    test_errors_are_shared()
+    test_concurrent_streams_share_one_request()
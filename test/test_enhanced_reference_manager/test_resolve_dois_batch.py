@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试批量DOI解析 - 使用本地替身服务器代替api.crossref.org
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目根目录到Python路径，以便导入thesis_reference_manager模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import reference_cache
+from thesis_reference_manager import resolve_dois_batch
+
+
+class FakeCrossrefHandler(BaseHTTPRequestHandler):
+    """模拟Crossref的 /works/{doi} 接口"""
+    
+    attempts = {}
+    user_agents = []
+    
+    def do_GET(self):
+        doi = self.path[len("/works/"):]
+        FakeCrossrefHandler.attempts[doi] = FakeCrossrefHandler.attempts.get(doi, 0) + 1
+        FakeCrossrefHandler.user_agents.append(self.headers.get("User-Agent", ""))
+        
+        if doi.startswith("10.9999/missing"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        if doi == "10.1000/flaky" and FakeCrossrefHandler.attempts[doi] == 1:
+            # 第一次返回429，要求立即重试
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+        
+        body = json.dumps({"message": {
+            "DOI": doi,
+            "title": [f"Paper {doi}"],
+            "author": [{"given": "Ada", "family": "Lovelace"}],
+            "issued": {"date-parts": [[2020, 1, 1]]},
+            "container-title": ["Journal of Tests"]
+        }}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+def _start_server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeCrossrefHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def test_resolve_dois_batch():
+    """结果按输入顺序返回，429会重试，404记为not_found"""
+    httpd = _start_server()
+    tmp_dir = tempfile.mkdtemp()
+    os.environ["CROSSREF_API_BASE"] = f"http://127.0.0.1:{httpd.server_address[1]}"
+    os.environ["CROSSREF_MAILTO"] = "tester@example.com"
+    os.environ["CROSSREF_RATE_LIMIT"] = "100"
+    reference_cache._shared_cache = reference_cache.ResponseCache(os.path.join(tmp_dir, "cache.sqlite3"))
+    
+    try:
+        dois = [f"10.1000/paper{i}" for i in range(20)]
+        dois.insert(5, "https://doi.org/10.1000/FLAKY")
+        dois.insert(10, "10.9999/missing")
+        
+        result = asyncio.run(resolve_dois_batch(dois, concurrency=4))
+        data = json.loads(result[0].text)
+        
+        assert data["requested"] == 22
+        assert [r["doi"] for r in data["results"]] == dois
+        assert data["results"][5]["status"] == "ok"
+        assert data["results"][5]["paper"]["title"] == "Paper 10.1000/flaky"
+        assert data["results"][10]["status"] == "not_found"
+        assert data["failed"] == ["10.9999/missing"]
+        assert FakeCrossrefHandler.attempts["10.1000/flaky"] == 2
+        assert all("mailto:tester@example.com" in ua for ua in FakeCrossrefHandler.user_agents)
+        print("✓ 批量DOI解析功能正常")
+        
+        # 第二次调用应全部来自缓存
+        requests_before = sum(FakeCrossrefHandler.attempts.values())
+        asyncio.run(resolve_dois_batch(dois[:5]))
+        assert sum(FakeCrossrefHandler.attempts.values()) == requests_before
+        print("✓ 重复解析命中缓存")
+    finally:
+        httpd.shutdown()
+        reference_cache._shared_cache = None
+        for name in ("CROSSREF_API_BASE", "CROSSREF_MAILTO", "CROSSREF_RATE_LIMIT"):
+            os.environ.pop(name, None)
+
+
+if __name__ == "__main__":
+    test_resolve_dois_batch()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试本地响应缓存 - TTL过期、按访问时间淘汰到上限的90%、上游不可用和离线模式下的过期条目回退，
+以及带版本号的arXiv ID永久缓存
+"""
+
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import httpx
+
+# 添加项目根目录到Python路径，以便导入reference_cache模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import reference_cache
+from fake_upstream import fake_upstream
+from reference_cache import ResponseCache, make_cache_key
+from thesis_reference_manager import ARXIV_API_URL, OfflineCacheMiss, _fetch_bytes, get_paper_details
+
+DETAIL_FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <entry><id>http://arxiv.org/abs/1706.03762v5</id><published>2017-06-12T17:57:34Z</published>
+    <title>Attention Is All You Need</title><summary>The dominant sequence models.</summary>
+    <author><name>Ashish Vaswani</name></author></entry>
+</feed>"""
+
+
+def test_ttl_expiry():
+    """过期条目默认视为未命中，allow_stale=True时仍可读取"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, "cache.sqlite3"), default_ttl=0.05)
+        cache.put("short", b"a")
+        cache.put("long", b"b", ttl=60)
+        assert cache.get("short") == b"a" and cache.contains("short")
+        time.sleep(0.1)
+        assert cache.get("short") is None and not cache.contains("short")
+        assert cache.get("short", allow_stale=True) == b"a"
+        assert cache.get("long") == b"b"
+        stats = cache.stats()
+        assert (stats["hits"], stats["stale_hits"], stats["misses"]) == (2, 1, 1)
+        cache.close()
+    print("✓ 缓存条目按TTL过期")
+
+
+def test_lru_eviction_to_ninety_percent():
+    """超过上限时按最近访问时间淘汰，直到总大小不超过上限的90%"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite3")
+        cache = ResponseCache(path, max_bytes=1000)
+        for i in range(10):
+            cache.put(f"key{i}", b"x" * 100)
+            time.sleep(0.002)
+        # 最早写入的key0最近被访问过，不应被淘汰
+        assert cache.get("key0") is not None
+        cache.put("key10", b"x" * 100)
+        stats = cache.stats()
+        assert stats["evictions"] == 2 and stats["total_bytes"] == 900 and stats["entries"] == 9
+        assert cache.get("key1") is None and cache.get("key2") is None
+        assert cache.get("key0") is not None and cache.get("key3") is not None
+        cache.close()
+        # 重新打开后总大小从文件中恢复
+        reopened = ResponseCache(path, max_bytes=1000)
+        assert reopened.stats()["total_bytes"] == 900
+        reopened.close()
+    print("✓ 缓存按最近访问时间淘汰到上限的90%")
+
+
+def test_stale_and_offline_fallback():
+    """上游返回5xx时退回过期条目；离线模式只读缓存，未命中时抛出OfflineCacheMiss"""
+    requests = []
+    healthy = {"value": True}
+
+    def handler(request):
+        requests.append(str(request.url))
+        return httpx.Response(200 if healthy["value"] else 503, content=b"fresh")
+
+    url = "https://api.crossref.org/works/10.1000/a"
+
+    async def scenario():
+        assert await _fetch_bytes(url, ttl=0.05) == b"fresh"
+        await asyncio.sleep(0.1)
+        healthy["value"] = False
+        assert await _fetch_bytes(url) == b"fresh"
+        # 没有缓存的请求照常报告上游错误
+        try:
+            await _fetch_bytes("https://api.crossref.org/works/10.1000/b")
+            raise AssertionError("没有缓存时应报告上游错误")
+        except httpx.HTTPStatusError as e:
+            assert e.response.status_code == 503
+
+        os.environ["THESIS_REF_OFFLINE"] = "1"
+        count = len(requests)
+        assert await _fetch_bytes(url) == b"fresh"
+        try:
+            await _fetch_bytes("https://api.crossref.org/works/10.1000/c")
+            raise AssertionError("离线模式下缓存未命中应抛出OfflineCacheMiss")
+        except OfflineCacheMiss:
+            pass
+        assert len(requests) == count
+        return reference_cache._shared_cache.stats()
+
+    with fake_upstream(handler, {"THESIS_REF_OFFLINE": "0"}):
+        stats = asyncio.run(scenario())
+    assert stats["stale_hits"] == 2 and stats["offline"]
+    print("✓ 上游不可用或离线时回退到过期条目")
+
+
+def test_versioned_arxiv_ids_are_permanent():
+    """带版本号的arXiv ID永久缓存，不带版本号的按DOI_CACHE_TTL过期"""
+    def handler(request):
+        return httpx.Response(200, content=DETAIL_FEED)
+
+    async def scenario():
+        await get_paper_details("1706.03762v5", "arxiv")
+        await get_paper_details("1706.03762", "arxiv")
+
+    with fake_upstream(handler) as tmp:
+        asyncio.run(scenario())
+        with sqlite3.connect(os.path.join(tmp, "cache.sqlite3")) as conn:
+            expires = {key: value for key, value in conn.execute("SELECT key, expires FROM responses")}
+    assert expires[make_cache_key(ARXIV_API_URL, {"id_list": "1706.03762v5"})] is None
+    assert expires[make_cache_key(ARXIV_API_URL, {"id_list": "1706.03762"})] > time.time()
+    print("✓ 带版本号的arXiv ID永久缓存")
+
+
+if __name__ == "__main__":
+    test_ttl_expiry()
+    test_lru_eviction_to_ninety_percent()
+    test_stale_and_offline_fallback()
+    test_versioned_arxiv_ids_are_permanent()
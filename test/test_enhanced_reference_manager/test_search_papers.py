@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试联合检索 - 用本地替身代替arXiv、Crossref后端，检查截止时间、合并去重和排序
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径，以便导入thesis_reference_manager模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from thesis_reference_manager import SEARCH_BACKENDS, federated_search, search_papers
+
+ATTENTION_ARXIV = {"title": "Attention Is All You Need", "authors": ["Ashish Vaswani", "Noam Shazeer"],
+                   "published": "2017-06-12T17:57:34Z", "summary": "Transformers.", "arxiv_id": "1706.03762v5",
+                   "url": "http://arxiv.org/abs/1706.03762v5", "source": "arxiv"}
+ATTENTION_CROSSREF = {"title": "Attention is all you need", "authors": ["Ashish Vaswani"], "year": 2017,
+                      "doi": "10.5555/3295222.3295349", "journal": "NeurIPS", "url": "", "source": "crossref"}
+RESNET = {"title": "Deep Residual Learning for Image Recognition", "authors": ["Kaiming He"], "year": 2016,
+          "doi": "10.1109/CVPR.2016.90", "url": "https://doi.org/10.1109/cvpr.2016.90", "source": "crossref"}
+GAT = {"title": "Graph Attention Networks", "authors": ["Petar Velickovic"], "published": "2017-10-30",
+       "arxiv_id": "1710.10903", "url": "http://arxiv.org/abs/1710.10903", "source": "arxiv"}
+
+
+def with_backends(**fakes):
+    """临时替换后端注册表"""
+    def decorator(test):
+        def wrapper():
+            saved = dict(SEARCH_BACKENDS)
+            SEARCH_BACKENDS.clear()
+            SEARCH_BACKENDS.update(fakes)
+            try:
+                test()
+            finally:
+                SEARCH_BACKENDS.clear()
+                SEARCH_BACKENDS.update(saved)
+        wrapper.__name__ = test.__name__
+        return wrapper
+    return decorator
+
+
+async def fake_arxiv(query, limit, options):
+    await asyncio.sleep(0.01)
+    return [GAT, ATTENTION_ARXIV]
+
+
+async def fake_crossref(query, limit, options):
+    await asyncio.sleep(0.02)
+    return [ATTENTION_CROSSREF, RESNET]
+
+
+async def fake_local(query, limit, options):
+    # 本地库中保存的是旧版本号的同一篇论文
+    return [dict(ATTENTION_ARXIV, arxiv_id="1706.03762v1")]
+
+
+async def slow_backend(query, limit, options):
+    await asyncio.sleep(5)
+    return [RESNET]
+
+
+async def broken_backend(query, limit, options):
+    raise RuntimeError("upstream down")
+
+
+@with_backends(arxiv=fake_arxiv, crossref=fake_crossref, local=fake_local)
+def test_merge_and_rank():
+    """同一篇论文的三个来源合并为一条并排在最前"""
+    results, status = asyncio.run(federated_search(
+        "attention", 10, options={"user_workspace": "/tmp/workspace"}))
+    assert [info["status"] for info in status.values()] == ["ok", "ok", "ok"]
+    assert len(results) == 3
+    top = results[0]
+    assert top["title"].lower() == "attention is all you need"
+    assert sorted(top["found_in"]) == ["arxiv", "crossref", "local"]
+    assert top["doi"] == "10.5555/3295222.3295349" and top["arxiv_id"].startswith("1706.03762")
+    assert {paper["title"] for paper in results[1:]} == {GAT["title"], RESNET["title"]}
+    print("✓ 多个数据源的结果按ID和标题合并，RRF排序正常")
+
+
+@with_backends(arxiv=fake_arxiv, crossref=slow_backend, local=broken_backend)
+def test_deadline_and_errors():
+    """慢的后端在截止时间后被取消，出错的后端不影响其他结果"""
+    start = time.perf_counter()
+    text = asyncio.run(search_papers("attention", 5, timeout=0.3, user_workspace="/tmp/workspace"))[0].text
+    elapsed = time.perf_counter() - start
+    assert elapsed < 2, elapsed
+    assert "crossref: 超时" in text
+    assert "local: 出错 (upstream down)" in text
+    assert "arxiv: 2 条" in text and "Graph Attention Networks" in text
+    print("✓ 截止时间和后端错误处理正常")
+
+
+@with_backends(arxiv=fake_arxiv, crossref=fake_crossref, local=fake_local)
+def test_backend_selection():
+    """只查询指定的后端；没有工作区时跳过本地论文库"""
+    _, status = asyncio.run(federated_search("attention", 10, backends=["crossref", "unknown"]))
+    assert list(status) == ["crossref"]
+    _, status = asyncio.run(federated_search("attention", 10))
+    assert list(status) == ["arxiv", "crossref"]
+    print("✓ 后端选择正常")
+
+
+if __name__ == "__main__":
+    test_merge_and_rank()
+    test_deadline_and_errors()
+    test_backend_selection()
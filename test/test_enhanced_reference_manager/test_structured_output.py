@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试结构化输出 - output_format=json 时返回紧凑JSON记录，支持字段选择、摘要截断，并可直接保存
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+# 添加项目根目录到Python路径，以便导入thesis_reference_manager模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from fake_upstream import fake_upstream
+from thesis_reference_manager import (
+    compact_record, get_arxiv_details_batch, get_paper_details, query_library, save_search_results,
+    search_local_library, search_papers_arxiv
+)
+
+SEARCH_FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+  <opensearch:totalResults>40</opensearch:totalResults>
+  <entry><id>http://arxiv.org/abs/1706.03762v5</id><published>2017-06-12T17:57:34Z</published>
+    <title>Attention Is All You Need</title>
+    <summary>The dominant sequence transduction models are based on complex recurrent networks.</summary>
+    <author><name>Ashish Vaswani</name></author><author><name>Noam Shazeer</name></author></entry>
+  <entry><id>http://arxiv.org/abs/1810.04805v2</id><published>2018-10-11T00:50:01Z</published>
+    <title>BERT: Pre-training of Deep Bidirectional Transformers</title><summary>We introduce BERT.</summary>
+    <author><name>Jacob Devlin</name></author></entry>
+</feed>"""
+
+
+def run_with_fake_arxiv(scenario):
+    """用MockTransport代替arXiv，返回场景结果"""
+    def handler(request):
+        return httpx.Response(200, content=SEARCH_FEED)
+
+    with fake_upstream(handler) as tmp:
+        return asyncio.run(scenario(tmp))
+
+
+def test_compact_record():
+    paper = {"title": "Attention Is All You Need", "summary": "A" * 50, "journal": "", "authors": []}
+    assert compact_record(paper) == {"title": "Attention Is All You Need", "summary": "A" * 50}
+    assert compact_record(paper, abstract_chars=10)["summary"] == "A" * 10 + "…"
+    assert "summary" not in compact_record(paper, abstract_chars=0)
+    # abstract 与 summary 互为别名
+    assert compact_record(paper, ["title", "abstract"], 5) == {"title": paper["title"], "abstract": "AAAAA…"}
+    print("✓ 字段选择和摘要截断正常")
+
+
+def test_search_json_chains_into_save():
+    """JSON结果可直接作为save_search_results的results，不需要解析文本"""
+    async def scenario(workspace):
+        text = (await search_papers_arxiv("attention", 2, output_format="json",
+                                          fields=["title", "authors", "arxiv_id", "source"]))[0].text
+        response = json.loads(text)
+        saved = (await save_search_results(response["results"], "nlp", user_workspace=workspace))[0].text
+        library = json.loads((await query_library("", output_format="json", fields=["title", "arxiv_id"],
+                                                  user_workspace=workspace))[0].text)
+        local = json.loads((await search_local_library("bert", output_format="json", fields=["title", "score"],
+                                                       user_workspace=workspace))[0].text)
+        return text, response, saved, library, local
+
+    text, response, saved, library, local = run_with_fake_arxiv(scenario)
+    assert "\n" not in text and "摘要" not in text
+    assert response["total"] == 40 and response["next_page_token"]
+    assert response["results"][0] == {"title": "Attention Is All You Need",
+                                      "authors": ["Ashish Vaswani", "Noam Shazeer"],
+                                      "arxiv_id": "1706.03762v5", "source": "arxiv"}
+    assert "新增 2" in saved and "BibTeX" in saved
+    assert library["total"] == 2 and library["domains"] == {"nlp": 2}
+    assert {paper["arxiv_id"] for paper in library["results"]} == {"1706.03762v5", "1810.04805v2"}
+    assert local["results"][0]["title"].startswith("BERT") and local["results"][0]["score"] > 0
+    print("✓ JSON搜索结果可直接保存到论文库")
+
+
+def test_details_json():
+    async def scenario(workspace):
+        detail = json.loads((await get_paper_details("1706.03762v5", "arxiv", output_format="json",
+                                                     abstract_chars=20))[0].text)
+        batch = (await get_arxiv_details_batch(["1706.03762v5", "bad id"], output_format="json",
+                                               fields=["title", "bibtex"]))[0].text
+        text_batch = (await get_arxiv_details_batch(["1706.03762v5"]))[0].text
+        return detail, batch, text_batch
+
+    detail, batch, text_batch = run_with_fake_arxiv(scenario)
+    assert detail["status"] == "ok" and detail["paper"]["summary"].endswith("…")
+    assert len(detail["paper"]["summary"]) == 21 and "@article{vaswani2017attention" in detail["paper"]["bibtex"]
+    data = json.loads(batch)
+    assert "\n  " not in batch and data["missing"] == ["bad id"]
+    assert set(data["results"][0]["paper"]) == {"title", "bibtex"}
+    # 默认仍返回带缩进的完整记录
+    assert "\n  " in text_batch and "summary" in json.loads(text_batch)["results"][0]["paper"]
+    print("✓ 详情和批量工具的JSON输出正常")
+
+
+if __name__ == "__main__":
+    test_compact_record()
+    test_search_json_chains_into_save()
+    test_details_json()
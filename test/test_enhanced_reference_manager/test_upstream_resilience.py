@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试上游访问的令牌桶限速、带抖动的重试和熔断器
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+# 添加项目根目录到Python路径，以便导入thesis_reference_manager模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import reference_http
+from fake_upstream import fake_upstream
+from reference_http import AsyncHTTPClient, CircuitOpenError, HTTPConfig, TokenBucket
+from thesis_reference_manager import get_paper_details, get_upstream_status
+
+DETAIL_FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <entry><id>http://arxiv.org/abs/1706.03762v5</id><published>2017-06-12T17:57:34Z</published>
+    <title>Attention Is All You Need</title><summary>The dominant sequence models.</summary>
+    <author><name>Ashish Vaswani</name></author></entry>
+</feed>"""
+
+
+def test_token_bucket_allows_burst_then_paces():
+    """先放行capacity个突发请求，之后按rate匀速放行"""
+    async def scenario():
+        bucket = TokenBucket(rate=20, capacity=2)
+        start = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(6)))
+        return time.monotonic() - start, bucket.waiting
+
+    elapsed, waiting = asyncio.run(scenario())
+    assert 0.18 <= elapsed < 0.5, elapsed
+    assert waiting == 0
+    print("✓ 令牌桶限速正常")
+
+
+def test_backoff_is_jittered_and_capped():
+    client = AsyncHTTPClient(HTTPConfig(max_backoff=4))
+    delays = [client._backoff_delay(0.5, 2) for _ in range(50)]
+    assert all(1.0 <= d <= 2.0 for d in delays) and len(set(delays)) > 1
+    assert all(2.0 <= client._backoff_delay(0.5, 10) <= 4.0 for _ in range(20))
+    print("✓ 重试退避带抖动且有上限")
+
+
+def test_circuit_breaker_fails_fast_and_recovers():
+    """连续失败后熔断，熔断期间不访问上游；超时后试探成功即恢复"""
+    calls = []
+    healthy = {"value": False}
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200 if healthy["value"] else 503, content=b"ok")
+
+    client = AsyncHTTPClient(HTTPConfig(breaker_threshold=2, breaker_reset=0.2),
+                             transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        url = "https://api.example.org/works"
+        response = await client.get_with_retry(url, retries=1, backoff=0.01)
+        assert response.status_code == 503 and len(calls) == 2
+        assert client.status()["api.example.org"]["breaker"]["state"] == "open"
+
+        start = time.monotonic()
+        try:
+            await client.get_with_retry(url, retries=3)
+            raise AssertionError("熔断时应立即失败")
+        except CircuitOpenError as e:
+            assert e.host == "api.example.org"
+        assert time.monotonic() - start < 0.05 and len(calls) == 2
+
+        await asyncio.sleep(0.25)
+        healthy["value"] = True
+        response = await client.get(url)
+        assert response.status_code == 200
+        breaker = client.status()["api.example.org"]["breaker"]
+        assert breaker["state"] == "closed" and breaker["rejected"] == 1 and breaker["opened"] == 1
+        await client.aclose()
+
+    asyncio.run(scenario())
+    print("✓ 熔断器快速失败并在试探成功后恢复")
+
+
+def test_long_retry_after_is_not_honoured():
+    """Retry-After在max_backoff以内时照常等待重试，超过时直接返回响应，不长时间等待"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == "/slow":
+            return httpx.Response(429, headers={"Retry-After": "3600"})
+        status = 503 if calls.count("/short") == 1 else 200
+        return httpx.Response(status, headers={"Retry-After": "0.05"})
+
+    client = AsyncHTTPClient(HTTPConfig(max_backoff=2), transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        start = time.monotonic()
+        slow = await client.get_with_retry("https://api.example.org/slow", retries=3)
+        assert slow.status_code == 429 and time.monotonic() - start < 0.1
+        short = await client.get_with_retry("https://api.example.org/short", retries=3)
+        assert short.status_code == 200 and time.monotonic() - start >= 0.05
+        await client.aclose()
+
+    asyncio.run(scenario())
+    assert calls == ["/slow", "/short", "/short"]
+    print("✓ 超过退避上限的Retry-After不再等待")
+
+
+def test_stream_retries_before_first_chunk():
+    """流式请求在收到响应头之前的503和网络错误按退避重试"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.params["id_list"])
+        attempt = calls.count(request.url.params["id_list"])
+        if request.url.params["id_list"] == "1706.03762v5" and attempt == 1:
+            return httpx.Response(503)
+        if request.url.params["id_list"] == "1706.03762v4" and attempt == 1:
+            raise httpx.ConnectError("connection reset")
+        return httpx.Response(200, content=DETAIL_FEED)
+
+    async def scenario():
+        retried = (await get_paper_details("1706.03762v5", "arxiv"))[0].text
+        reconnected = (await get_paper_details("1706.03762v4", "arxiv"))[0].text
+        return retried, reconnected
+
+    with fake_upstream(handler):
+        retried, reconnected = asyncio.run(scenario())
+    assert "Attention Is All You Need" in retried and "Attention Is All You Need" in reconnected
+    assert calls == ["1706.03762v5", "1706.03762v5", "1706.03762v4", "1706.03762v4"]
+    print("✓ 流式请求在读取前重试")
+
+
+def test_upstream_status_tool():
+    saved = reference_http._shared_client
+    reference_http._shared_client = AsyncHTTPClient(HTTPConfig())
+    try:
+        text = asyncio.run(get_upstream_status())[0].text
+    finally:
+        reference_http._shared_client = saved
+    assert "export.arxiv.org" in text and "api.crossref.org" in text
+    assert "熔断器: 正常" in text and "排队等待令牌: 0" in text
+    print("✓ 上游状态工具正常")
+
+
+if __name__ == "__main__":
+    test_token_bucket_allows_burst_then_paces()
+    test_backoff_is_jittered_and_capped()
+    test_circuit_breaker_fails_fast_and_recovers()
+    test_long_retry_after_is_not_honoured()
+    test_stream_retries_before_first_chunk()
+    test_upstream_status_tool()
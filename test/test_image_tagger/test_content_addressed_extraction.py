@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试按内容寻址的图片提取 - 相同图片只保存一份，重复运行跳过已有文件，manifest记录来源条目
+"""
+
+import io
+import json
+import os
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+
+from PIL import Image
+
+# 添加项目根目录到Python路径，以便导入docx_image_tagger模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+from docx_image_tagger import extract_docx_images, extract_zip_assets
+
+
+def png_bytes(color, size=(12, 8)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+LOGO = png_bytes("red")
+FIGURE = png_bytes("blue", (40, 30))
+
+
+def docx_bytes(media):
+    """只包含word/media的最小docx结构，提取图片不需要其他部分"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("word/document.xml", "<w:document/>")
+        for name, data in media.items():
+            zf.writestr(f"word/media/{name}", data)
+    return buffer.getvalue()
+
+
+def stored_files(directory):
+    return sorted(name for name in os.listdir(directory) if name != "manifest.json")
+
+
+def test_docx_extraction_dedupes_and_skips_existing():
+    with tempfile.TemporaryDirectory() as workspace:
+        with open(os.path.join(workspace, "report.docx"), "wb") as f:
+            f.write(docx_bytes({"image1.png": LOGO, "image2.png": FIGURE, "image3.png": LOGO, "image4.png": LOGO}))
+
+        first = extract_docx_images("report.docx", workspace)
+        assert first["success"] and first["count"] == 4 and first["unique"] == 2
+        assert first["written"] == 2 and first["duplicates"] == 2
+        statuses = [image["status"] for image in first["images"]]
+        assert statuses == ["written", "written", "duplicate", "duplicate"]
+        assert first["images"][2]["duplicate_of"] == "report.docx:word/media/image1.png"
+        assert first["images"][2]["filename"] == first["images"][0]["filename"]
+        assert first["images"][1]["width"] == 40
+
+        pictures = os.path.join(workspace, "pictures")
+        assert len(stored_files(pictures)) == 2
+        with open(os.path.join(pictures, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)["entries"]
+        assert len(manifest) == 4
+        assert manifest["report.docx:word/media/image4.png"]["file"] == first["images"][0]["relative_path"]
+
+        # 再次提取时不写入任何文件
+        mtime = os.path.getmtime(first["images"][0]["filename"])
+        before = stored_files(pictures)
+        second = extract_docx_images("report.docx", workspace)
+        assert second["written"] == 0 and second["existing"] == 2 and second["bytes_written"] == 0
+        assert os.path.getmtime(first["images"][0]["filename"]) == mtime
+        assert stored_files(pictures) == before
+
+        # 关闭后保持原来的逐条命名
+        legacy = extract_docx_images("report.docx", workspace, output_dir="legacy", dedupe=False)
+        assert legacy["count"] == 4 and "unique" not in legacy
+        assert stored_files(os.path.join(workspace, "legacy"))[0] == "docx_img_001.png"
+    print("✓ DOCX图片按内容去重，重复运行跳过已有文件")
+
+
+def test_zip_extraction_shares_store_with_docx():
+    """zip中的图片和嵌入docx中的图片共用同一份存储，manifest在多次提取之间合并"""
+    with tempfile.TemporaryDirectory() as workspace:
+        with open(os.path.join(workspace, "report.docx"), "wb") as f:
+            f.write(docx_bytes({"image1.png": LOGO}))
+        with zipfile.ZipFile(os.path.join(workspace, "assets.zip"), "w") as zf:
+            zf.writestr("figures/logo.PNG", LOGO)
+            zf.writestr("figures/plot.png", FIGURE)
+            zf.writestr("chapter.docx", docx_bytes({"image1.png": FIGURE, "image2.png": png_bytes("green")}))
+
+        extract_docx_images("report.docx", workspace)
+        result = extract_zip_assets("assets.zip", workspace)
+        assert result["count"] == 4 and result["unique"] == 3
+        assert [image["status"] for image in result["images"]] == ["existing", "written", "duplicate", "written"]
+        assert result["images"][2]["duplicate_of"] == "assets.zip:figures/plot.png"
+        assert result["images"][2]["from_docx"] == "chapter.docx"
+
+        pictures = os.path.join(workspace, "pictures")
+        assert len(stored_files(pictures)) == 3
+        with open(os.path.join(pictures, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)["entries"]
+        assert set(manifest) == {"report.docx:word/media/image1.png", "assets.zip:figures/logo.PNG",
+                                 "assets.zip:figures/plot.png", "assets.zip:chapter.docx:word/media/image1.png",
+                                 "assets.zip:chapter.docx:word/media/image2.png"}
+        assert manifest["assets.zip:figures/logo.PNG"]["file"] == manifest["report.docx:word/media/image1.png"]["file"]
+    print("✓ zip与docx提取共用内容存储")
+
+
+def test_same_named_documents_in_different_folders():
+    """不同目录下的同名文档在manifest中各自保留来源条目"""
+    with tempfile.TemporaryDirectory() as workspace:
+        for folder, color in (("a", "red"), ("b", "yellow")):
+            os.mkdir(os.path.join(workspace, folder))
+            with open(os.path.join(workspace, folder, "report.docx"), "wb") as f:
+                f.write(docx_bytes({"image1.png": png_bytes(color)}))
+
+        first = extract_docx_images("a/report.docx", workspace)
+        second = extract_docx_images(os.path.join(workspace, "b", "report.docx"), workspace)
+        assert first["images"][0]["entry"] == "a/report.docx:word/media/image1.png"
+        assert second["images"][0]["entry"] == "b/report.docx:word/media/image1.png"
+        with open(os.path.join(workspace, "pictures", "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)["entries"]
+        assert set(manifest) == {"a/report.docx:word/media/image1.png", "b/report.docx:word/media/image1.png"}
+        assert first["images"][0]["relative_path"] == manifest["a/report.docx:word/media/image1.png"]["file"]
+        assert second["images"][0]["relative_path"] == manifest["b/report.docx:word/media/image1.png"]["file"]
+
+        # 工作目录之外的文档以解析后的绝对路径作为来源
+        with tempfile.TemporaryDirectory() as elsewhere:
+            outside = os.path.join(elsewhere, "report.docx")
+            with open(outside, "wb") as f:
+                f.write(docx_bytes({"image1.png": LOGO}))
+            result = extract_docx_images(outside, workspace)
+        assert result["images"][0]["entry"] == f"{Path(outside).resolve().as_posix()}:word/media/image1.png"
+    print("✓ 同名文档按相对路径区分来源")
+
+
+if __name__ == "__main__":
+    test_docx_extraction_dedupes_and_skips_existing()
+    test_zip_extraction_shares_store_with_docx()
+    test_same_named_documents_in_different_folders()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试OCR后端 - batch后端按列表文件分批识别并在失败时逐张重试，tesserocr引擎常驻复用
+用替身代替tesseract和tesserocr，测试不依赖它们
+"""
+
+import os
+import sys
+import tempfile
+import threading
+
+from PIL import Image
+
+# 添加项目根目录到Python路径，以便导入ocr_engine模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import ocr_engine
+from ocr_engine import ocr_backend, ocr_images, split_pages
+
+
+def make_images(directory, count):
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"img_{i}.png")
+        Image.new("L", (8, 8), i * 20).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_split_pages():
+    # 每页之后写分页符，或只在页与页之间写，两种输出都能切分
+    assert split_pages("a\n\fb\n\f", 2) == ["a", "b"]
+    assert split_pages("a\n\f\fc", 3) == ["a", "", "c"]
+    try:
+        split_pages("a\fb", 3)
+        raise AssertionError("页数不一致时应抛出异常")
+    except RuntimeError:
+        pass
+    assert ocr_backend("Batch") == "batch"
+    try:
+        ocr_backend("easyocr")
+        raise AssertionError("未知后端应抛出异常")
+    except ValueError:
+        pass
+    print("✓ 分页切分和后端选择正常")
+
+
+def test_batch_backend_chunks_and_fallback():
+    """每批一次tesseract调用；某批失败时改为逐张识别，只有损坏的图片报告错误"""
+    calls = []
+
+    def fake_file_list(paths, lang, timeout):
+        calls.append([os.path.basename(p) for p in paths])
+        if any(p.endswith("img_4.png") for p in paths):
+            raise RuntimeError("tesseract exited with 1: Error during processing.")
+        return [f"{lang}:{os.path.basename(p)}" for p in paths]
+
+    def fake_ocr_file(path, lang, timeout):
+        if path.endswith("img_4.png"):
+            raise OSError("cannot identify image file")
+        return f"single:{os.path.basename(path)}"
+
+    saved = (ocr_engine.tesseract_file_list, ocr_engine.ocr_file)
+    ocr_engine.tesseract_file_list, ocr_engine.ocr_file = fake_file_list, fake_ocr_file
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = make_images(tmp, 6)
+            results = ocr_images(paths, lang="eng", workers=2, backend="batch")
+    finally:
+        ocr_engine.tesseract_file_list, ocr_engine.ocr_file = saved
+    assert sorted(calls) == [["img_0.png", "img_1.png", "img_2.png"], ["img_3.png", "img_4.png", "img_5.png"]]
+    assert [r.text for r in results] == ["eng:img_0.png", "eng:img_1.png", "eng:img_2.png",
+                                         "single:img_3.png", "", "single:img_5.png"]
+    assert [r.ok for r in results] == [True, True, True, True, False, True]
+    print("✓ batch后端分批识别，失败的批次逐张重试")
+
+
+def test_tesserocr_engines_are_reused():
+    """多次调用复用常驻引擎，引擎数量不超过并行数"""
+    created = []
+
+    class FakeAPI:
+        def __init__(self, lang):
+            created.append(lang)
+            self.size = None
+
+        def SetImage(self, img):
+            self.size = img.size
+
+        def GetUTF8Text(self):
+            return f"{threading.current_thread().name} {self.size}\n"
+
+    class FakeTesserocr:
+        PyTessBaseAPI = FakeAPI
+
+    saved = (getattr(ocr_engine, "tesserocr", None), ocr_engine._engines)
+    ocr_engine.tesserocr, ocr_engine._engines = FakeTesserocr, ocr_engine._EnginePool()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = make_images(tmp, 8)
+            for _ in range(3):
+                results = ocr_images(paths, lang="eng", workers=4, backend="tesserocr")
+            ocr_images(paths[:1], lang="chi_sim", backend="tesserocr")
+    finally:
+        ocr_engine.tesserocr, ocr_engine._engines = saved
+    assert all(r.ok and r.text.endswith("(8, 8)") for r in results)
+    assert created.count("eng") <= 4 and created.count("chi_sim") == 1
+    print("✓ tesserocr引擎常驻复用")
+
+
+if __name__ == "__main__":
+    test_split_pages()
+    test_batch_backend_chunks_and_fallback()
+    test_tesserocr_engines_are_reused()
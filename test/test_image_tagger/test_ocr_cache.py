@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试OCR结果缓存 - 按内容哈希命中（重命名、复制的图片也命中）、语言和设置参与缓存键、按大小淘汰
+用计数的替身识别函数代替tesseract，测试不依赖pytesseract
+"""
+
+import functools
+import os
+import shutil
+import sys
+import tempfile
+
+from PIL import Image
+
+# 添加项目根目录到Python路径，以便导入ocr_cache模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import docx_image_tagger
+import ocr_cache
+from ocr_cache import OCRCache, make_ocr_key
+from ocr_engine import ocr_images
+
+
+class CountingOCR:
+    """记录被识别的文件；文件名以bad_开头时识别失败"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, path, lang, timeout):
+        self.calls.append(os.path.basename(path))
+        if os.path.basename(path).startswith("bad_"):
+            raise OSError("cannot identify image file")
+        return f"text of {os.path.basename(path)}"
+
+
+def make_images(directory, colors):
+    os.makedirs(directory, exist_ok=True)
+    for name, color in colors.items():
+        Image.new("RGB", (16, 16), color).save(os.path.join(directory, name))
+
+
+def test_cache_hits_by_content():
+    """第二次识别全部命中；重命名、复制的图片命中，目录内的重复图片只识别一次；失败不缓存"""
+    with tempfile.TemporaryDirectory() as tmp:
+        make_images(tmp, {"a.png": "red", "b.png": "blue", "bad_c.png": "green"})
+        shutil.copy(os.path.join(tmp, "a.png"), os.path.join(tmp, "a_copy.png"))
+        cache = OCRCache(os.path.join(tmp, "ocr.sqlite3"))
+        ocr = CountingOCR()
+        paths = [os.path.join(tmp, name) for name in ("a.png", "a_copy.png", "b.png", "bad_c.png")]
+
+        first = ocr_images(paths, lang="eng", workers=2, ocr_func=ocr, cache=cache, settings="v1")
+        assert sorted(ocr.calls) == ["a.png", "b.png", "bad_c.png"]
+        assert first[1].text == "text of a.png" and not first[3].ok
+
+        os.rename(os.path.join(tmp, "b.png"), os.path.join(tmp, "renamed.png"))
+        paths[2] = os.path.join(tmp, "renamed.png")
+        ocr.calls.clear()
+        second = ocr_images(paths, lang="eng", workers=2, ocr_func=ocr, cache=cache, settings="v1")
+        assert ocr.calls == ["bad_c.png"]
+        assert [r.cached for r in second] == [True, True, True, False]
+        assert second[2].text == "text of b.png"
+
+        # 语言或OCR设置不同时重新识别
+        ocr.calls.clear()
+        ocr_images(paths[:1], lang="chi_sim", ocr_func=ocr, cache=cache, settings="v1")
+        ocr_images(paths[:1], lang="eng", ocr_func=ocr, cache=cache, settings="v2")
+        assert ocr.calls == ["a.png", "a.png"]
+
+        stats = cache.stats()
+        assert stats["hits"] == 3 and stats["entries"] == 4 and stats["stores"] == 4
+        cache.close()
+    print("✓ 按图片内容命中缓存")
+
+
+def test_size_bounded_eviction():
+    """超过上限后淘汰最久未访问的条目"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OCRCache(os.path.join(tmp, "ocr.sqlite3"), max_bytes=1000)
+        for i in range(10):
+            cache.put(make_ocr_key(f"hash{i}", "eng"), "x" * 100)
+            cache.get(make_ocr_key("hash0", "eng"))
+        stats = cache.stats()
+        assert stats["evictions"] > 0 and stats["total_bytes"] <= 1000
+        # 频繁访问的条目保留，最早写入且未再访问的条目被淘汰
+        assert cache.get(make_ocr_key("hash0", "eng")) == "x" * 100
+        assert cache.get(make_ocr_key("hash1", "eng")) is None
+        cache.close()
+        # 重新打开后总大小从文件中恢复
+        reopened = OCRCache(os.path.join(tmp, "ocr.sqlite3"), max_bytes=1000)
+        assert reopened.stats()["total_bytes"] == stats["total_bytes"]
+        reopened.close()
+    print("✓ 缓存按大小淘汰")
+
+
+def test_retagging_unchanged_folder():
+    """再次标注未变化的目录时不再调用OCR，统计中可以看到命中"""
+    ocr = CountingOCR()
+    saved = (docx_image_tagger.OCR_AVAILABLE, docx_image_tagger.ocr_images)
+    docx_image_tagger.OCR_AVAILABLE = True
+    docx_image_tagger.ocr_images = functools.partial(ocr_images, ocr_func=ocr, settings="test")
+    try:
+        with tempfile.TemporaryDirectory() as workspace:
+            make_images(os.path.join(workspace, "images"), {"a.png": "red", "b.png": "blue"})
+            # 纯色测试图会被判断为无文字，这里关闭跳过
+            tag = functools.partial(docx_image_tagger.tag_exported_images, "images", workspace, ocr_lang="eng",
+                                    skip_textless=False)
+            first, second, uncached = tag(), tag(), tag(use_cache=False)
+            assert os.path.exists(os.path.join(workspace, ocr_cache.OCR_CACHE_FILE_NAME))
+            ocr_cache._shared_caches.pop(os.path.abspath(workspace)).close()
+    finally:
+        docx_image_tagger.OCR_AVAILABLE, docx_image_tagger.ocr_images = saved
+    assert first["ocr_cached"] == 0 and second["ocr_cached"] == 2
+    assert second["ocr_cache"]["hits"] == 2 and second["ocr_cache"]["misses"] == 2
+    assert uncached["ocr_cache"] is None and len(ocr.calls) == 4
+    assert [item["ocr_preview"] for item in second["items"]] == ["text of a.png", "text of b.png"]
+    print("✓ 重复标注未变化的目录命中缓存")
+
+
+if __name__ == "__main__":
+    test_cache_hits_by_content()
+    test_size_bounded_eviction()
+    test_retagging_unchanged_folder()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试OCR引擎 - 并行识别保持输入顺序，单张图片失败或超时不影响其他图片
+用替身识别函数代替tesseract，测试不依赖pytesseract；并行和超时用事件判断，不依赖机器快慢
+"""
+
+import functools
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from PIL import Image
+
+# 添加项目根目录到Python路径，以便导入ocr_engine模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import docx_image_tagger
+from ocr_engine import ocr_images
+
+
+def fake_ocr(path, lang, timeout):
+    """文件名决定行为：slow_ 延迟返回，bad_ 抛出异常"""
+    name = os.path.basename(path)
+    if name.startswith("bad_"):
+        raise OSError("cannot identify image file")
+    if name.startswith("slow_"):
+        time.sleep(0.1)
+    return f"{lang}:{name}"
+
+
+def test_ordered_parallel_results():
+    """先完成的图片不会打乱顺序；所有图片同时在识别"""
+    paths = [f"img_{i}.png" for i in range(8)]
+    done = {path: threading.Event() for path in paths}
+    finished = []
+
+    def reverse_ocr(path, lang, timeout):
+        # 每张图片等后一张完成后才返回：完成顺序与输入相反，只有8张同时运行时才能全部完成
+        index = paths.index(path)
+        if index + 1 < len(paths) and not done[paths[index + 1]].wait(5):
+            raise RuntimeError("not running in parallel")
+        finished.append(path)
+        done[path].set()
+        return f"{lang}:{path}"
+
+    results = ocr_images(paths, lang="eng", workers=8, timeout=10, ocr_func=reverse_ocr)
+    assert finished == paths[::-1]
+    assert [r.text for r in results] == [f"eng:{p}" for p in paths] and all(r.ok for r in results)
+    serial = ocr_images(["slow_0.png", "fast_1.png"], lang="eng", workers=1, ocr_func=fake_ocr)
+    assert [r.path for r in serial] == ["slow_0.png", "fast_1.png"]
+    print("✓ 并行结果保持输入顺序")
+
+
+def test_failures_are_isolated():
+    """损坏的图片和超时的图片只影响自身的结果"""
+    paths = ["a.png", "bad_b.png", "hang_c.png", "d.png"]
+    release = threading.Event()
+    calls, finished = [], []
+
+    def hanging_ocr(path, lang, timeout):
+        calls.append(path)
+        if path.startswith("hang_"):
+            release.wait(5)
+        text = fake_ocr(path, lang, timeout)
+        finished.append(path)
+        return text
+
+    try:
+        results = ocr_images(paths, workers=2, timeout=0.2, ocr_func=hanging_ocr)
+        # 整批在期限到达时返回，没有等待卡住的调用
+        assert "hang_c.png" not in finished
+    finally:
+        release.set()
+    assert sorted(calls) == sorted(paths)
+    assert [r.ok for r in results] == [True, False, False, True]
+    assert results[1].error.startswith("OSError") and results[2].error == "timeout"
+    assert results[3].text.endswith("d.png")
+    print("✓ 单张失败和超时被隔离")
+
+
+def test_serial_hang_times_out():
+    """逐张识别（workers=1）时卡住的图片同样按超时返回，后面的图片照常识别"""
+    release = threading.Event()
+
+    def hanging_ocr(path, lang, timeout):
+        if path.startswith("hang_"):
+            # 在当前线程中调用时会一直等到测试结束，返回的文字会让下面的断言失败
+            release.wait(5)
+        return f"{lang}:{path}"
+
+    try:
+        results = ocr_images(["hang_a.png", "b.png"], lang="eng", workers=1, timeout=0.1, ocr_func=hanging_ocr)
+    finally:
+        release.set()
+    assert results[0].error == "timeout" and results[1].text == "eng:b.png"
+    print("✓ 逐张识别时卡住的图片按超时返回")
+
+
+def test_tag_exported_images_reports_errors():
+    """标签工具使用引擎并行识别，失败记录在对应条目中"""
+    saved = (docx_image_tagger.OCR_AVAILABLE, docx_image_tagger.ocr_images)
+    docx_image_tagger.OCR_AVAILABLE = True
+    docx_image_tagger.ocr_images = functools.partial(ocr_images, ocr_func=fake_ocr)
+    try:
+        with tempfile.TemporaryDirectory() as workspace:
+            os.mkdir(os.path.join(workspace, "images"))
+            for name, color in (("a.png", "white"), ("bad_b.png", "gray"), ("slow_c.png", "black")):
+                Image.new("RGB", (20, 10), color).save(os.path.join(workspace, "images", name))
+            result = docx_image_tagger.tag_exported_images("images", workspace, ocr_lang="eng", workers=3,
+                                                           use_cache=False, skip_textless=False)
+    finally:
+        docx_image_tagger.OCR_AVAILABLE, docx_image_tagger.ocr_images = saved
+    assert result["success"] and result["count"] == 3 and result["ocr_workers"] == 3
+    assert result["ocr_failures"] == 1
+    items = result["items"]
+    assert [os.path.basename(item["file"]) for item in items] == ["a.png", "bad_b.png", "slow_c.png"]
+    assert items[0]["ocr_preview"] == "eng:a.png" and "ocr" in items[0]["tags"]
+    assert "ocr_error" in items[1] and items[1]["tags"] == ["png", "20x10"]
+    print("✓ 图像标签工具报告每张图片的OCR结果")
+
+
+if __name__ == "__main__":
+    test_ordered_parallel_results()
+    test_failures_are_isolated()
+    test_serial_hang_times_out()
+    test_tag_exported_images_reports_errors()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试OCR前处理 - 文字可能性判断跳过无文字图片，二值化和纠偏，以及跳过数和节省时间的统计
+用替身识别函数代替tesseract，测试不依赖pytesseract
+"""
+
+import functools
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# 添加项目根目录到Python路径，以便导入ocr_preprocess模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import docx_image_tagger
+import ocr_engine
+from ocr_engine import ocr_images, ocr_summary
+from ocr_preprocess import _foreground, estimate_skew, otsu_threshold, preprocess_image, text_likelihood, text_threshold
+
+
+def text_image(width=800, height=400, lines=10):
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    for i in range(lines):
+        draw.text((20, 20 + i * 35), "The quick brown fox jumps over the lazy dog 123", fill="black")
+    return img
+
+
+def large_text_image(width, height, text, scale):
+    """把默认字体的文字放大scale倍，得到标题、海报那样笔画很粗的大字"""
+    small = Image.new("RGB", (width // scale, height // scale), "white")
+    ImageDraw.Draw(small).text((2, (height // scale - 11) // 2), text, fill="black")
+    return small.resize((width, height), Image.NEAREST)
+
+
+def photo_image():
+    """模糊噪声拉伸对比度，近似没有文字的照片"""
+    noise = np.random.default_rng(0).random((600, 800)) * 255
+    blurred = np.asarray(Image.fromarray(noise.astype(np.uint8)).filter(ImageFilter.GaussianBlur(12)), dtype=float)
+    return Image.fromarray(np.clip((blurred - 128) * 6 + 128, 0, 255).astype(np.uint8))
+
+
+def bar_chart():
+    img = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(img)
+    for i in range(6):
+        draw.rectangle((50 + i * 120, 520 - 80 * i, 130 + i * 120, 580), fill="blue")
+    draw.line((40, 20, 40, 580), fill="black", width=3)
+    draw.line((40, 580, 780, 580), fill="black", width=3)
+    return img
+
+
+def test_text_likelihood():
+    threshold = text_threshold()
+    assert text_likelihood(text_image())["score"] > 0.1
+    assert text_likelihood(text_image(800, 60, lines=1))["score"] > threshold
+    # 大字号的笔画比小字宽得多，按行高判断仍然是文字
+    assert text_likelihood(large_text_image(400, 200, "HELLO", 9))["score"] > threshold
+    assert text_likelihood(large_text_image(800, 300, "Results", 11))["score"] > threshold
+    for img in (Image.new("RGB", (800, 600), "white"), photo_image(), bar_chart(),
+                Image.fromarray(np.tile(np.linspace(0, 255, 800), (600, 1)).astype(np.uint8))):
+        assert text_likelihood(img)["score"] < threshold
+    # 白底加轻微噪声没有可识别的对比度
+    flat = 250 + np.random.default_rng(1).integers(0, 4, (300, 300))
+    assert text_likelihood(Image.fromarray(flat.astype(np.uint8)))["score"] == 0.0
+    print("✓ 文字可能性判断区分文字、照片和图表")
+
+
+def test_binarize_and_deskew():
+    bimodal = np.array([30] * 100 + [220] * 300, dtype=np.uint8)
+    assert 30 < otsu_threshold(bimodal) <= 220
+    skewed = text_image().rotate(3, expand=True, fillcolor="white")
+    assert abs(estimate_skew(_foreground(np.asarray(skewed.convert("L")))) + 3) <= 0.5
+    out = preprocess_image(skewed, max_side=600)
+    assert out.mode == "L" and max(out.size) <= 650
+    assert set(np.unique(np.asarray(out))) <= {0, 255}
+    print("✓ 二值化和纠偏正常")
+
+
+def test_skip_and_preprocess_in_engine():
+    """无文字的图片不交给识别函数；需要识别的图片以同名的二值图交给识别函数"""
+    seen = []
+
+    def fake_ocr(path, lang, timeout):
+        with Image.open(path) as img:
+            seen.append((os.path.basename(path), set(np.unique(np.asarray(img)))))
+        time.sleep(0.05)
+        return "text"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text_image().save(os.path.join(tmp, "figure.png"))
+        photo_image().save(os.path.join(tmp, "photo.jpg"))
+        bar_chart().save(os.path.join(tmp, "chart.png"))
+        paths = [os.path.join(tmp, name) for name in ("figure.png", "photo.jpg", "chart.png", "missing.png")]
+        results = ocr_images(paths, workers=2, ocr_func=fake_ocr, prefilter=True, preprocess=True)
+
+        saved = (docx_image_tagger.OCR_AVAILABLE, docx_image_tagger.ocr_images)
+        docx_image_tagger.OCR_AVAILABLE = True
+        docx_image_tagger.ocr_images = functools.partial(ocr_images, ocr_func=fake_ocr)
+        try:
+            tagged = docx_image_tagger.tag_exported_images(tmp, tmp, use_cache=False)
+        finally:
+            docx_image_tagger.OCR_AVAILABLE, docx_image_tagger.ocr_images = saved
+
+    assert [r.skipped for r in results] == [False, True, True, False]
+    assert [r.path for r in results] == paths and results[0].text == "text"
+    # 无法读取的图片照常交给识别函数，由它报告错误
+    assert not results[3].ok and results[1].text_score < text_threshold()
+    assert seen[0] == ("figure.png", {0, 255})
+    summary = ocr_summary(results)
+    assert summary["skipped"] == 2 and summary["time_saved"] >= 0.1
+    assert tagged["ocr_skipped"] == 2 and tagged["ocr_time_saved"] > 0
+    assert [item.get("ocr_skipped", False) for item in tagged["items"]] == [True, False, True]
+    print("✓ 跳过无文字图片并统计节省的时间")
+
+
+def test_without_numpy_recognizes_original_images():
+    """没有numpy时忽略prefilter和preprocess，所有图片按原图交给识别函数"""
+    seen = []
+
+    def fake_ocr(path, lang, timeout):
+        seen.append(path)
+        return "text"
+
+    saved = ocr_engine.NUMPY_AVAILABLE
+    ocr_engine.NUMPY_AVAILABLE = False
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, "photo.jpg"), os.path.join(tmp, "chart.png")]
+            photo_image().save(paths[0])
+            bar_chart().save(paths[1])
+            results = ocr_images(paths, workers=2, ocr_func=fake_ocr, prefilter=True, preprocess=True)
+    finally:
+        ocr_engine.NUMPY_AVAILABLE = saved
+    assert sorted(seen) == sorted(paths)
+    assert not any(r.skipped for r in results) and all(r.text_score is None for r in results)
+    print("✓ 没有numpy时直接识别原图")
+
+
+if __name__ == "__main__":
+    test_text_likelihood()
+    test_binarize_and_deskew()
+    test_skip_and_preprocess_in_engine()
+    test_without_numpy_recognizes_original_images()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试LaTeX引用索引以及基于索引的分析、转换工具
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+# 添加项目根目录到Python路径，以便导入thesis_reference_manager模块
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, project_root)
+
+import bibtex_database
+from bibtex_database import MAX_CACHED_DATABASES, load_bib_database
+from latex_citations import build_citation_index
+from thesis_reference_manager import analyze_citations, clean_unused_references, convert_citations_to_superscript
+
+SAMPLE_TEX = r"""\documentclass{article}
+\begin{document}
+正文\cite{a,b}，另见\citep[p.~3]{c}与\citet{d}。
+% 注释中的\cite{commented}不计入
+转义的百分号\% 之后\cite*{e}\nocite{f}
+\begin{thebibliography}{9}
+\bibitem{a} Author A.
+\bibitem[B99]{b} Author B.
+\bibitem{c} Author C.
+\bibitem{d} Author D.
+\bibitem{e} Author E.
+\bibitem{f} Author F.
+\bibitem{unused} Nobody.
+\end{thebibliography}
+\end{document}
+"""
+
+
+def test_citation_index():
+    """一次扫描识别各类引用命令和bibitem范围"""
+    index = build_citation_index(SAMPLE_TEX)
+    
+    assert [cite.command for cite in index.cites] == ["cite", "citep", "citet", "cite*", "nocite"]
+    assert index.cites[1].options == ["p.~3"]
+    assert index.used_keys() == ["a", "b", "c", "d", "e", "f"]
+    assert index.defined_keys() == ["a", "b", "c", "d", "e", "f", "unused"]
+    assert index.unused_keys() == ["unused"]
+    assert index.undefined_keys() == []
+    
+    # 每个bibitem的范围到下一个条目或环境结束为止
+    last = index.bibitems[-1]
+    assert SAMPLE_TEX[last.start:last.end] == "\\bibitem{unused} Nobody.\n"
+    begin, end = index.bibliography_spans[0]
+    assert SAMPLE_TEX[begin:end].startswith("\\begin{thebibliography}")
+    assert SAMPLE_TEX[begin:end].endswith("\\end{thebibliography}")
+    print("✓ 引用索引功能正常")
+
+
+def test_nocite_star_marks_everything_used():
+    index = build_citation_index(SAMPLE_TEX.replace(r"\nocite{f}", r"\nocite{*}"))
+    assert index.unused_keys() == []
+    print("✓ \\nocite{*} 处理正常")
+
+
+def test_analyze_and_convert():
+    """分析与转换工具共用索引"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tex_file = os.path.join(tmp_dir, "thesis.tex")
+        with open(tex_file, "w", encoding="utf-8") as f:
+            f.write(SAMPLE_TEX)
+        
+        result = asyncio.run(analyze_citations(tex_file))[0].text
+        assert "未使用的参考文献数量: 1" in result
+        
+        asyncio.run(convert_citations_to_superscript(tex_file))
+        with open(tex_file, "r", encoding="utf-8") as f:
+            converted = f.read()
+        assert "正文$^{1,2}$" in converted
+        assert "之后$^{3}$" in converted
+        # 带可选参数、\citet和\nocite保持原样
+        assert r"\citep[p.~3]{c}" in converted
+        assert r"\citet{d}" in converted
+        assert r"\nocite{f}" in converted
+        assert r"\cite{commented}" in converted
+    print("✓ 引用分析和上标转换功能正常")
+
+
+def test_clean_unused_references():
+    """一次重建参考文献列表，键中的正则元字符不影响删除"""
+    tex = SAMPLE_TEX.replace(r"\bibitem{unused} Nobody.", "\\bibitem{un.used+(1)} Nobody.\n\\bibitem{unusedb} Other.")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tex_file = os.path.join(tmp_dir, "thesis.tex")
+        with open(tex_file, "w", encoding="utf-8") as f:
+            f.write(tex)
+        
+        result = asyncio.run(clean_unused_references(tex_file))[0].text
+        assert "成功删除 2 个未使用的参考文献" in result
+        with open(tex_file, "r", encoding="utf-8") as f:
+            cleaned = f.read()
+        assert "un.used+(1)" not in cleaned and "unusedb" not in cleaned
+        assert "\\bibitem{f} Author F.\n\\end{thebibliography}" in cleaned
+        assert build_citation_index(cleaned).defined_keys() == ["a", "b", "c", "d", "e", "f"]
+    print("✓ 清理未使用参考文献功能正常")
+
+
+def test_crlf_files_keep_their_line_endings():
+    """CRLF文件：索引位置与改写时读取的文本一致，清理和转换不破坏内容也不改变换行符"""
+    tex = SAMPLE_TEX.replace("\n", "\r\n")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tex_file = os.path.join(tmp_dir, "thesis.tex")
+        with open(tex_file, "wb") as f:
+            f.write(tex.encode("utf-8"))
+
+        result = asyncio.run(clean_unused_references(tex_file))[0].text
+        assert "成功删除 1 个未使用的参考文献" in result
+        asyncio.run(convert_citations_to_superscript(tex_file))
+        with open(tex_file, "rb") as f:
+            converted = f.read().decode("utf-8")
+        assert "\\bibitem{f} Author F.\r\n\\end{thebibliography}\r\n\\end{document}\r\n" in converted
+        assert "正文$^{1,2}$，另见\\citep[p.~3]{c}与\\citet{d}。\r\n" in converted
+        assert "之后$^{3}$\\nocite{f}\r\n" in converted
+        assert "\n" not in converted.replace("\r\n", "")
+        assert build_citation_index(converted).defined_keys() == ["a", "b", "c", "d", "e", "f"]
+    print("✓ CRLF文件清理和转换正常")
+
+
+def test_multi_file_thesis():
+    """沿\\input/\\include追踪章节文件，只重新扫描修改过的章节"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.makedirs(os.path.join(tmp_dir, "chapters"))
+        files = {
+            "main.tex": "\\cite{intro}\n\\input{chapters/ch1}\n\\include{chapters/ch2}\n\\cite{outro}\n"
+                        "\\begin{thebibliography}{9}\n\\bibitem{intro} I.\n\\bibitem{one} O.\n"
+                        "\\bibitem{two} T.\n\\bibitem{outro} E.\n\\bibitem{spare} S.\n\\end{thebibliography}\n",
+            "chapters/ch1.tex": "第一章\\cite{one}\n",
+            "chapters/ch2.tex": "第二章\\citep{two}\n",
+        }
+        for name, text in files.items():
+            with open(os.path.join(tmp_dir, name), "w", encoding="utf-8") as f:
+                f.write(text)
+        main_tex = os.path.join(tmp_dir, "main.tex")
+        
+        result = asyncio.run(analyze_citations(main_tex))[0].text
+        assert "源文件数量: 3 (重新扫描 3 个，使用缓存 0 个)" in result
+        assert "未使用的参考文献:\nspare" in result
+        
+        result = asyncio.run(analyze_citations(main_tex))[0].text
+        assert "(重新扫描 0 个，使用缓存 3 个)" in result
+        
+        # 只修改一个章节
+        with open(os.path.join(tmp_dir, "chapters/ch1.tex"), "w", encoding="utf-8") as f:
+            f.write("第一章\\cite{one,spare}\n")
+        os.utime(os.path.join(tmp_dir, "chapters/ch1.tex"), (0, 0))
+        result = asyncio.run(analyze_citations(main_tex))[0].text
+        assert "(重新扫描 1 个，使用缓存 2 个)" in result
+        assert "未使用的参考文献:\n无" in result
+        
+        # 编号按排版顺序跨文件分配
+        asyncio.run(convert_citations_to_superscript(main_tex))
+        with open(os.path.join(tmp_dir, "chapters/ch2.tex"), encoding="utf-8") as f:
+            assert f.read() == "第二章$^{4}$\n"
+        with open(main_tex, encoding="utf-8") as f:
+            assert f.read().startswith("$^{1}$\n")
+    print("✓ 多文件论文引用分析功能正常")
+
+
+def test_bib_database():
+    """\\bibliography指定的.bib数据库参与分析，清理时一次重写.bib"""
+    bib = (b"@string{jml = {J. ML}}\n"
+           b"@article{used,\n  title = {A {Nested} Title},\n  crossref = {proc}\n}\n"
+           b"@inproceedings{proc,\n  title = \"Proceedings\"\n}\n"
+           b"@book(stale, title = {Never (cited)})\n"
+           b"@misc{other, note = {x}}\n")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, "refs.bib"), "wb") as f:
+            f.write(bib)
+        main_tex = os.path.join(tmp_dir, "main.tex")
+        with open(main_tex, "w", encoding="utf-8") as f:
+            f.write("\\cite{used,missing}\n\\bibliography{refs}\n")
+        
+        database = load_bib_database(os.path.join(tmp_dir, "refs.bib"))
+        assert database.keys() == ["used", "proc", "stale", "other"]
+        assert database.fields("used")["title"] == "A {Nested} Title"
+        assert load_bib_database(os.path.join(tmp_dir, "refs.bib")) is database
+        
+        result = asyncio.run(analyze_citations(main_tex))[0].text
+        assert "BibTeX数据库: 1 个，共 4 条" in result
+        assert "未使用的参考文献:\nother, stale" in result
+        assert "使用但未定义的引用:\nmissing" in result
+        
+        asyncio.run(clean_unused_references(main_tex))
+        with open(os.path.join(tmp_dir, "refs.bib"), "rb") as f:
+            cleaned = f.read()
+        assert cleaned == bib.replace(b"@book(stale, title = {Never (cited)})\n", b"").replace(b"@misc{other, note = {x}}\n", b"")
+    print("✓ BibTeX数据库分析和清理功能正常")
+
+
+def test_bib_cache_keeps_recent_databases():
+    """进程内只缓存最近使用的几个.bib文件，旧文件的内容不会一直留在内存中"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(MAX_CACHED_DATABASES + 3):
+            paths.append(os.path.join(tmp_dir, f"refs{i}.bib"))
+            with open(paths[-1], "wb") as f:
+                f.write(b"@misc{key%d, note = {x}}\n" % i)
+        first = load_bib_database(paths[0])
+        for path in paths[1:]:
+            # 反复使用的第一个文件一直留在缓存中
+            assert load_bib_database(paths[0]) is first
+            load_bib_database(path)
+        cached = list(bibtex_database._database_cache)
+        assert len(cached) == MAX_CACHED_DATABASES
+        assert os.path.abspath(paths[0]) in cached and os.path.abspath(paths[1]) not in cached
+    print("✓ BibTeX数据库缓存只保留最近使用的文件")
+
+
+if __name__ == "__main__":
+    test_citation_index()
+    test_nocite_star_marks_everything_used()
+    test_analyze_and_convert()
+    test_clean_unused_references()
+    test_crlf_files_keep_their_line_endings()
+    test_multi_file_thesis()
+    test_bib_database()
+    test_bib_cache_keeps_recent_databases()
@@ -5,19 +5,66 @@
 提供参考文献分析、清理和管理功能
 """
 
+import base64
 import json
 import re
 import os
-import requests
-from typing import Dict, List, Set, Tuple, Optional
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Set, Tuple, Optional
 from mcp.server import Server
 from mcp.types import Tool, TextContent
 import asyncio
 import xml.etree.ElementTree as ET
+from contextlib import asynccontextmanager
+from urllib.parse import quote, urlsplit
+
+import httpx
+
+from env_config import env_float
+from reference_http import RETRYABLE_STATUS, get_http_client, get_single_flight, close_http_client
+from reference_cache import get_response_cache, make_cache_key, is_offline
+from latex_citations import (
+    NUMERIC_CITE_COMMANDS, CitationIndex, document_order_cites, load_thesis,
+    open_index_cache, read_tex, remove_bibitems, resolve_bib_resources, write_tex
+)
+from bibtex_database import load_bib_database, rewrite_without
+from citation_graph import DIRECTIONS, get_citation_graph
+from paper_library import LIBRARY_FILE_NAME, PaperLibrary
+from paper_dedup import DedupIndex, merge_records, normalize_arxiv_id, normalize_doi
+from reference_export import EXPORT_FORMATS, ExportRecord, render_bibtex, write_records
+
+try:
+    from contextlib import aclosing
+except ImportError:
+    # Python 3.9没有contextlib.aclosing
+    @asynccontextmanager
+    async def aclosing(thing):
+        try:
+            yield thing
+        finally:
+            await thing.aclose()
 
 # 创建MCP服务器
 server = Server("thesis-reference-manager")
 
+# 搜索、详情和批量工具共用的结构化输出参数
+_OUTPUT_PROPERTIES = {
+    "output_format": {
+        "type": "string",
+        "description": "输出格式: text（格式化文本，默认）或 json（紧凑的JSON记录，results可直接传给save_search_results）",
+        "enum": ["text", "json"]
+    },
+    "fields": {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": "JSON记录只保留这些字段，如 [\"title\", \"arxiv_id\"]；abstract与summary互为别名"
+    },
+    "abstract_chars": {
+        "type": "integer",
+        "description": "JSON记录中摘要最多保留的字符数，0表示不返回摘要；默认不截断"
+    }
+}
+
 @server.list_tools()
 async def list_tools() -> List[Tool]:
     """列出可用的工具"""
@@ -26,6 +73,41 @@ async def list_tools() -> List[Tool]:
         Tool(
             name="search_papers_arxiv",
             description="在arXiv上搜索论文",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "搜索关键词"
+                    },
+                    "max_results": {
+                        "type": "integer",
+                        "description": "最大结果数量，默认10；直接返回时单页最多100条"
+                    },
+                    "start": {
+                        "type": "integer",
+                        "description": "结果起始位置，默认0"
+                    },
+                    "page_token": {
+                        "type": "string",
+                        "description": "上一次搜索返回的翻页令牌，提供时忽略start"
+                    },
+                    "output_file": {
+                        "type": "string",
+                        "description": "大量结果时写入的JSON Lines文件路径，按页拉取并逐条写入"
+                    },
+                    "prefetch": {
+                        "type": "integer",
+                        "description": "返回后在后台预取前N条结果的详情/BibTeX，后续get_paper_details直接读本地缓存；默认0（不预取）"
+                    },
+                    **_OUTPUT_PROPERTIES
+                },
+                "required": ["query"]
+            }
+        ),
+        Tool(
+            name="search_papers",
+            description="同时在arXiv、Crossref和本地论文库中搜索，按DOI/arXiv ID合并去重后排序；慢的数据源超过截止时间会被跳过",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -36,7 +118,29 @@ async def list_tools() -> List[Tool]:
                     "max_results": {
                         "type": "integer",
                         "description": "最大结果数量，默认10"
-                    }
+                    },
+                    "backends": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "启用的数据源: arxiv、crossref、local，默认全部（local需要user_workspace）"
+                    },
+                    "timeout": {
+                        "type": "number",
+                        "description": "截止时间（秒），默认10，到时返回已完成数据源的结果"
+                    },
+                    "user_workspace": {
+                        "type": "string",
+                        "description": "用户工作区路径，提供时同时检索本地论文库"
+                    },
+                    "base_path": {
+                        "type": "string",
+                        "description": "论文库所在目录，默认为references"
+                    },
+                    "prefetch": {
+                        "type": "integer",
+                        "description": "返回后在后台预取前N条结果的详情/BibTeX；默认0（不预取）"
+                    },
+                    **_OUTPUT_PROPERTIES
                 },
                 "required": ["query"]
             }
@@ -73,14 +177,109 @@ async def list_tools() -> List[Tool]:
                         "type": "string",
                         "description": "来源：arxiv, doi, title",
                         "enum": ["arxiv", "doi", "title"]
-                    }
+                    },
+                    **_OUTPUT_PROPERTIES
                 },
                 "required": ["paper_id", "source"]
             }
         ),
+        Tool(
+            name="get_arxiv_details_batch",
+            description="批量获取arXiv论文详情（含BibTeX），按id_list分块请求，返回JSON格式的逐条结果",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "paper_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "arXiv ID列表，支持带版本号的ID，如 2101.00001v2"
+                    },
+                    "chunk_size": {
+                        "type": "integer",
+                        "description": "每次请求包含的ID数量，默认100（最大100）"
+                    },
+                    **_OUTPUT_PROPERTIES
+                },
+                "required": ["paper_ids"]
+            }
+        ),
+        Tool(
+            name="resolve_dois_batch",
+            description="通过Crossref并发批量解析DOI，结果按输入顺序以JSON返回",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "dois": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "DOI列表，支持 https://doi.org/ 前缀"
+                    },
+                    "concurrency": {
+                        "type": "integer",
+                        "description": "并发请求数，默认3（最大10）"
+                    },
+                    **_OUTPUT_PROPERTIES
+                },
+                "required": ["dois"]
+            }
+        ),
+        Tool(
+            name="expand_citation_graph",
+            description="从种子DOI出发按层展开引用图（Crossref参考文献 / OpenCitations被引），边缓存在本地，重复展开只请求新节点；返回子图和按入度的排序",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "seeds": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "种子论文的DOI列表"
+                    },
+                    "depth": {
+                        "type": "integer",
+                        "description": "展开层数，默认1（最大3）"
+                    },
+                    "direction": {
+                        "type": "string",
+                        "description": "展开方向: references（引用的文献）、cited_by（被哪些文献引用）或 both，默认references",
+                        "enum": ["references", "cited_by", "both"]
+                    },
+                    "max_nodes": {
+                        "type": "integer",
+                        "description": "子图最多包含的节点数，默认200"
+                    },
+                    "concurrency": {
+                        "type": "integer",
+                        "description": "并发请求数，默认3（最大10）"
+                    },
+                    "output_format": _OUTPUT_PROPERTIES["output_format"]
+                },
+                "required": ["seeds"]
+            }
+        ),
+        Tool(
+            name="get_cache_stats",
+            description="查看arXiv/Crossref响应缓存的命中统计和占用情况",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "clear": {
+                        "type": "boolean",
+                        "description": "是否在返回统计后清空缓存，默认false"
+                    }
+                }
+            }
+        ),
+        Tool(
+            name="get_upstream_status",
+            description="查看arXiv/Crossref等外部API的熔断器状态、限速令牌和排队请求数",
+            inputSchema={
+                "type": "object",
+                "properties": {}
+            }
+        ),
         Tool(
             name="save_search_results",
-            description="保存搜索结果到指定目录 - 按领域分类保存到 references/领域/ 目录",
+            description="保存搜索结果到工作区论文库（按arXiv ID/DOI合并、按领域打标签），并可导出到 references/领域/ 目录",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -99,11 +298,111 @@ async def list_tools() -> List[Tool]:
                     "user_workspace": {
                         "type": "string",
                         "description": "用户工作区路径（必需），用于确定相对路径的基准目录，如：D:/Users/username/Desktop"
+                    },
+                    "export_files": {
+                        "type": "boolean",
+                        "description": "是否同时导出带时间戳的JSON/BibTeX/领域信息文件，默认true"
                     }
                 },
                 "required": ["results", "domain", "user_workspace"]
             }
         ),
+        Tool(
+            name="search_local_library",
+            description="离线检索本地已保存论文的标题、作者、摘要（BM25排序，支持中英文混合查询）",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "检索词，可中英文混合"
+                    },
+                    "domain": {
+                        "type": "string",
+                        "description": "只检索该领域的论文"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "最大结果数量，默认20"
+                    },
+                    "base_path": {
+                        "type": "string",
+                        "description": "论文库所在目录，默认为references"
+                    },
+                    "user_workspace": {
+                        "type": "string",
+                        "description": "用户工作区路径，用于确定相对路径的基准目录"
+                    },
+                    **_OUTPUT_PROPERTIES
+                },
+                "required": ["query"]
+            }
+        ),
+        Tool(
+            name="query_library",
+            description="在工作区论文库中按标题、作者、摘要全文检索已保存的论文",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "检索关键词，为空时按最近更新列出"
+                    },
+                    "domain": {
+                        "type": "string",
+                        "description": "只检索该领域的论文"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "最大结果数量，默认20"
+                    },
+                    "base_path": {
+                        "type": "string",
+                        "description": "论文库所在目录，默认为references"
+                    },
+                    "user_workspace": {
+                        "type": "string",
+                        "description": "用户工作区路径，用于确定相对路径的基准目录"
+                    },
+                    **_OUTPUT_PROPERTIES
+                }
+            }
+        ),
+        Tool(
+            name="export_library",
+            description="将工作区论文库导出为JSON、BibTeX、CSL-JSON或Markdown文件（BibTeX键按作者-年份-标题生成并保存在库中），可按检索词和领域过滤",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "output_file": {
+                        "type": "string",
+                        "description": "导出文件路径，相对路径按user_workspace解析"
+                    },
+                    "format": {
+                        "type": "string",
+                        "description": "导出格式: json、bibtex、csl-json 或 markdown，默认json",
+                        "enum": ["json", "bibtex", "csl-json", "markdown"]
+                    },
+                    "query": {
+                        "type": "string",
+                        "description": "只导出匹配该检索词的论文"
+                    },
+                    "domain": {
+                        "type": "string",
+                        "description": "只导出该领域的论文"
+                    },
+                    "base_path": {
+                        "type": "string",
+                        "description": "论文库所在目录，默认为references"
+                    },
+                    "user_workspace": {
+                        "type": "string",
+                        "description": "用户工作区路径，用于确定相对路径的基准目录"
+                    }
+                },
+                "required": ["output_file"]
+            }
+        ),
         # 原有功能
         Tool(
             name="analyze_citations",
@@ -113,7 +412,7 @@ async def list_tools() -> List[Tool]:
                 "properties": {
                     "tex_file": {
                         "type": "string",
-                        "description": "LaTeX文件路径，默认为thesis_draft.tex"
+                        "description": "LaTeX主文件路径，默认为thesis_draft.tex；会追踪\\input/\\include引入的章节文件"
                     }
                 }
             }
@@ -126,7 +425,7 @@ async def list_tools() -> List[Tool]:
                 "properties": {
                     "tex_file": {
                         "type": "string",
-                        "description": "LaTeX文件路径，默认为thesis_draft.tex"
+                        "description": "LaTeX主文件路径，默认为thesis_draft.tex；会追踪\\input/\\include引入的章节文件"
                     }
                 }
             }
@@ -139,21 +438,54 @@ async def list_tools() -> List[Tool]:
                 "properties": {
                     "tex_file": {
                         "type": "string",
-                        "description": "LaTeX文件路径，默认为thesis_draft.tex"
+                        "description": "LaTeX主文件路径，默认为thesis_draft.tex；会追踪\\input/\\include引入的章节文件"
                     }
                 }
             }
         )
     ]
 
+# 正在执行的工具调用数，超过阈值时取消后台预取
+_active_tool_calls = 0
+
 @server.call_tool()
 async def call_tool(name: str, arguments: Dict) -> List[TextContent]:
     """调用工具"""
-    
+    global _active_tool_calls
+    _active_tool_calls += 1
+    if _active_tool_calls > env_float("THESIS_PREFETCH_BUSY_CALLS", PREFETCH_BUSY_CALLS):
+        cancel_prefetch()
+    try:
+        return await _dispatch_tool(name, arguments)
+    finally:
+        _active_tool_calls -= 1
+
+async def _dispatch_tool(name: str, arguments: Dict) -> List[TextContent]:
     if name == "search_papers_arxiv":
         return await search_papers_arxiv(
             arguments["query"], 
-            arguments.get("max_results", 10)
+            arguments.get("max_results", 10),
+            arguments.get("start", 0),
+            arguments.get("page_token"),
+            arguments.get("output_file"),
+            arguments.get("prefetch"),
+            arguments.get("output_format"),
+            arguments.get("fields"),
+            arguments.get("abstract_chars")
+        )
+    
+    elif name == "search_papers":
+        return await search_papers(
+            arguments["query"],
+            arguments.get("max_results", 10),
+            arguments.get("backends"),
+            arguments.get("timeout"),
+            arguments.get("user_workspace"),
+            arguments.get("base_path", "references"),
+            arguments.get("prefetch"),
+            arguments.get("output_format"),
+            arguments.get("fields"),
+            arguments.get("abstract_chars")
         )
     
     # elif name == "search_papers_semantic_scholar":
@@ -165,14 +497,86 @@ async def call_tool(name: str, arguments: Dict) -> List[TextContent]:
     elif name == "get_paper_details":
         return await get_paper_details(
             arguments["paper_id"], 
-            arguments["source"]
+            arguments["source"],
+            arguments.get("output_format"),
+            arguments.get("fields"),
+            arguments.get("abstract_chars")
+        )
+    
+    elif name == "get_arxiv_details_batch":
+        return await get_arxiv_details_batch(
+            arguments["paper_ids"],
+            arguments.get("chunk_size", ARXIV_ID_CHUNK_SIZE),
+            arguments.get("output_format"),
+            arguments.get("fields"),
+            arguments.get("abstract_chars")
+        )
+    
+    elif name == "resolve_dois_batch":
+        return await resolve_dois_batch(
+            arguments["dois"],
+            arguments.get("concurrency", CROSSREF_DEFAULT_CONCURRENCY),
+            arguments.get("output_format"),
+            arguments.get("fields"),
+            arguments.get("abstract_chars")
         )
     
+    elif name == "expand_citation_graph":
+        return await expand_citation_graph(
+            arguments["seeds"],
+            arguments.get("depth", GRAPH_DEFAULT_DEPTH),
+            arguments.get("direction", "references"),
+            arguments.get("max_nodes", GRAPH_DEFAULT_MAX_NODES),
+            arguments.get("concurrency", CROSSREF_DEFAULT_CONCURRENCY),
+            arguments.get("output_format")
+        )
+    
+    elif name == "get_cache_stats":
+        return await get_cache_stats(arguments.get("clear", False))
+    
+    elif name == "get_upstream_status":
+        return await get_upstream_status()
+    
     elif name == "save_search_results":
         return await save_search_results(
             arguments["results"], 
             arguments["domain"],
             arguments.get("base_path", "references"),
+            arguments.get("user_workspace"),
+            arguments.get("export_files", True)
+        )
+    
+    elif name == "search_local_library":
+        return await search_local_library(
+            arguments["query"],
+            arguments.get("domain"),
+            arguments.get("limit", 20),
+            arguments.get("base_path", "references"),
+            arguments.get("user_workspace"),
+            arguments.get("output_format"),
+            arguments.get("fields"),
+            arguments.get("abstract_chars")
+        )
+    
+    elif name == "query_library":
+        return await query_library(
+            arguments.get("query", ""),
+            arguments.get("domain"),
+            arguments.get("limit", 20),
+            arguments.get("base_path", "references"),
+            arguments.get("user_workspace"),
+            arguments.get("output_format"),
+            arguments.get("fields"),
+            arguments.get("abstract_chars")
+        )
+    
+    elif name == "export_library":
+        return await export_library(
+            arguments["output_file"],
+            arguments.get("format", "json"),
+            arguments.get("query", ""),
+            arguments.get("domain"),
+            arguments.get("base_path", "references"),
             arguments.get("user_workspace")
         )
     
@@ -191,59 +595,633 @@ async def call_tool(name: str, arguments: Dict) -> List[TextContent]:
     else:
         raise ValueError(f"未知工具: {name}")
 
-async def search_papers_arxiv(query: str, max_results: int = 10) -> List[TextContent]:
-    """在arXiv上搜索论文"""
+# 论文详情在Crossref上很少变化，缓存一周
+DOI_CACHE_TTL = 7 * 86400
+
+# 带版本号的arXiv ID（如2101.00001v2）对应的内容发布后不会再变
+_ARXIV_VERSIONED_RE = re.compile(r'v\d+$')
+
+# 流式响应超过这个大小就不再缓存
+STREAM_CACHE_LIMIT = 4 * 1024 * 1024
+
+class OfflineCacheMiss(Exception):
+    """离线模式下缓存中没有对应的响应"""
+
+async def _fetch_bytes(url: str, params: Optional[Dict] = None, ttl: Optional[float] = None,
+                       permanent: bool = False, headers: Optional[Dict] = None,
+                       retries: int = 0) -> bytes:
+    """带本地缓存的GET请求，返回响应体
+
+    缓存未过期时直接返回；上游不可达或返回429/5xx时退回到过期的缓存条目；
+    离线模式下只读缓存。
+    """
+    cache = get_response_cache()
+    key = make_cache_key(url, params)
+    
+    if is_offline():
+        body = cache.get(key, allow_stale=True)
+        if body is None:
+            raise OfflineCacheMiss(f"离线模式下缓存未命中: {url}")
+        return body
+    
+    body = cache.get(key)
+    if body is not None:
+        return body
+    
+    async def fetch() -> bytes:
+        _configure_rate_limits()
+        try:
+            response = await get_http_client().get_with_retry(
+                url, params=params, headers=headers, retries=retries)
+            response.raise_for_status()
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code not in RETRYABLE_STATUS:
+                raise
+            stale = cache.get(key, allow_stale=True)
+            if stale is not None:
+                return stale
+            raise
+        
+        cache.put(key, response.content, ttl=ttl, permanent=permanent)
+        return response.content
+    
+    # 相同请求并发到达时只访问一次上游
+    return await get_single_flight().do(key, fetch)
+
+async def _stream_bytes(url: str, params: Optional[Dict] = None, ttl: Optional[float] = None,
+                        permanent: bool = False, retries: int = 0) -> AsyncIterator[bytes]:
+    """带本地缓存的流式GET请求，逐块产出响应体
+
+    与_fetch_bytes的缓存/离线/重试规则相同，重试只发生在产出第一块数据之前。
+    响应体在不超过STREAM_CACHE_LIMIT时顺带写入缓存，
+    更大的响应只透传不缓存，避免为了缓存把整个响应留在内存里。
+    """
+    cache = get_response_cache()
+    key = make_cache_key(url, params)
+    
+    if is_offline():
+        body = cache.get(key, allow_stale=True)
+        if body is None:
+            raise OfflineCacheMiss(f"离线模式下缓存未命中: {url}")
+        yield body
+        return
+    
+    body = cache.get(key)
+    if body is not None:
+        yield body
+        return
+    
+    # 相同的流式请求正在进行时等它写入缓存；响应太大没有缓存时再自己请求
+    flight = get_single_flight()
+    if await flight.wait(key):
+        body = cache.get(key)
+        if body is not None:
+            yield body
+            return
+    
+    _configure_rate_limits()
+    started = False
+    buffer: Optional[bytearray] = bytearray()
+    async with flight.lead(key):
+        try:
+            async with get_http_client().stream(url, params=params, retries=retries) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    if buffer is not None:
+                        buffer.extend(chunk)
+                        if len(buffer) > STREAM_CACHE_LIMIT:
+                            buffer = None
+                    started = True
+                    yield chunk
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            if started or (isinstance(e, httpx.HTTPStatusError)
+                           and e.response.status_code not in RETRYABLE_STATUS):
+                raise
+            stale = cache.get(key, allow_stale=True)
+            if stale is None:
+                raise
+            yield stale
+            return
+        
+        if buffer is not None:
+            cache.put(key, bytes(buffer), ttl=ttl, permanent=permanent)
+
+_BREAKER_STATE_NAMES = {"closed": "正常", "open": "熔断中", "half_open": "试探中"}
+
+async def get_upstream_status() -> List[TextContent]:
+    """查看各外部API的熔断器状态和限速排队情况"""
     try:
-        # arXiv API搜索
-        url = f"http://export.arxiv.org/api/query"
-        params = {
-            'search_query': f'all:{query}',
-            'start': 0,
-            'max_results': max_results,
-            'sortBy': 'relevance',
-            'sortOrder': 'descending'
-        }
+        _configure_rate_limits()
+        status = get_http_client().status()
+        lines = ["上游服务状态:\n"]
+        for host, info in status.items():
+            breaker, limiter = info['breaker'], info['limiter']
+            lines.append(f"{host}:")
+            state = f"  熔断器: {_BREAKER_STATE_NAMES.get(breaker['state'], breaker['state'])}"
+            if breaker['state'] == 'open':
+                state += f" (约{breaker['retry_in']:.0f}秒后试探)"
+            lines.append(state)
+            lines.append(f"  连续失败: {breaker['consecutive_failures']}，"
+                         f"累计熔断 {breaker['opened']} 次，快速失败 {breaker['rejected']} 次")
+            rate = f"{limiter['rate']:g}/秒" if limiter['rate'] > 0 else "不限速"
+            lines.append(f"  限速: {rate}，突发 {limiter['capacity']:g}，可用令牌 {limiter['tokens']:g}")
+            lines.append(f"  排队等待令牌: {limiter['queued']}，进行中: {info['active']}\n")
+        return [TextContent(type="text", text="\n".join(lines))]
+    except Exception as e:
+        return [TextContent(type="text", text=f"获取上游状态出错: {str(e)}")]
+
+async def get_cache_stats(clear: bool = False) -> List[TextContent]:
+    """查看响应缓存统计"""
+    try:
+        cache = get_response_cache()
+        stats = cache.stats()
+        flight = get_single_flight().stats()
+        prefetch = _prefetch_stats
+        
+        result = f"""响应缓存统计:
+
+命中: {stats['hits']}
+过期条目命中(离线/上游不可用): {stats['stale_hits']}
+未命中: {stats['misses']}
+命中率: {stats['hit_rate']:.1%}
+写入: {stats['stores']}
+淘汰: {stats['evictions']}
+条目数量: {stats['entries']}
+占用: {stats['total_bytes'] / 1024 / 1024:.2f} MB / {stats['max_bytes'] / 1024 / 1024:.0f} MB
+离线模式: {'是' if stats['offline'] else '否'}
+缓存文件: {stats['path']}
+
+并发请求合并:
+访问上游: {flight['leaders']}
+合并的重复请求: {flight['coalesced']}
+进行中: {flight['in_flight']}
+
+后台预取:
+安排预取: {prefetch['scheduled']}
+由搜索结果直接写入: {prefetch['seeded']}
+请求上游获取: {prefetch['fetched']}
+已在缓存中: {prefetch['already_cached']}
+因繁忙取消: {prefetch['cancelled']}
+超出时间预算: {prefetch['timed_out']}"""
         
-        response = requests.get(url, params=params, timeout=30)
-        response.raise_for_status()
+        if clear:
+            cache.clear()
+            result += "\n\n已清空缓存"
         
-        # 解析XML响应
-        root = ET.fromstring(response.content)
+        return [TextContent(type="text", text=result)]
+        
+    except Exception as e:
+        return [TextContent(type="text", text=f"获取缓存统计出错: {str(e)}")]
+
+ARXIV_API_URL = "http://export.arxiv.org/api/query"
+ATOM_NS = '{http://www.w3.org/2005/Atom}'
+OPENSEARCH_NS = '{http://a9.com/-/spec/opensearch/1.1/}'
+
+# 搜索结果每页条数；arXiv要求连续请求之间至少间隔3秒
+ARXIV_PAGE_SIZE = 100
+ARXIV_REQUEST_INTERVAL = 3.0
+
+# arXiv繁忙时经常返回503，开始读取响应前最多重试的次数
+ARXIV_RETRIES = 3
+
+# 单次id_list请求最多包含的论文数量
+ARXIV_ID_CHUNK_SIZE = 100
+
+# 新式ID（2101.00001、2101.00001v2）和旧式ID（hep-th/9901001v1）
+_ARXIV_ID_RE = re.compile(r'^(\d{4}\.\d{4,5}|[a-z\-]+(\.[A-Z]{2})?/\d{7})(v\d+)?$')
+
+_ATOM_ENTRY = f'{ATOM_NS}entry'
+_ATOM_ID = f'{ATOM_NS}id'
+_ATOM_TITLE = f'{ATOM_NS}title'
+_ATOM_SUMMARY = f'{ATOM_NS}summary'
+_ATOM_PUBLISHED = f'{ATOM_NS}published'
+_ATOM_AUTHOR = f'{ATOM_NS}author'
+_ATOM_NAME = f'{ATOM_NS}name'
+_OPENSEARCH_TOTAL = f'{OPENSEARCH_NS}totalResults'
+
+def _parse_arxiv_entry(entry: ET.Element) -> Dict:
+    """把Atom中的一个entry解析为紧凑的论文字典（只遍历一次子元素）"""
+    raw_id = title = summary = published = ''
+    authors = []
+    for child in entry:
+        tag = child.tag
+        if tag == _ATOM_AUTHOR:
+            for name in child:
+                if name.tag == _ATOM_NAME and name.text:
+                    authors.append(name.text.strip())
+        elif tag == _ATOM_TITLE:
+            title = child.text or ''
+        elif tag == _ATOM_SUMMARY:
+            summary = child.text or ''
+        elif tag == _ATOM_PUBLISHED:
+            published = child.text or ''
+        elif tag == _ATOM_ID:
+            raw_id = child.text or ''
+    
+    # id形如 http://arxiv.org/abs/2101.00001v2 或 http://arxiv.org/abs/hep-th/9901001v1
+    arxiv_id = raw_id.strip().split('/abs/')[-1]
+    
+    return {
+        'title': ' '.join(title.split()),
+        'authors': authors,
+        'published': published.strip(),
+        'summary': summary.strip(),
+        'arxiv_id': arxiv_id,
+        'url': f"https://arxiv.org/abs/{arxiv_id}",
+        'source': 'arxiv'
+    }
+
+async def _iter_arxiv_feed(chunks: AsyncIterator[bytes], meta: Optional[Dict] = None) -> AsyncIterator[Dict]:
+    """增量解析arXiv的Atom响应，每解析完一个entry就产出一条论文记录
+
+    已处理的entry会立即从树上移除，内存占用与单页条数无关。
+    结果总数(opensearch:totalResults)写入meta['total']。
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    root = None
+    
+    def drain():
+        nonlocal root
+        for event, elem in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == _ATOM_ENTRY:
+                yield _parse_arxiv_entry(elem)
+                elem.clear()
+                if root is not None:
+                    root.remove(elem)
+            elif elem.tag == _OPENSEARCH_TOTAL and meta is not None and elem.text:
+                meta['total'] = int(elem.text)
+    
+    async for chunk in chunks:
+        parser.feed(chunk)
+        for paper in drain():
+            yield paper
+    parser.close()
+    for paper in drain():
+        yield paper
+
+def _arxiv_bibtex(paper: Dict, paper_id: Optional[str] = None) -> str:
+    """生成arXiv论文的BibTeX条目（作者-年份-标题键，字段经过转义）"""
+    paper_id = paper_id or paper['arxiv_id']
+    return render_bibtex(ExportRecord.from_paper(
+        {**paper, 'arxiv_id': paper_id, 'url': f"https://arxiv.org/abs/{paper_id}"}))
+
+# Crossref礼貌池(polite pool)要求在User-Agent中提供联系邮箱
+# CROSSREF_API_BASE 可指向本地替身服务器用于测试
+CROSSREF_DEFAULT_CONCURRENCY = 3
+CROSSREF_MAX_CONCURRENCY = 10
+
+# OpenCitations COCI提供按DOI查询的被引列表
+OPENCITATIONS_API_BASE = "https://opencitations.net/index/coci/api/v1"
+OPENCITATIONS_RATE_LIMIT = 3.0
+
+def _crossref_base() -> str:
+    return os.environ.get("CROSSREF_API_BASE", "https://api.crossref.org").rstrip('/')
+
+def _opencitations_base() -> str:
+    return os.environ.get("OPENCITATIONS_API_BASE", OPENCITATIONS_API_BASE).rstrip('/')
+
+def _crossref_headers() -> Dict:
+    mailto = os.environ.get("CROSSREF_MAILTO", "").strip()
+    if mailto:
+        return {"User-Agent": f"thesis-reference-manager (mailto:{mailto})"}
+    return {}
+
+def _configure_rate_limits():
+    """设置上游的每秒请求数
+
+    Crossref按公共池/礼貌池限额，可用CROSSREF_RATE_LIMIT覆盖；
+    arXiv按请求间隔限速，可用ARXIV_REQUEST_INTERVAL覆盖（0表示不限速）；
+    OpenCitations可用OPENCITATIONS_RATE_LIMIT覆盖。
+    """
+    client = get_http_client()
+    
+    default_rate = 10 if os.environ.get("CROSSREF_MAILTO", "").strip() else 5
+    rate = env_float("CROSSREF_RATE_LIMIT", default_rate)
+    # Crossref允许在每秒限额内突发，arXiv要求请求之间保持间隔
+    client.set_rate_limit(urlsplit(_crossref_base()).netloc, rate, burst=max(1.0, rate))
+    
+    interval = env_float("ARXIV_REQUEST_INTERVAL", ARXIV_REQUEST_INTERVAL)
+    client.set_rate_limit(urlsplit(ARXIV_API_URL).netloc, 1.0 / interval if interval > 0 else 0)
+    
+    rate = env_float("OPENCITATIONS_RATE_LIMIT", OPENCITATIONS_RATE_LIMIT)
+    client.set_rate_limit(urlsplit(_opencitations_base()).netloc, rate, burst=max(1.0, rate))
+
+def _crossref_work_url(doi: str) -> str:
+    normalized = normalize_doi(doi)
+    if not normalized:
+        raise ValueError(f"无效的DOI: {doi}")
+    return f"{_crossref_base()}/works/{quote(normalized, safe='/')}"
+
+async def _fetch_crossref_work(doi: str) -> Dict:
+    """从Crossref获取单个DOI的元数据（message部分）"""
+    url = _crossref_work_url(doi)
+    content = await _fetch_bytes(url, ttl=DOI_CACHE_TTL, headers=_crossref_headers(), retries=3)
+    return json.loads(content)['message']
+
+def _parse_crossref_work(work: Dict) -> Dict:
+    """把Crossref的work记录解析为论文字典"""
+    authors = [f"{author.get('given', '')} {author.get('family', '')}".strip()
+               for author in work.get('author', [])]
+    date_parts = (work.get('published-print') or work.get('published-online')
+                  or work.get('issued') or {}).get('date-parts', [[None]])
+    return {
+        'title': (work.get('title') or [''])[0],
+        'authors': authors,
+        'year': date_parts[0][0] if date_parts and date_parts[0] else None,
+        'journal': (work.get('container-title') or [''])[0],
+        'doi': work.get('DOI', ''),
+        'url': work.get('URL', ''),
+        'type': work.get('type', ''),
+        'reference_count': work.get('reference-count', 0),
+        'source': 'crossref'
+    }
+
+def _encode_page_token(query: str, start: int) -> str:
+    raw = json.dumps({'q': query, 'start': start}, ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_page_token(query: str, page_token: str) -> int:
+    """解析翻页令牌，返回起始位置；令牌与查询词不匹配时报错"""
+    try:
+        padded = page_token + '=' * (-len(page_token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        start = int(data['start'])
+    except Exception:
+        raise ValueError("无效的page_token")
+    if data.get('q') != query:
+        raise ValueError("page_token与当前查询词不匹配")
+    return start
+
+def _arxiv_search_params(query: str, start: int, size: int) -> Dict:
+    return {
+        'search_query': f'all:{query}',
+        'start': start,
+        'max_results': size,
+        'sortBy': 'relevance',
+        'sortOrder': 'descending'
+    }
+
+async def _fetch_arxiv_search_page(query: str, start: int, size: int) -> Tuple[List[Dict], int]:
+    """获取一页arXiv搜索结果，返回(论文列表, 结果总数)"""
+    meta = {'total': 0}
+    stream = _stream_bytes(ARXIV_API_URL, params=_arxiv_search_params(query, start, size),
+                           retries=ARXIV_RETRIES)
+    async with aclosing(stream) as chunks, aclosing(_iter_arxiv_feed(chunks, meta)) as feed:
+        papers = [paper async for paper in feed]
+    return papers, meta['total']
+
+async def iter_arxiv_search(query: str, max_results: int, start: int = 0,
+                            page_size: int = ARXIV_PAGE_SIZE) -> AsyncIterator[Dict]:
+    """按页拉取arXiv搜索结果并逐条产出
+
+    每页之间的间隔由arXiv主机的限速器保证（默认3秒），调用方拿到一条处理一条，
+    不需要一次性持有全部结果。
+    """
+    fetched = 0
+    while fetched < max_results:
+        size = min(page_size, max_results - fetched)
+        meta = {'total': 0}
+        page_count = 0
+        stream = _stream_bytes(ARXIV_API_URL, params=_arxiv_search_params(query, start + fetched, size),
+                               retries=ARXIV_RETRIES)
+        # 调用方提前停止时立即关闭当前页的响应流，不等垃圾回收
+        async with aclosing(stream) as chunks, aclosing(_iter_arxiv_feed(chunks, meta)) as feed:
+            async for paper in feed:
+                page_count += 1
+                yield paper
+        fetched += page_count
+        if not page_count or start + fetched >= meta['total']:
+            break
+
+def _format_arxiv_result(i: int, result: Dict) -> str:
+    return (f"{i}. {result['title']}\n"
+            f"   作者: {', '.join(result['authors'])}\n"
+            f"   发表时间: {result['published'][:10]}\n"
+            f"   arXiv ID: {result['arxiv_id']}\n"
+            f"   链接: {result['url']}\n"
+            f"   摘要: {result['summary'][:200]}...\n\n")
+
+# 结构化输出：默认格式可用THESIS_OUTPUT_FORMAT覆盖
+OUTPUT_FORMATS = ("text", "json")
+
+# arXiv结果的摘要字段叫summary，Crossref和论文库中叫abstract
+_FIELD_ALIASES = {'abstract': 'summary', 'summary': 'abstract'}
+
+def _output_format(output_format: Optional[str]) -> str:
+    output_format = (output_format or os.environ.get("THESIS_OUTPUT_FORMAT") or "text").lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}，可选 text、json")
+    return output_format
+
+def compact_record(paper: Dict, fields: Optional[List[str]] = None,
+                   abstract_chars: Optional[int] = None) -> Dict:
+    """把一条论文记录压缩成JSON输出：按fields挑选字段、去掉空值、截断摘要"""
+    if fields:
+        record = {}
+        for field in fields:
+            if field in paper:
+                record[field] = paper[field]
+            elif _FIELD_ALIASES.get(field) in paper:
+                record[field] = paper[_FIELD_ALIASES[field]]
+    else:
+        record = dict(paper)
+    record = {key: value for key, value in record.items() if value not in (None, '', [], {})}
+    
+    if abstract_chars is not None:
+        limit = max(0, int(abstract_chars))
+        for key in ('summary', 'abstract'):
+            text = record.get(key)
+            if not isinstance(text, str) or len(text) <= limit:
+                continue
+            if limit:
+                record[key] = text[:limit].rstrip() + '…'
+            else:
+                del record[key]
+    return record
+
+def _record_shaper(output_format: str, fields: Optional[List[str]],
+                   abstract_chars: Optional[int]) -> Callable[[Dict], Dict]:
+    """text输出保持完整记录，json输出按字段和摘要长度压缩"""
+    if output_format != "json":
+        return lambda paper: paper
+    return lambda paper: compact_record(paper, fields, abstract_chars)
+
+def _json_content(payload: Dict, indent: Optional[int] = None) -> List[TextContent]:
+    separators = None if indent else (',', ':')
+    return [TextContent(type="text", text=json.dumps(payload, ensure_ascii=False, indent=indent,
+                                                     separators=separators))]
+
+# 预取：默认不开启；整个预取任务的时间预算（秒）；并发工具调用超过该数量视为繁忙
+PREFETCH_DEFAULT_TOP_N = 0
+PREFETCH_BUDGET = 20.0
+PREFETCH_BUSY_CALLS = 2
+
+_prefetch_tasks: Set[asyncio.Task] = set()
+_prefetch_stats = {'scheduled': 0, 'seeded': 0, 'fetched': 0, 'already_cached': 0,
+                   'cancelled': 0, 'timed_out': 0}
+
+def _arxiv_detail_feed(paper: Dict) -> bytes:
+    """把搜索结果中的一条arXiv记录写成id_list查询返回的Atom格式"""
+    feed = ET.Element(f'{ATOM_NS}feed')
+    entry = ET.SubElement(feed, _ATOM_ENTRY)
+    ET.SubElement(entry, _ATOM_ID).text = f"http://arxiv.org/abs/{paper['arxiv_id']}"
+    ET.SubElement(entry, _ATOM_PUBLISHED).text = paper.get('published', '')
+    ET.SubElement(entry, _ATOM_TITLE).text = paper.get('title', '')
+    ET.SubElement(entry, _ATOM_SUMMARY).text = paper.get('summary', '')
+    for name in paper.get('authors', []):
+        ET.SubElement(ET.SubElement(entry, _ATOM_AUTHOR), _ATOM_NAME).text = name
+    return ET.tostring(feed, encoding='utf-8', xml_declaration=True)
+
+def _seed_arxiv_details(papers: List[Dict]) -> int:
+    """arXiv搜索返回的entry与id_list详情查询的内容相同，直接写入详情缓存，不需要再请求arXiv"""
+    cache = get_response_cache()
+    seeded = 0
+    for paper in papers:
+        versioned = paper['arxiv_id']
+        for paper_id in dict.fromkeys([versioned, normalize_arxiv_id(versioned)]):
+            key = make_cache_key(ARXIV_API_URL, {'id_list': paper_id})
+            if cache.contains(key):
+                _prefetch_stats['already_cached'] += 1
+                continue
+            # 由搜索结果改写而来，不是arXiv的原始响应：带版本号的也按普通TTL过期，
+            # 过期后的详情查询取回原始响应再永久缓存
+            cache.put(key, _arxiv_detail_feed(paper), ttl=DOI_CACHE_TTL)
+            seeded += 1
+    _prefetch_stats['seeded'] += seeded
+    return seeded
+
+async def _prefetch_details(papers: List[Dict], budget: float):
+    arxiv_papers = [paper for paper in papers if paper.get('arxiv_id')]
+    _seed_arxiv_details(arxiv_papers)
+    
+    # 只有DOI的结果（Crossref）需要实际请求，在预算内并发获取
+    cache = get_response_cache()
+    dois = []
+    for paper in papers:
+        doi = paper.get('doi')
+        if paper.get('arxiv_id') or not normalize_doi(doi):
+            continue
+        if cache.contains(make_cache_key(_crossref_work_url(doi))):
+            _prefetch_stats['already_cached'] += 1
+        else:
+            dois.append(doi)
+    if not dois:
+        return
+    
+    async def fetch(doi: str):
+        await _fetch_crossref_work(doi)
+        _prefetch_stats['fetched'] += 1
+    
+    try:
+        await asyncio.wait_for(asyncio.gather(*(fetch(doi) for doi in dois), return_exceptions=True), budget)
+    except asyncio.TimeoutError:
+        _prefetch_stats['timed_out'] += 1
+
+def schedule_prefetch(papers: List[Dict], top_n: Optional[int] = None) -> int:
+    """在后台预取前top_n条结果的详情，返回安排预取的条数；服务器繁忙时不预取"""
+    if top_n is None:
+        top_n = int(env_float("THESIS_PREFETCH_TOP_N", PREFETCH_DEFAULT_TOP_N))
+    targets = [paper for paper in papers[:max(0, int(top_n))] if paper.get('arxiv_id') or paper.get('doi')]
+    if not targets or _active_tool_calls > env_float("THESIS_PREFETCH_BUSY_CALLS", PREFETCH_BUSY_CALLS):
+        return 0
+    
+    task = asyncio.create_task(_prefetch_details(targets, env_float("THESIS_PREFETCH_BUDGET", PREFETCH_BUDGET)))
+    _prefetch_tasks.add(task)
+    
+    def finished(done: asyncio.Task):
+        _prefetch_tasks.discard(done)
+        if done.cancelled():
+            _prefetch_stats['cancelled'] += 1
+        else:
+            # 取出异常避免未处理警告；预取失败不影响任何调用，后续查询会正常请求上游
+            done.exception()
+    task.add_done_callback(finished)
+    _prefetch_stats['scheduled'] += len(targets)
+    return len(targets)
+
+def cancel_prefetch():
+    """取消所有进行中的预取（服务器繁忙时调用）"""
+    for task in list(_prefetch_tasks):
+        task.cancel()
+
+async def search_papers_arxiv(query: str, max_results: int = 10, start: int = 0,
+                              page_token: Optional[str] = None,
+                              output_file: Optional[str] = None,
+                              prefetch: Optional[int] = None, output_format: Optional[str] = None,
+                              fields: Optional[List[str]] = None,
+                              abstract_chars: Optional[int] = None) -> List[TextContent]:
+    """在arXiv上搜索论文
+
+    直接返回时每次最多一页（ARXIV_PAGE_SIZE条），通过page_token继续翻页；
+    指定output_file时按页拉取全部max_results条结果，逐条以JSON Lines写入文件。
+    output_format为json时返回紧凑的JSON记录，fields/abstract_chars同样作用于写入文件的记录。
+    """
+    try:
+        output_format = _output_format(output_format)
+        shape = _record_shaper(output_format, fields, abstract_chars)
+        if page_token:
+            start = _decode_page_token(query, page_token)
+        start = max(0, int(start))
+        max_results = max(1, int(max_results))
         
-        results = []
-        for entry in root.findall('{http://www.w3.org/2005/Atom}entry'):
-            title = entry.find('{http://www.w3.org/2005/Atom}title').text.strip()
-            authors = []
-            for author in entry.findall('{http://www.w3.org/2005/Atom}author'):
-                name = author.find('{http://www.w3.org/2005/Atom}name').text
-                authors.append(name)
+        if output_file:
+            written = 0
+            with open(output_file, 'w', encoding='utf-8') as f:
+                async with aclosing(iter_arxiv_search(query, max_results, start)) as papers:
+                    async for paper in papers:
+                        f.write(json.dumps(shape(paper), ensure_ascii=False) + '\n')
+                        written += 1
+                        if written % ARXIV_PAGE_SIZE == 0:
+                            f.flush()
             
-            published = entry.find('{http://www.w3.org/2005/Atom}published').text
-            summary = entry.find('{http://www.w3.org/2005/Atom}summary').text.strip()
-            arxiv_id = entry.find('{http://www.w3.org/2005/Atom}id').text.split('/')[-1]
+            next_token = _encode_page_token(query, start + written) if written == max_results else None
+            if output_format == "json":
+                response = {'query': query, 'output_file': os.path.abspath(output_file), 'written': written}
+                if next_token:
+                    response['next_page_token'] = next_token
+                return _json_content(response)
             
-            result = {
-                'title': title,
-                'authors': authors,
-                'published': published,
-                'summary': summary,
-                'arxiv_id': arxiv_id,
-                'url': f"https://arxiv.org/abs/{arxiv_id}",
-                'source': 'arxiv'
-            }
-            results.append(result)
+            output = f"arXiv搜索结果 (关键词: {query}):\n\n"
+            output += f"已写入 {written} 条结果 (JSON Lines): {os.path.abspath(output_file)}\n"
+            if next_token:
+                output += f"下一页 page_token: {next_token}"
+            return [TextContent(type="text", text=output)]
+        
+        size = min(max_results, ARXIV_PAGE_SIZE)
+        results, total = await _fetch_arxiv_search_page(query, start, size)
+        # 预取需要完整的记录，先于字段裁剪安排
+        prefetched = schedule_prefetch(results, prefetch)
+        next_start = start + len(results)
+        has_more = bool(results) and next_start < total
+        
+        if output_format == "json":
+            response = {'query': query, 'start': start, 'total': total,
+                        'results': [shape(result) for result in results]}
+            if prefetched:
+                response['prefetched'] = prefetched
+            if has_more:
+                response['next_page_token'] = _encode_page_token(query, next_start)
+            return _json_content(response)
         
         # 格式化输出
-        output = f"arXiv搜索结果 (关键词: {query}):\n\n"
-        for i, result in enumerate(results, 1):
-            output += f"{i}. {result['title']}\n"
-            output += f"   作者: {', '.join(result['authors'])}\n"
-            output += f"   发表时间: {result['published'][:10]}\n"
-            output += f"   arXiv ID: {result['arxiv_id']}\n"
-            output += f"   链接: {result['url']}\n"
-            output += f"   摘要: {result['summary'][:200]}...\n\n"
+        parts = [f"arXiv搜索结果 (关键词: {query}):\n\n"]
+        for i, result in enumerate(results, start + 1):
+            parts.append(_format_arxiv_result(i, result))
         
-        return [TextContent(type="text", text=output)]
+        if prefetched:
+            parts.append(f"已在后台预取前 {prefetched} 条结果的详情\n")
+        
+        if has_more:
+            parts.append(f"共 {total} 条结果，当前第 {start + 1}-{next_start} 条\n")
+            parts.append(f"下一页 page_token: {_encode_page_token(query, next_start)}")
+            if max_results > size:
+                parts.append(f"\n单次最多返回{ARXIV_PAGE_SIZE}条，大量结果请使用output_file参数")
+        
+        return [TextContent(type="text", text=''.join(parts))]
         
     except Exception as e:
         return [TextContent(type="text", text=f"arXiv搜索出错: {str(e)}")]
@@ -295,68 +1273,59 @@ async def search_papers_arxiv(query: str, max_results: int = 10) -> List[TextCon
     except Exception as e:
         return [TextContent(type="text", text=f"Semantic Scholar搜索出错: {str(e)}")]
 
-async def get_paper_details(paper_id: str, source: str) -> List[TextContent]:
+async def get_paper_details(paper_id: str, source: str, output_format: Optional[str] = None,
+                            fields: Optional[List[str]] = None,
+                            abstract_chars: Optional[int] = None) -> List[TextContent]:
     """获取论文详细信息"""
     try:
+        output_format = _output_format(output_format)
         if source == "arxiv":
             # 获取arXiv论文详情
-            url = f"http://export.arxiv.org/api/query?id_list={paper_id}"
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            
-            root = ET.fromstring(response.content)
-            entry = root.find('{http://www.w3.org/2005/Atom}entry')
+            url = ARXIV_API_URL
+            # 带版本号的论文永久缓存；不带版本号的ID指向最新版本，按Crossref同样的周期刷新
+            stream = _stream_bytes(
+                url, params={'id_list': paper_id},
+                ttl=DOI_CACHE_TTL,
+                permanent=bool(_ARXIV_VERSIONED_RE.search(paper_id.strip())),
+                retries=ARXIV_RETRIES
+            )
+            async with aclosing(stream) as chunks, aclosing(_iter_arxiv_feed(chunks)) as feed:
+                papers = [paper async for paper in feed]
             
-            if entry is not None:
-                title = entry.find('{http://www.w3.org/2005/Atom}title').text.strip()
-                authors = []
-                for author in entry.findall('{http://www.w3.org/2005/Atom}author'):
-                    name = author.find('{http://www.w3.org/2005/Atom}name').text
-                    authors.append(name)
-                
-                published = entry.find('{http://www.w3.org/2005/Atom}published').text
-                summary = entry.find('{http://www.w3.org/2005/Atom}summary').text.strip()
+            if papers:
+                paper = papers[0]
                 
                 # 生成BibTeX格式
-                bibtex_key = f"arxiv_{paper_id.replace('.', '_')}"
-                bibtex = f"""@article{{{bibtex_key},
-    title={{{title}}},
-    author={{{' and '.join(authors)}}},
-    journal={{arXiv preprint arXiv:{paper_id}}},
-    year={{{published[:4]}}},
-    url={{https://arxiv.org/abs/{paper_id}}}
-}}"""
+                bibtex = _arxiv_bibtex(paper, paper_id)
+                if output_format == "json":
+                    return _json_content({'id': paper_id, 'status': 'ok', 'paper': compact_record(
+                        {**paper, 'bibtex': bibtex}, fields, abstract_chars)})
                 
                 result = f"论文详细信息:\n\n"
-                result += f"标题: {title}\n"
-                result += f"作者: {', '.join(authors)}\n"
-                result += f"发表时间: {published}\n"
+                result += f"标题: {paper['title']}\n"
+                result += f"作者: {', '.join(paper['authors'])}\n"
+                result += f"发表时间: {paper['published']}\n"
                 result += f"arXiv ID: {paper_id}\n"
-                result += f"摘要: {summary}\n\n"
+                result += f"摘要: {paper['summary']}\n\n"
                 result += f"BibTeX格式:\n{bibtex}"
                 
                 return [TextContent(type="text", text=result)]
+            if output_format == "json":
+                return _json_content({'id': paper_id, 'status': 'not_found'})
         
         elif source == "doi":
             # 使用DOI获取论文信息
-            url = f"https://api.crossref.org/works/{paper_id}"
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
-            work = data['message']
-            
-            title = work.get('title', [''])[0]
-            authors = [author.get('given', '') + ' ' + author.get('family', '') 
-                      for author in work.get('author', [])]
-            year = work.get('published-print', {}).get('date-parts', [[None]])[0][0]
-            journal = work.get('container-title', [''])[0]
+            work = await _fetch_crossref_work(paper_id)
+            paper = _parse_crossref_work(work)
+            if output_format == "json":
+                return _json_content({'id': paper_id, 'status': 'ok',
+                                      'paper': compact_record(paper, fields, abstract_chars)})
             
             result = f"论文详细信息 (DOI: {paper_id}):\n\n"
-            result += f"标题: {title}\n"
-            result += f"作者: {', '.join(authors)}\n"
-            result += f"年份: {year}\n"
-            result += f"期刊: {journal}\n"
+            result += f"标题: {paper['title']}\n"
+            result += f"作者: {', '.join(paper['authors'])}\n"
+            result += f"年份: {paper['year']}\n"
+            result += f"期刊: {paper['journal']}\n"
             result += f"DOI: {paper_id}\n"
             
             return [TextContent(type="text", text=result)]
@@ -367,17 +1336,499 @@ async def get_paper_details(paper_id: str, source: str) -> List[TextContent]:
     except Exception as e:
         return [TextContent(type="text", text=f"获取论文详情出错: {str(e)}")]
 
-async def save_search_results(results: List[Dict], domain: str, base_path: str = "references", user_workspace: str = None) -> List[TextContent]:
-    """保存搜索结果到指定路径 - 按领域分类保存"""
+async def get_arxiv_details_batch(paper_ids: List[str], chunk_size: int = ARXIV_ID_CHUNK_SIZE,
+                                  output_format: Optional[str] = None, fields: Optional[List[str]] = None,
+                                  abstract_chars: Optional[int] = None) -> List[TextContent]:
+    """批量获取arXiv论文详情，按id_list分块请求，返回JSON结构的逐条结果
+
+    output_format为json时输出不带缩进的紧凑JSON，fields/abstract_chars作用于每条paper。
+    """
     try:
-        # 如果base_path是相对路径，需要用户提供用户工作区路径
-        if not os.path.isabs(base_path):
-            if user_workspace:
-                # 使用用户提供的工作区路径
-                base_path = os.path.join(user_workspace, base_path)
+        output_format = _output_format(output_format)
+        shape = _record_shaper(output_format, fields, abstract_chars)
+        chunk_size = max(1, min(int(chunk_size), ARXIV_ID_CHUNK_SIZE))
+        
+        # 保持输入顺序并去重
+        requested = []
+        for paper_id in paper_ids:
+            paper_id = str(paper_id).strip()
+            for prefix in ('arXiv:', 'arxiv:', 'https://arxiv.org/abs/', 'http://arxiv.org/abs/'):
+                if paper_id.startswith(prefix):
+                    paper_id = paper_id[len(prefix):]
+            if paper_id and paper_id not in requested:
+                requested.append(paper_id)
+        
+        entries = {}
+        for paper_id in requested:
+            if not _ARXIV_ID_RE.match(paper_id):
+                # 格式错误的ID会让arXiv整块请求失败，提前剔除
+                entries[paper_id] = {'id': paper_id, 'status': 'invalid_id', 'error': 'arXiv ID格式不正确'}
+        
+        valid_ids = [paper_id for paper_id in requested if paper_id not in entries]
+        for start in range(0, len(valid_ids), chunk_size):
+            chunk = valid_ids[start:start + chunk_size]
+            # 返回的ID总是带版本号，请求中不带版本号的按基础ID匹配
+            found = {}
+            try:
+                stream = _stream_bytes(
+                    ARXIV_API_URL,
+                    params={'id_list': ','.join(chunk), 'max_results': len(chunk)},
+                    ttl=DOI_CACHE_TTL,
+                    permanent=all(_ARXIV_VERSIONED_RE.search(paper_id) for paper_id in chunk),
+                    retries=ARXIV_RETRIES
+                )
+                async with aclosing(stream) as chunks, aclosing(_iter_arxiv_feed(chunks)) as feed:
+                    async for paper in feed:
+                        if not paper['title'] or paper['title'] == 'Error':
+                            continue
+                        found[paper['arxiv_id']] = paper
+                        found.setdefault(normalize_arxiv_id(paper['arxiv_id']), paper)
+            except Exception as e:
+                for paper_id in chunk:
+                    entries[paper_id] = {'id': paper_id, 'status': 'error', 'error': str(e)}
+                continue
+            
+            for paper_id in chunk:
+                paper = found.get(paper_id)
+                if paper is None:
+                    entries[paper_id] = {'id': paper_id, 'status': 'not_found'}
+                else:
+                    entries[paper_id] = {
+                        'id': paper_id,
+                        'status': 'ok',
+                        'paper': shape({**paper, 'bibtex': _arxiv_bibtex(paper, paper_id)})
+                    }
+        
+        results = [entries[paper_id] for paper_id in requested]
+        response = {
+            'requested': len(requested),
+            'found': sum(1 for r in results if r['status'] == 'ok'),
+            'missing': [r['id'] for r in results if r['status'] != 'ok'],
+            'results': results
+        }
+        return _json_content(response, indent=None if output_format == "json" else 2)
+        
+    except Exception as e:
+        return [TextContent(type="text", text=f"批量获取arXiv论文详情出错: {str(e)}")]
+
+async def resolve_dois_batch(dois: List[str], concurrency: int = CROSSREF_DEFAULT_CONCURRENCY,
+                             output_format: Optional[str] = None, fields: Optional[List[str]] = None,
+                             abstract_chars: Optional[int] = None) -> List[TextContent]:
+    """并发解析一批DOI，结果按输入顺序返回JSON"""
+    try:
+        output_format = _output_format(output_format)
+        shape = _record_shaper(output_format, fields, abstract_chars)
+        concurrency = max(1, min(int(concurrency), CROSSREF_MAX_CONCURRENCY))
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def resolve(doi: str) -> Dict:
+            async with semaphore:
+                try:
+                    work = await _fetch_crossref_work(doi)
+                    return {'doi': doi, 'status': 'ok', 'paper': shape(_parse_crossref_work(work))}
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code == 404:
+                        return {'doi': doi, 'status': 'not_found'}
+                    return {'doi': doi, 'status': 'error', 'error': f"HTTP {e.response.status_code}"}
+                except Exception as e:
+                    return {'doi': doi, 'status': 'error', 'error': str(e)}
+        
+        cleaned = [str(doi).strip() for doi in dois if str(doi).strip()]
+        results = await asyncio.gather(*(resolve(doi) for doi in cleaned))
+        
+        response = {
+            'requested': len(cleaned),
+            'resolved': sum(1 for r in results if r['status'] == 'ok'),
+            'failed': [r['doi'] for r in results if r['status'] != 'ok'],
+            'results': results
+        }
+        return _json_content(response, indent=None if output_format == "json" else 2)
+        
+    except Exception as e:
+        return [TextContent(type="text", text=f"批量解析DOI出错: {str(e)}")]
+
+# 引用图展开：默认深度、最大深度和节点预算；被引列表在响应缓存中保存一天
+GRAPH_DEFAULT_DEPTH = 1
+GRAPH_MAX_DEPTH = 3
+GRAPH_DEFAULT_MAX_NODES = 200
+GRAPH_TOP_N = 20
+CITED_BY_CACHE_TTL = 86400
+
+_DOI_RE = re.compile(r'10\.\d{4,9}/\S+')
+
+async def _fetch_references(doi: str) -> List[str]:
+    """通过Crossref获取该论文引用的文献DOI，同时记录节点元数据"""
+    work = await _fetch_crossref_work(doi)
+    graph = get_citation_graph()
+    paper = _parse_crossref_work(work)
+    graph.add_node(doi, paper['title'], paper['year'], paper['authors'])
+    
+    references = []
+    for reference in work.get('reference', []):
+        cited = normalize_doi(reference.get('DOI'))
+        if not cited:
+            # 没有DOI的参考文献无法作为图节点
+            continue
+        year = str(reference.get('year', ''))[:4]
+        graph.add_node(cited, reference.get('article-title') or reference.get('volume-title'),
+                       int(year) if year.isdigit() else None,
+                       [reference['author']] if reference.get('author') else None)
+        references.append(cited)
+    return list(dict.fromkeys(references))
+
+async def _fetch_cited_by(doi: str) -> List[str]:
+    """通过OpenCitations COCI获取引用该论文的文献DOI"""
+    url = f"{_opencitations_base()}/citations/{quote(doi, safe='/')}"
+    content = await _fetch_bytes(url, ttl=CITED_BY_CACHE_TTL, retries=3)
+    citing = []
+    for item in json.loads(content):
+        # v1接口直接返回DOI，新版接口返回"omid:... doi:10.x/..."形式的标识符列表
+        match = _DOI_RE.search(str(item.get('citing', '')))
+        if match:
+            citing.append(normalize_doi(match.group(0)))
+    return list(dict.fromkeys(citing))
+
+_GRAPH_FETCHERS = {'references': _fetch_references, 'cited_by': _fetch_cited_by}
+
+async def build_citation_graph(seeds: List[str], depth: int = GRAPH_DEFAULT_DEPTH, direction: str = "references",
+                               max_nodes: int = GRAPH_DEFAULT_MAX_NODES,
+                               concurrency: int = CROSSREF_DEFAULT_CONCURRENCY) -> Dict:
+    """从种子DOI出发按层（广度优先）展开引用图
+
+    每层的节点并发展开（最多concurrency个请求同时进行），节点总数达到max_nodes后不再加入新节点。
+    已在本地图缓存中展开过的节点直接读取缓存的边，不访问上游。
+    """
+    if direction not in (*DIRECTIONS, "both"):
+        raise ValueError(f"不支持的展开方向: {direction}，可选 references、cited_by、both")
+    directions = DIRECTIONS if direction == "both" else (direction,)
+    depth = max(0, min(int(depth), GRAPH_MAX_DEPTH))
+    max_nodes = max(1, int(max_nodes))
+    semaphore = asyncio.Semaphore(max(1, min(int(concurrency), CROSSREF_MAX_CONCURRENCY)))
+    graph = get_citation_graph()
+    stats = {'fetched': 0, 'from_cache': 0, 'errors': {}}
+    
+    depth_of: Dict[str, int] = {}
+    for seed in seeds:
+        seed = normalize_doi(str(seed))
+        if seed and len(depth_of) < max_nodes:
+            depth_of.setdefault(seed, 0)
+    
+    async def expand(doi: str) -> List[str]:
+        neighbours = []
+        for name in directions:
+            if graph.is_expanded(doi, name):
+                neighbours.extend(graph.neighbours(doi, name))
+                stats['from_cache'] += 1
+                continue
+            try:
+                async with semaphore:
+                    found = await _GRAPH_FETCHERS[name](doi)
+            except Exception as e:
+                stats['errors'][doi] = str(e)
+                continue
+            graph.record_expansion(doi, name, found)
+            stats['fetched'] += 1
+            neighbours.extend(found)
+        return neighbours
+    
+    frontier = list(depth_of)
+    truncated = False
+    for level in range(1, depth + 1):
+        if not frontier or truncated:
+            break
+        next_frontier = []
+        for neighbours in await asyncio.gather(*(expand(doi) for doi in frontier)):
+            for other in neighbours:
+                if other in depth_of:
+                    continue
+                if len(depth_of) >= max_nodes:
+                    truncated = True
+                    break
+                depth_of[other] = level
+                next_frontier.append(other)
+        frontier = next_frontier
+    
+    edges = graph.subgraph_edges(depth_of)
+    in_degree = {doi: 0 for doi in depth_of}
+    out_degree = {doi: 0 for doi in depth_of}
+    for citing, cited in edges:
+        out_degree[citing] += 1
+        in_degree[cited] += 1
+    
+    metadata = graph.nodes(depth_of)
+    nodes = []
+    for doi in sorted(depth_of, key=lambda doi: (-in_degree[doi], depth_of[doi], doi)):
+        node = metadata.get(doi, {'doi': doi})
+        nodes.append({**node, 'depth': depth_of[doi], 'in_degree': in_degree[doi], 'out_degree': out_degree[doi]})
+    return {'seeds': [doi for doi, level in depth_of.items() if level == 0], 'direction': direction,
+            'depth': depth, 'nodes': nodes, 'edges': [list(edge) for edge in edges],
+            'truncated': truncated, 'stats': stats}
+
+async def expand_citation_graph(seeds: List[str], depth: int = GRAPH_DEFAULT_DEPTH, direction: str = "references",
+                                max_nodes: int = GRAPH_DEFAULT_MAX_NODES,
+                                concurrency: int = CROSSREF_DEFAULT_CONCURRENCY,
+                                output_format: Optional[str] = None) -> List[TextContent]:
+    """展开引用图，返回子图和按入度（子图内被引次数）的排序"""
+    try:
+        output_format = _output_format(output_format)
+        result = await build_citation_graph(seeds, depth, direction, max_nodes, concurrency)
+        if output_format == "json":
+            result['nodes'] = [compact_record(node) for node in result['nodes']]
+            return _json_content(result)
+        
+        stats = result['stats']
+        text = (f"引用图 (方向: {direction}，深度: {result['depth']})：{len(result['nodes'])} 个节点，"
+                f"{len(result['edges'])} 条边\n")
+        cached = get_citation_graph().stats()
+        text += f"请求上游 {stats['fetched']} 次，读取本地图缓存 {stats['from_cache']} 次"
+        text += f"（缓存共 {cached['nodes']} 个节点、{cached['edges']} 条边）\n"
+        if result['truncated']:
+            text += f"⚠️ 已达到节点上限 {max_nodes}，部分节点未加入\n"
+        for doi, error in stats['errors'].items():
+            text += f"❌ {doi}: {error}\n"
+        text += f"\n按入度排序（前{GRAPH_TOP_N}）:\n"
+        for i, node in enumerate(result['nodes'][:GRAPH_TOP_N], 1):
+            year = node.get('year') or 'N/A'
+            text += f"{i}. {node.get('title') or '（无标题）'} ({year})\n"
+            text += f"   DOI: {node['doi']}  入度: {node['in_degree']}  出度: {node['out_degree']}  层: {node['depth']}\n"
+        text += "\n完整的节点和边请使用 output_format=\"json\""
+        return [TextContent(type="text", text=text)]
+    except Exception as e:
+        return [TextContent(type="text", text=f"展开引用图出错: {str(e)}")]
+
+# 联合检索的默认截止时间（秒）和启用的后端，可用环境变量覆盖
+SEARCH_DEFAULT_TIMEOUT = 10.0
+SEARCH_DEFAULT_BACKENDS = "arxiv,crossref,local"
+# 倒数排名融合的平滑常数
+RRF_K = 60
+
+async def _search_backend_arxiv(query: str, limit: int, options: Dict) -> List[Dict]:
+    results, _ = await _fetch_arxiv_search_page(query, 0, min(limit, ARXIV_PAGE_SIZE))
+    return results
+
+async def _search_backend_crossref(query: str, limit: int, options: Dict) -> List[Dict]:
+    params = {
+        'query': query,
+        'rows': min(limit, 100),
+        'select': 'DOI,title,author,issued,published-print,published-online,container-title,URL,type,reference-count'
+    }
+    content = await _fetch_bytes(f"{_crossref_base()}/works", params=params, headers=_crossref_headers(), retries=1)
+    return [_parse_crossref_work(item) for item in json.loads(content)['message'].get('items', [])]
+
+async def _search_backend_local(query: str, limit: int, options: Dict) -> List[Dict]:
+    def search() -> List[Dict]:
+        library = _open_library(options.get('base_path', 'references'), options.get('user_workspace'))
+        if library is None:
+            return []
+        try:
+            return [paper for _, paper in library.bm25_search(query, limit=limit)]
+        finally:
+            library.close()
+    # SQLite查询是同步的，放到线程中避免阻塞其他后端
+    return await asyncio.to_thread(search)
+
+# 联合检索后端：名称 -> async (query, limit, options) -> 论文列表；测试中可替换为本地替身
+SEARCH_BACKENDS: Dict[str, Callable[[str, int, Dict], Awaitable[List[Dict]]]] = {
+    'arxiv': _search_backend_arxiv,
+    'crossref': _search_backend_crossref,
+    'local': _search_backend_local,
+}
+
+def _enabled_backends(backends: Optional[List[str]], user_workspace: Optional[str]) -> List[str]:
+    if not backends:
+        backends = os.environ.get("THESIS_SEARCH_BACKENDS", SEARCH_DEFAULT_BACKENDS).split(',')
+    names = []
+    for name in backends:
+        name = name.strip()
+        if name in SEARCH_BACKENDS and name not in names:
+            # 没有工作区时无法定位本地论文库
+            if name == 'local' and not user_workspace:
+                continue
+            names.append(name)
+    return names
+
+def _paper_ids(paper: Dict) -> List[str]:
+    ids = []
+    arxiv_id = normalize_arxiv_id(paper.get('arxiv_id'))
+    if arxiv_id:
+        ids.append(f"arxiv:{arxiv_id}")
+    doi = normalize_doi(paper.get('doi'))
+    if doi:
+        ids.append(f"doi:{doi}")
+    return ids
+
+def merge_ranked_results(ranked_lists: Dict[str, List[Dict]]) -> List[Dict]:
+    """合并各后端的结果：按DOI/arXiv ID去重，再合并标题作者近似相同的记录，
+    用倒数排名融合(RRF)排序，同时出现在多个后端的论文排名靠前"""
+    index = DedupIndex()
+    by_id: Dict[str, int] = {}
+    scores: Dict[int, float] = {}
+    found_in: Dict[int, List[str]] = {}
+    for backend, papers in ranked_lists.items():
+        for rank, paper in enumerate(papers, 1):
+            ids = _paper_ids(paper)
+            position = next((by_id[i] for i in ids if i in by_id), None)
+            if position is None:
+                position = index.add(paper)
+            else:
+                index.records[position] = merge_records(index.records[position], paper)
+            for i in _paper_ids(index.records[position]):
+                by_id.setdefault(i, position)
+            scores[position] = scores.get(position, 0.0) + 1.0 / (RRF_K + rank)
+            backends = found_in.setdefault(position, [])
+            if backend not in backends:
+                backends.append(backend)
+    
+    merged = []
+    for position in sorted(scores, key=lambda p: (-scores[p], p)):
+        paper = dict(index.records[position])
+        paper['found_in'] = found_in[position]
+        paper['score'] = round(scores[position], 6)
+        merged.append(paper)
+    return merged
+
+async def federated_search(query: str, max_results: int = 10, backends: Optional[List[str]] = None,
+                           timeout: Optional[float] = None, options: Optional[Dict] = None) -> Tuple[List[Dict], Dict]:
+    """并发查询所有启用的后端，截止时间到达后取消未完成的后端，返回(合并排序后的结果, 各后端状态)"""
+    options = options or {}
+    if timeout is None:
+        timeout = env_float("THESIS_SEARCH_TIMEOUT", SEARCH_DEFAULT_TIMEOUT)
+    names = _enabled_backends(backends, options.get('user_workspace'))
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    finished_at: Dict[str, float] = {}
+    
+    async def run(name: str) -> List[Dict]:
+        try:
+            return await SEARCH_BACKENDS[name](query, max_results, options)
+        finally:
+            finished_at[name] = loop.time()
+    
+    tasks = {name: asyncio.create_task(run(name)) for name in names}
+    if tasks:
+        await asyncio.wait(tasks.values(), timeout=timeout)
+    
+    ranked_lists: Dict[str, List[Dict]] = {}
+    status: Dict[str, Dict] = {}
+    for name, task in tasks.items():
+        if not task.done():
+            task.cancel()
+            status[name] = {'status': 'timeout', 'elapsed_ms': round(timeout * 1000)}
+            continue
+        elapsed_ms = round((finished_at.get(name, loop.time()) - started) * 1000)
+        if task.exception() is not None:
+            status[name] = {'status': 'error', 'error': str(task.exception()) or type(task.exception()).__name__,
+                            'elapsed_ms': elapsed_ms}
+            continue
+        papers = task.result()[:max_results]
+        ranked_lists[name] = papers
+        status[name] = {'status': 'ok', 'count': len(papers), 'elapsed_ms': elapsed_ms}
+    # 等待被取消的任务收尾，避免遗留未完成的协程
+    pending = [task for task in tasks.values() if task.cancelled() or not task.done()]
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    
+    return merge_ranked_results(ranked_lists)[:max_results], status
+
+def _format_federated_result(i: int, paper: Dict) -> str:
+    year = paper.get('year') or (paper.get('published') or '')[:4] or 'N/A'
+    text = f"{i}. {paper.get('title', '')}\n"
+    text += f"   作者: {', '.join(paper.get('authors', [])[:5])}\n"
+    text += f"   年份: {year}  来源: {', '.join(paper['found_in'])}\n"
+    if paper.get('arxiv_id'):
+        text += f"   arXiv ID: {paper['arxiv_id']}\n"
+    if paper.get('doi'):
+        text += f"   DOI: {paper['doi']}\n"
+    if paper.get('url'):
+        text += f"   链接: {paper['url']}\n"
+    summary = paper.get('summary') or paper.get('abstract')
+    if summary:
+        text += f"   摘要: {summary[:200]}...\n"
+    return text + "\n"
+
+async def search_papers(query: str, max_results: int = 10, backends: Optional[List[str]] = None,
+                        timeout: Optional[float] = None, user_workspace: str = None,
+                        base_path: str = "references", prefetch: Optional[int] = None,
+                        output_format: Optional[str] = None, fields: Optional[List[str]] = None,
+                        abstract_chars: Optional[int] = None) -> List[TextContent]:
+    """同时在arXiv、Crossref和本地论文库中搜索，合并去重后排序"""
+    try:
+        output_format = _output_format(output_format)
+        max_results = max(1, int(max_results))
+        results, status = await federated_search(
+            query, max_results, backends, timeout,
+            {'user_workspace': user_workspace, 'base_path': base_path})
+        if not status:
+            return [TextContent(type="text", text="没有可用的搜索后端")]
+        prefetched = schedule_prefetch(results, prefetch)
+        
+        if output_format == "json":
+            response = {'query': query, 'backends': status,
+                        'results': [compact_record(paper, fields, abstract_chars) for paper in results]}
+            if prefetched:
+                response['prefetched'] = prefetched
+            return _json_content(response)
+        
+        parts = [f"联合搜索结果 (关键词: {query})，共 {len(results)} 篇:\n"]
+        for name, info in status.items():
+            if info['status'] == 'ok':
+                parts.append(f"  {name}: {info['count']} 条, {info['elapsed_ms']} ms\n")
+            elif info['status'] == 'timeout':
+                parts.append(f"  {name}: 超时 (>{info['elapsed_ms']} ms)，已跳过\n")
             else:
-                # 如果没有提供用户工作区，返回错误提示
-                return [TextContent(type="text", text="❌ 错误：相对路径需要提供用户工作区路径参数 user_workspace")]
+                parts.append(f"  {name}: 出错 ({info['error']})\n")
+        if prefetched:
+            parts.append(f"已在后台预取前 {prefetched} 条结果的详情\n")
+        parts.append("\n")
+        for i, paper in enumerate(results, 1):
+            parts.append(_format_federated_result(i, paper))
+        return [TextContent(type="text", text=''.join(parts))]
+    except Exception as e:
+        return [TextContent(type="text", text=f"联合搜索出错: {str(e)}")]
+
+def _resolve_base_path(base_path: str, user_workspace: Optional[str]) -> Optional[str]:
+    """相对路径按用户工作区解析；没有工作区时返回None"""
+    if os.path.isabs(base_path):
+        return base_path
+    if not user_workspace:
+        return None
+    return os.path.join(user_workspace, base_path)
+
+async def save_search_results(results: List[Dict], domain: str, base_path: str = "references",
+                              user_workspace: str = None, export_files: bool = True) -> List[TextContent]:
+    """保存搜索结果到工作区论文库，并可按领域导出带时间戳的文件"""
+    try:
+        # 如果base_path是相对路径，需要用户提供用户工作区路径
+        resolved = _resolve_base_path(base_path, user_workspace)
+        if resolved is None:
+            return [TextContent(type="text", text="❌ 错误：相对路径需要提供用户工作区路径参数 user_workspace")]
+        base_path = resolved
+        
+        # 写入论文库：同一arXiv ID/DOI的论文合并为一条，并打上领域标签
+        library = PaperLibrary.open(base_path)
+        try:
+            saved = library.upsert_all(results, domain)
+            inserted = sum(1 for _, created in saved if created)
+            updated = len(saved) - inserted
+            near_duplicates = library.near_duplicates
+            total = library.count()
+            # 导出文件中库里合并为同一条的结果也合并为一条，使用库中保存的BibTeX键
+            merged: Dict[int, Dict] = {}
+            for (paper_id, _), result in zip(saved, results):
+                merged[paper_id] = merge_records(merged[paper_id], result) if paper_id in merged else result
+            keys = library.citation_keys(merged) if export_files else {}
+        finally:
+            library.close()
+        
+        result_text = f"✅ 已保存 {len(results)} 篇论文到论文库 (新增 {inserted}，合并 {updated}，共 {total} 篇)\n"
+        if near_duplicates:
+            result_text += f"🔁 其中 {near_duplicates} 篇按标题/作者识别为已有论文的其他版本并合并\n"
+        result_text += f"📚 论文库: {os.path.abspath(os.path.join(base_path, LIBRARY_FILE_NAME))}\n"
+        result_text += f"🏷️ 领域: {domain}"
+        if not export_files:
+            return [TextContent(type="text", text=result_text)]
+        
+        records = [ExportRecord.from_paper(paper, keys[paper_id]) for paper_id, paper in merged.items()]
         
         # 构建完整的保存路径：references/领域/
         save_path = os.path.join(base_path, domain)
@@ -392,47 +1843,29 @@ async def save_search_results(results: List[Dict], domain: str, base_path: str =
         # 保存JSON文件
         json_file = os.path.join(save_path, f"papers_{timestamp}.json")
         with open(json_file, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+            write_records(records, f, "json")
+        # 这些论文已经在库中，本地检索时不必再导入这个文件
+        library = PaperLibrary.open(base_path)
+        try:
+            library.mark_imported(json_file)
+        finally:
+            library.close()
         
-        # 生成简化的BibTeX文件
+        # 生成BibTeX文件
         bibtex_file = os.path.join(save_path, f"papers_{timestamp}.bib")
-        bibtex_entries = []
-        for i, result in enumerate(results, 1):
-            if result.get('source') == 'arxiv':
-                key = f"paper_{i}"
-                bibtex = f"""@article{{{key},
-    title={{{result['title']}}},
-    author={{{' and '.join(result['authors'])}}},
-    journal={{arXiv preprint arXiv:{result['arxiv_id']}}},
-    year={{{result['published'][:4]}}},
-    url={{{result['url']}}}
-}}"""
-            else:
-                key = f"paper_{i}"
-                bibtex = f"""@article{{{key},
-    title={{{result['title']}}},
-    author={{{' and '.join(result['authors'])}}},
-    journal={{Unknown}},
-    year={{{result.get('year', 'N/A')}}},
-    url={{{result['url']}}}
-}}"""
-            bibtex_entries.append(bibtex)
-        
         with open(bibtex_file, "w", encoding="utf-8") as f:
-            f.write('\n\n'.join(bibtex_entries))
+            write_records(records, f, "bibtex")
         
         # 生成领域信息文件
         domain_info_file = os.path.join(save_path, f"domain_info_{timestamp}.txt")
         with open(domain_info_file, "w", encoding="utf-8") as f:
             f.write(f"研究领域: {domain}\n")
-            f.write(f"论文数量: {len(results)}\n")
+            f.write(f"论文数量: {len(records)}\n")
             f.write(f"保存时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
             f.write(f"搜索关键词: {', '.join(set([r.get('query', 'N/A') for r in results if 'query' in r]))}\n")
         
         # 返回简洁的结果
-        result_text = f"✅ 已保存 {len(results)} 篇论文到:\n"
-        result_text += f"📁 目录: {os.path.abspath(save_path)}\n"
-        result_text += f"🏷️ 领域: {domain}\n"
+        result_text += f"\n📁 目录: {os.path.abspath(save_path)}\n"
         result_text += f"📄 JSON: {os.path.basename(json_file)}\n"
         result_text += f"📄 BibTeX: {os.path.basename(bibtex_file)}\n"
         result_text += f"📄 领域信息: {os.path.basename(domain_info_file)}"
@@ -442,42 +1875,191 @@ async def save_search_results(results: List[Dict], domain: str, base_path: str =
     except Exception as e:
         return [TextContent(type="text", text=f"❌ 保存失败: {str(e)}")]
 
-async def analyze_citations(tex_file: str) -> List[TextContent]:
-    """分析论文中使用的引用，找出未使用的参考文献"""
-    
+def _open_library(base_path: str, user_workspace: Optional[str]) -> Optional[PaperLibrary]:
+    resolved = _resolve_base_path(base_path, user_workspace)
+    if resolved is None:
+        return None
+    return PaperLibrary.open(resolved)
+
+def _format_library_paper(i: int, paper: Dict) -> str:
+    identifier = paper.get('arxiv_id') or paper.get('doi') or 'N/A'
+    year = paper.get('year') or (paper.get('published') or '')[:4] or 'N/A'
+    text = f"{i}. **{paper.get('title', '')}**\n"
+    text += f"   作者: {', '.join(paper.get('authors', [])[:3])}\n"
+    text += f"   年份: {year}  ID: {identifier}\n"
+    text += f"   领域: {', '.join(paper.get('domains', [])) or '无'}\n"
+    if paper.get('url'):
+        text += f"   链接: {paper['url']}\n"
+    return text + "\n"
+
+async def search_local_library(query: str, domain: Optional[str] = None, limit: int = 20,
+                               base_path: str = "references", user_workspace: str = None,
+                               output_format: Optional[str] = None, fields: Optional[List[str]] = None,
+                               abstract_chars: Optional[int] = None) -> List[TextContent]:
+    """离线检索已保存的论文：倒排索引 + BM25排序，支持中英文混合查询"""
+    try:
+        output_format = _output_format(output_format)
+        library = _open_library(base_path, user_workspace)
+        if library is None:
+            return [TextContent(type="text", text="❌ 错误：相对路径需要提供用户工作区路径参数 user_workspace")]
+        try:
+            # 并入之前按领域导出的 papers_*.json（只处理新增或修改过的文件）
+            library_base = os.path.dirname(library.path)
+            imported = library.import_exports(library_base)
+            start = time.perf_counter()
+            ranked = library.bm25_search(query, domain, limit)
+            elapsed = (time.perf_counter() - start) * 1000
+            total = library.count()
+        finally:
+            library.close()
+        
+        if output_format == "json":
+            response = {'query': query, 'total': total, 'elapsed_ms': round(elapsed, 1),
+                        'results': [compact_record({**paper, 'score': round(score, 3)}, fields, abstract_chars)
+                                    for score, paper in ranked]}
+            if imported:
+                response['imported'] = imported
+            return _json_content(response)
+        
+        result_text = f"本地论文库 ({total} 篇) 中检索 \"{query}\"，匹配 {len(ranked)} 篇，用时 {elapsed:.1f} ms\n"
+        if imported:
+            result_text += f"已从 {library_base} 下的导出文件并入 {imported} 条记录\n"
+        result_text += "\n"
+        for i, (score, paper) in enumerate(ranked, 1):
+            result_text += _format_library_paper(i, paper).rstrip("\n") + f"\n   得分: {score:.3f}\n\n"
+        return [TextContent(type="text", text=result_text)]
+    except Exception as e:
+        return [TextContent(type="text", text=f"本地检索出错: {str(e)}")]
+
+async def query_library(query: str = "", domain: Optional[str] = None, limit: int = 20,
+                        base_path: str = "references", user_workspace: str = None,
+                        output_format: Optional[str] = None, fields: Optional[List[str]] = None,
+                        abstract_chars: Optional[int] = None) -> List[TextContent]:
+    """在工作区论文库中按标题、作者、摘要全文检索"""
     try:
-        # 读取文件
-        with open(tex_file, 'r', encoding='utf-8') as f:
-            content = f.read()
+        output_format = _output_format(output_format)
+        library = _open_library(base_path, user_workspace)
+        if library is None:
+            return [TextContent(type="text", text="❌ 错误：相对路径需要提供用户工作区路径参数 user_workspace")]
+        try:
+            papers = library.search(query, domain, limit)
+            total = library.count()
+            domains = library.domains()
+        finally:
+            library.close()
+        
+        if output_format == "json":
+            return _json_content({'query': query, 'total': total, 'domains': domains,
+                                  'results': [compact_record(paper, fields, abstract_chars) for paper in papers]})
         
-        # 找出所有使用的引用
-        used_citations = set()
-        cite_pattern = r'\\cite\{([^}]+)\}'
-        matches = re.findall(cite_pattern, content)
+        result_text = f"论文库共 {total} 篇论文"
+        if domains:
+            result_text += "，领域: " + ", ".join(f"{name}({count})" for name, count in domains.items())
+        result_text += f"\n匹配 {len(papers)} 篇:\n\n"
+        for i, paper in enumerate(papers, 1):
+            result_text += _format_library_paper(i, paper)
+        return [TextContent(type="text", text=result_text)]
+    except Exception as e:
+        return [TextContent(type="text", text=f"查询论文库出错: {str(e)}")]
+
+async def export_library(output_file: str, format: str = "json", query: str = "", domain: Optional[str] = None,
+                         base_path: str = "references", user_workspace: str = None) -> List[TextContent]:
+    """把论文库（或检索/领域过滤后的部分）导出为JSON、BibTeX、CSL-JSON或Markdown文件"""
+    try:
+        if format not in EXPORT_FORMATS:
+            return [TextContent(type="text", text=f"不支持的导出格式: {format}，可选 {'、'.join(EXPORT_FORMATS)}")]
+        library = _open_library(base_path, user_workspace)
+        if library is None:
+            return [TextContent(type="text", text="❌ 错误：相对路径需要提供用户工作区路径参数 user_workspace")]
+        if not os.path.isabs(output_file) and user_workspace:
+            output_file = os.path.join(user_workspace, output_file)
+        directory = os.path.dirname(output_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
         
-        for match in matches:
-            # 处理多个引用的情况，如 \cite{key1,key2}
-            citations = [c.strip() for c in match.split(',')]
-            used_citations.update(citations)
+        try:
+            # 合并库中残留的近似重复（如去重功能上线前保存的记录）
+            dedup = DedupIndex()
+            for paper in library.iter_papers(query, domain):
+                dedup.add(paper)
+            # 键保存在库中，同一篇论文每次导出的键相同
+            keys = library.citation_keys({paper['library_id']: paper for paper in dedup.records})
+        finally:
+            library.close()
         
-        # 找出所有定义的参考文献
-        defined_citations = set()
-        bibitem_pattern = r'\\bibitem\{([^}]+)\}'
-        bibitem_matches = re.findall(bibitem_pattern, content)
-        defined_citations.update(bibitem_matches)
+        records = (ExportRecord.from_paper(paper, keys[paper['library_id']]) for paper in dedup.records)
+        with open(output_file, "w", encoding="utf-8") as f:
+            count = write_records(records, f, format)
         
-        # 找出未使用的参考文献
-        unused_citations = defined_citations - used_citations
+        result_text = f"✅ 已导出 {count} 篇论文到 {os.path.abspath(output_file)} ({format})"
+        if dedup.merged:
+            result_text += f"，合并了 {dedup.merged} 条近似重复记录"
+        return [TextContent(type="text", text=result_text)]
+    except Exception as e:
+        return [TextContent(type="text", text=f"导出论文库出错: {str(e)}")]
+
+def _collect_citations(tex_file: str) -> Dict:
+    """读取论文的所有源文件和.bib数据库，统计引用情况（分析和清理工具共用）"""
+    cache = open_index_cache(tex_file)
+    files, missing = load_thesis(tex_file, cache)
+    index = CitationIndex.merge([f.index for f in files])
+    bib_paths, missing_bibs = resolve_bib_resources(files)
+    databases = [load_bib_database(path) for path in bib_paths]
+    
+    used = set(index.used_keys())
+    defined = set(index.defined_keys())
+    for database in databases:
+        defined.update(database.keys())
+    
+    # 被引用条目通过crossref依赖的父条目也算作已使用
+    for database in databases:
+        for key in used & set(database.by_key):
+            parent = database.crossref(key)
+            if parent:
+                used.add(parent)
+    
+    # 存在\nocite{*}时全部视为已使用
+    unused = set() if index.cites_all() else defined - used
+    
+    return {
+        'cache': cache,
+        'files': files,
+        'missing': missing + missing_bibs,
+        'index': index,
+        'databases': databases,
+        'used': set(index.used_keys()),
+        'defined': defined,
+        'unused': unused,
+        'undefined': set(index.undefined_keys()) - defined,
+    }
+
+async def analyze_citations(tex_file: str) -> List[TextContent]:
+    """分析论文中使用的引用，找出未使用的参考文献
+
+    从主文件开始追踪\\input/\\include引入的章节，未修改过的章节直接使用缓存的索引；
+    参考文献既可以是thebibliography中的\\bibitem，也可以是\\bibliography/\\addbibresource指定的.bib数据库。
+    """
+    
+    try:
+        # 读取论文的所有源文件和.bib数据库
+        state = _collect_citations(tex_file)
+        cache = state['cache']
+        cache.save()
         
-        # 找出使用但未定义的引用
-        undefined_citations = used_citations - defined_citations
+        used_citations = state['used']
+        defined_citations = state['defined']
+        unused_citations = state['unused']
+        undefined_citations = state['undefined']
         
         result = f"""引用分析结果:
 
+源文件数量: {len(state['files'])} (重新扫描 {cache.scanned} 个，使用缓存 {cache.reused} 个)
+BibTeX数据库: {len(state['databases'])} 个，共 {sum(len(db.entries) for db in state['databases'])} 条
 使用的引用数量: {len(used_citations)}
 定义的参考文献数量: {len(defined_citations)}
 未使用的参考文献数量: {len(unused_citations)}
 使用但未定义的引用数量: {len(undefined_citations)}
+引用命令出现次数: {len(state['index'].cites)}
 
 使用的引用:
 {', '.join(sorted(used_citations))}
@@ -488,56 +2070,53 @@ async def analyze_citations(tex_file: str) -> List[TextContent]:
 使用但未定义的引用:
 {', '.join(sorted(undefined_citations)) if undefined_citations else '无'}"""
         
+        if state['missing']:
+            result += f"\n\n未找到的引入文件:\n{', '.join(state['missing'])}"
+        
         return [TextContent(type="text", text=result)]
         
     except Exception as e:
         return [TextContent(type="text", text=f"分析引用时出错: {str(e)}")]
 
 async def clean_unused_references(tex_file: str) -> List[TextContent]:
-    """删除未使用的参考文献"""
+    """删除未使用的参考文献（thebibliography中的\\bibitem和.bib数据库中的条目）"""
     
     try:
-        # 读取文件
-        with open(tex_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 找出所有使用的引用
-        used_citations = set()
-        cite_pattern = r'\\cite\{([^}]+)\}'
-        matches = re.findall(cite_pattern, content)
-        
-        for match in matches:
-            citations = [c.strip() for c in match.split(',')]
-            used_citations.update(citations)
-        
-        # 找出所有定义的参考文献
-        defined_citations = set()
-        bibitem_pattern = r'\\bibitem\{([^}]+)\}'
-        bibitem_matches = re.findall(bibitem_pattern, content)
-        defined_citations.update(bibitem_matches)
-        
-        # 找出未使用的参考文献
-        unused_citations = defined_citations - used_citations
-        
-        # 删除未使用的参考文献
-        deleted_count = 0
-        for citation in unused_citations:
-            # 找到对应的bibitem并删除
-            pattern = rf'\\bibitem\{{{citation}\}}.*?(?=\\bibitem\{{|\\end\{{thebibliography\}}|$)'
-            new_content = re.sub(pattern, '', content, flags=re.DOTALL)
-            if new_content != content:
-                content = new_content
-                deleted_count += 1
-        
-        # 清理多余的空行
-        content = re.sub(r'\n\s*\n\s*\n', '\n\n', content)
-        
-        # 写回文件
-        with open(tex_file, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        result = f"成功删除 {deleted_count} 个未使用的参考文献\n"
+        # 读取论文的所有源文件和.bib数据库
+        state = _collect_citations(tex_file)
+        cache = state['cache']
+        unused_citations = state['unused']
+        
+        # 只改写包含待删除条目的文件，每个文件按bibitem范围一次性重建
+        deleted = set()
+        for thesis_file in state['files']:
+            if not any(item.key in unused_citations for item in thesis_file.index.bibitems):
+                continue
+            content = read_tex(thesis_file.path)
+            content, removed = remove_bibitems(content, thesis_file.index, unused_citations)
+            deleted.update(removed)
+            
+            # 清理多余的空行（保持文件原有的换行符）
+            newline = '\r\n' if '\r\n' in content else '\n'
+            content = re.sub(r'\r?\n\s*\n\s*\n', newline * 2, content)
+            
+            # 写回文件
+            write_tex(thesis_file.path, content)
+            cache.update(thesis_file.path, content)
+        cache.save()
+        
+        # .bib数据库按条目字节范围一次性重写
+        bib_changes = []
+        for database in state['databases']:
+            removed = rewrite_without(database, unused_citations)
+            if removed:
+                deleted.update(removed)
+                bib_changes.append(f"{os.path.basename(database.path)}: {len(removed)} 条")
+        
+        result = f"成功删除 {len(deleted)} 个未使用的参考文献\n"
         result += f"删除的参考文献: {', '.join(sorted(unused_citations))}"
+        if bib_changes:
+            result += f"\n已重写的BibTeX数据库: {', '.join(bib_changes)}"
         
         return [TextContent(type="text", text=result)]
         
@@ -566,42 +2145,55 @@ async def save_references(output_dir: str = "references") -> List[TextContent]:
         return [TextContent(type="text", text=f"保存参考文献时出错: {str(e)}")]
 
 async def convert_citations_to_superscript(tex_file: str) -> List[TextContent]:
-    """将LaTeX中的\\cite引用转换为上标格式"""
+    """将LaTeX中的\\cite引用转换为上标格式
+
+    只转换输出编号的引用命令（\\cite、\\citep等）；\\citet、\\nocite等
+    以及带页码等可选参数的引用保持原样，避免丢失文字内容。
+    编号按整篇论文（含\\input/\\include的章节）的排版顺序分配。
+    """
     try:
-        # 读取文件
-        with open(tex_file, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # 读取论文的所有源文件并建立引用索引
+        cache = open_index_cache(tex_file)
+        files, _ = load_thesis(tex_file, cache)
+        ordered = document_order_cites(files)
         
-        # 创建引用映射
+        # 创建引用映射（按首次出现顺序编号）
         citation_map = {}
-        citation_counter = 1
-        
-        # 找出所有使用的引用
-        cite_pattern = r'\\cite\{([^}]+)\}'
-        matches = re.findall(cite_pattern, content)
-        
-        for match in matches:
-            citations = [c.strip() for c in match.split(',')]
-            for citation in citations:
+        converted: Dict[str, List] = {}
+        for path, cite in ordered:
+            if cite.command.rstrip('*') not in NUMERIC_CITE_COMMANDS or cite.options:
+                continue
+            converted.setdefault(path, []).append(cite)
+            for citation in cite.keys:
                 if citation not in citation_map:
-                    citation_map[citation] = citation_counter
-                    citation_counter += 1
+                    citation_map[citation] = len(citation_map) + 1
         
-        # 替换引用为上标格式
-        def replace_cite(match):
-            citations = [c.strip() for c in match.group(1).split(',')]
-            superscripts = [str(citation_map[c]) for c in citations]
-            return f"$^{{{','.join(superscripts)}}}$"
-        
-        new_content = re.sub(cite_pattern, replace_cite, content)
-        
-        # 写回文件
-        with open(tex_file, 'w', encoding='utf-8') as f:
-            f.write(new_content)
+        # 每个文件按索引中的位置拼接新内容，一次完成替换
+        for path, cites in converted.items():
+            content = read_tex(path)
+            parts = []
+            last = 0
+            for cite in sorted(cites, key=lambda c: c.start):
+                superscripts = [str(citation_map[c]) for c in cite.keys]
+                parts.append(content[last:cite.start])
+                parts.append(f"$^{{{','.join(superscripts)}}}$")
+                last = cite.end
+            parts.append(content[last:])
+            new_content = ''.join(parts)
+            
+            # 写回文件
+            write_tex(path, new_content)
+            cache.update(path, new_content)
+        cache.save()
         
+        skipped = len(ordered) - sum(len(cites) for cites in converted.values())
         result = f"成功转换 {len(citation_map)} 个引用为上标格式\n"
         result += f"转换的引用: {', '.join(sorted(citation_map.keys()))}\n"
         result += f"引用映射: {dict(citation_map)}"
+        if len(converted) > 1:
+            result += f"\n涉及文件: {len(converted)} 个"
+        if skipped:
+            result += f"\n保持原样的引用命令: {skipped} 处（\\citet/\\nocite等或带可选参数）"
         
         return [TextContent(type="text", text=result)]
         
@@ -613,7 +2205,10 @@ if __name__ == "__main__":
     import asyncio
     
     async def main():
-        async with stdio_server() as (read_stream, write_stream):
-            await server.run(read_stream, write_stream, server.create_initialization_options())
+        try:
+            async with stdio_server() as (read_stream, write_stream):
+                await server.run(read_stream, write_stream, server.create_initialization_options())
+        finally:
+            await close_http_client()
     
     asyncio.run(main())